@@ -1,3 +1,6 @@
+from api.json_provider import init_json
+from api.recorder import init_recorder
 from api.routes import register_routes
+from api.storage import init_storage
 
-__all__ = ["register_routes"]
+__all__ = ["init_json", "init_recorder", "init_storage", "register_routes"]
@@ -0,0 +1,114 @@
+import array
+import struct
+import sys
+
+from flask import current_app
+
+SIM_BINARY_MIMETYPE = "application/vnd.ellabb.sim+binary"
+MAGIC = b"ELSB"
+BOOL_MAPS = ("lampLit", "motorRunning", "contactorStates")
+
+
+# The client opts in with "Accept: application/vnd.ellabb.sim+binary" and may
+# add "; precision=32" for float32 voltages. JSON stays the default, also for
+# errors.
+def binary_precision(accept):
+    json_quality = accept["application/json"]
+    for value, quality in accept:
+        mimetype, _, params = value.partition(";")
+        if mimetype.strip() != SIM_BINARY_MIMETYPE or quality <= 0 or quality < json_quality:
+            continue
+        for param in params.split(";"):
+            key, _, setting = param.partition("=")
+            if key.strip() == "precision" and setting.strip() == "32":
+                return 32
+        return 64
+    return None
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+class _Sections:
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def add(self, data):
+        offset = self.size
+        self.chunks.append(data)
+        self.size += len(data)
+        padding = _align(self.size) - self.size
+        if padding:
+            self.chunks.append(bytes(padding))
+            self.size += padding
+        return offset
+
+    def floats(self, values, precision):
+        typecode = "f" if precision == 32 else "d"
+        packed = array.array(typecode, values)
+        if sys.byteorder == "big":
+            packed.byteswap()
+        return {"offset": self.add(packed.tobytes()), "length": len(packed), "type": f"f{precision}"}
+
+    def bits(self, flags):
+        packed = bytearray((len(flags) + 7) // 8)
+        for idx, flag in enumerate(flags):
+            if flag:
+                packed[idx >> 3] |= 1 << (idx & 7)
+        return self.add(bytes(packed))
+
+
+# Frame: "ELSB", uint32 LE header length, JSON header, zero padding to 8
+# bytes, then the data sections. Section offsets in header["binary"] are
+# relative to the padded data start and 8-byte aligned, so the client can
+# wrap them in typed-array views without copying. Boolean maps become two
+# bitsets (key present, value) indexed by the component order of the request;
+# PLC outputs are one bitset with a per-PLC bit count.
+def encode_simulation(body, components, precision=64):
+    index = {comp.get("id"): idx for idx, comp in enumerate(components)}
+    count = len(components)
+    sections = _Sections()
+    header = {key: value for key, value in body.items() if key not in BOOL_MAPS and key != "plcStates"}
+    solution = {key: value for key, value in body["solution"].items() if key not in ("nodeVoltages", "acNodeVoltages")}
+    header["solution"] = solution
+    ac = body["solution"].get("acNodeVoltages") or {"re": [], "im": []}
+    layout = {
+        "components": count,
+        "nodeVoltages": sections.floats(body["solution"].get("nodeVoltages") or [], precision),
+        "acNodeVoltages": {
+            "re": sections.floats(ac["re"], precision),
+            "im": sections.floats(ac["im"], precision),
+        },
+    }
+    for name in BOOL_MAPS:
+        present = [False] * count
+        values = [False] * count
+        for comp_id, flag in (body.get(name) or {}).items():
+            idx = index.get(comp_id)
+            if idx is not None:
+                present[idx] = True
+                values[idx] = bool(flag)
+        layout[name] = {"present": sections.bits(present), "values": sections.bits(values)}
+    plc_indexes = []
+    plc_counts = []
+    plc_bits = []
+    for comp_id, outputs in (body.get("plcStates") or {}).items():
+        idx = index.get(comp_id)
+        if idx is None:
+            continue
+        plc_indexes.append(idx)
+        plc_counts.append(len(outputs))
+        plc_bits.extend(bool(flag) for flag in outputs)
+    layout["plcStates"] = {"components": plc_indexes, "counts": plc_counts, "offset": sections.bits(plc_bits)}
+    header["binary"] = layout
+
+    encoded = current_app.json.dumps(header).encode("utf-8")
+    prefix = MAGIC + struct.pack("<I", len(encoded)) + encoded
+    prefix += bytes(_align(len(prefix)) - len(prefix))
+    return prefix + b"".join(sections.chunks)
+
+
+def binary_response(body, components, precision):
+    return current_app.response_class(encode_simulation(body, components, precision), mimetype=SIM_BINARY_MIMETYPE)
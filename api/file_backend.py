@@ -0,0 +1,379 @@
+import bisect
+import gzip
+import json
+import os
+import threading
+import uuid
+
+from api.history import version_summary
+
+INDEX_FILE = "index.json"
+JOURNAL_FILE = "index.journal"
+JOURNAL_MIN_LINES = 1000
+HISTORY_DIR = "history"
+COMPRESSED_SUFFIX = ".json.gz"
+COMPACT_SEPARATORS = (",", ":")
+
+
+def _open_text(path, mode):
+    if path.name.endswith(COMPRESSED_SUFFIX):
+        return gzip.open(path, mode + "t", encoding="utf-8", compresslevel=6)
+    return path.open(mode, encoding="utf-8")
+
+
+def _load_save(path):
+    try:
+        with _open_text(path, "r") as handle:
+            return json.load(handle)
+    except (OSError, EOFError, json.JSONDecodeError):
+        return None
+
+
+def _write_json_atomic(path, data, **kwargs):
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        if path.name.endswith(COMPRESSED_SUFFIX):
+            with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as handle:
+                json.dump(data, handle, **kwargs)
+        else:
+            with tmp_path.open("w", encoding="utf-8") as handle:
+                json.dump(data, handle, **kwargs)
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def _save_id_from_path(path):
+    return path.name.split(".", 1)[0]
+
+
+def _catalog_entry(data, path):
+    entry = {
+        "id": data.get("id", _save_id_from_path(path)),
+        "name": data.get("name", _save_id_from_path(path)),
+        "updatedAt": data.get("updatedAt", 0),
+    }
+    if "createdAt" in data:
+        entry["createdAt"] = data["createdAt"]
+    return entry
+
+
+def _index_mtime(index_path):
+    try:
+        return index_path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+def _file_size(path):
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
+
+
+def _order_key(entry):
+    return (-entry["updatedAt"], entry["id"])
+
+
+def _trigrams(text):
+    return {text[idx : idx + 3] for idx in range(len(text) - 2)}
+
+
+def _grams(text):
+    return {text[idx : idx + size] for size in (1, 2, 3) for idx in range(len(text) - size + 1)}
+
+
+def _remove_sorted(items, item):
+    idx = bisect.bisect_left(items, item)
+    if idx < len(items) and items[idx] == item:
+        del items[idx]
+
+
+# Besides the id and name maps the catalog keeps three search indexes: saves
+# ordered newest first, casefolded names in sorted order for prefix lookups,
+# and a map from every substring of up to three characters of the casefolded
+# names for substring lookups. Queries of up to three characters are a single
+# lookup; longer ones intersect their trigrams.
+class _Catalog:
+    def __init__(self, entries, mtime):
+        self.entries = entries
+        self.mtime = mtime
+        self.journal_offset = 0
+        self.journal_lines = 0
+        self.by_name = {}
+        self.order = sorted(_order_key(entry) for entry in entries.values())
+        self.names = sorted((entry["name"].casefold(), entry["id"]) for entry in entries.values())
+        self.grams = {}
+        for entry in sorted(entries.values(), key=lambda item: item["updatedAt"]):
+            self.by_name[entry["name"]] = entry["id"]
+            self._index_name(entry, self._add_gram)
+
+    def _add_gram(self, gram, save_id):
+        self.grams.setdefault(gram, set()).add(save_id)
+
+    def _drop_gram(self, gram, save_id):
+        ids = self.grams.get(gram)
+        if ids is not None:
+            ids.discard(save_id)
+            if not ids:
+                del self.grams[gram]
+
+    def _index_name(self, entry, action):
+        for gram in _grams(entry["name"].casefold()):
+            action(gram, entry["id"])
+
+    def _unindex(self, previous):
+        if self.by_name.get(previous["name"]) == previous["id"]:
+            del self.by_name[previous["name"]]
+        _remove_sorted(self.order, _order_key(previous))
+        _remove_sorted(self.names, (previous["name"].casefold(), previous["id"]))
+        self._index_name(previous, self._drop_gram)
+
+    def put(self, entry):
+        previous = self.entries.get(entry["id"])
+        if previous:
+            self._unindex(previous)
+        self.entries[entry["id"]] = entry
+        self.by_name[entry["name"]] = entry["id"]
+        bisect.insort(self.order, _order_key(entry))
+        bisect.insort(self.names, (entry["name"].casefold(), entry["id"]))
+        self._index_name(entry, self._add_gram)
+
+    def remove(self, save_id):
+        previous = self.entries.pop(save_id, None)
+        if previous:
+            self._unindex(previous)
+
+    def apply(self, change):
+        if "remove" in change:
+            self.remove(change["remove"])
+        else:
+            self.put(change["put"])
+
+    def _candidates(self, query, match):
+        if match == "prefix":
+            start = bisect.bisect_left(self.names, (query,))
+            ids = []
+            for name, save_id in self.names[start:]:
+                if not name.startswith(query):
+                    break
+                ids.append(save_id)
+            return ids
+        if len(query) <= 3:
+            return list(self.grams.get(query, ()))
+        postings = sorted((self.grams.get(trigram, set()) for trigram in _trigrams(query)), key=len)
+        ids = set(postings[0])
+        for matches in postings[1:]:
+            if not ids:
+                break
+            ids &= matches
+        return [save_id for save_id in ids if query in self.entries[save_id]["name"].casefold()]
+
+    def query(self, query, match, after, limit):
+        if query:
+            keys = sorted(_order_key(self.entries[save_id]) for save_id in self._candidates(query.casefold(), match))
+        else:
+            keys = self.order
+        start = bisect.bisect_right(keys, after) if after else 0
+        stop = None if limit is None else start + limit
+        return [self.entries[save_id] for _, save_id in keys[start:stop]]
+
+
+class FileBackend:
+    def __init__(self, saves_dir, compress=True):
+        self.saves_dir = saves_dir
+        self.compress = compress
+        self.saves_dir.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.RLock()
+        self.catalog = None
+        self.summaries = {}
+
+    def init(self):
+        if not (self.saves_dir / INDEX_FILE).exists():
+            self.rebuild_index()
+
+    def _paths(self, save_id):
+        return [self.saves_dir / f"{save_id}{COMPRESSED_SUFFIX}", self.saves_dir / f"{save_id}.json"]
+
+    def _path(self, save_id):
+        for path in self._paths(save_id):
+            if path.exists():
+                return path
+        return None
+
+    def _scan(self):
+        entries = {}
+        paths = list(self.saves_dir.glob("*.json")) + list(self.saves_dir.glob(f"*{COMPRESSED_SUFFIX}"))
+        for path in sorted(paths, key=lambda item: item.name.endswith(COMPRESSED_SUFFIX)):
+            if path.name == INDEX_FILE:
+                continue
+            data = _load_save(path)
+            if not data:
+                continue
+            entry = _catalog_entry(data, path)
+            entries[entry["id"]] = entry
+        return entries
+
+    def _write_catalog(self):
+        index_path = self.saves_dir / INDEX_FILE
+        _write_json_atomic(
+            index_path,
+            {"version": 1, "saves": list(self.catalog.entries.values())},
+            ensure_ascii=True,
+            separators=COMPACT_SEPARATORS,
+        )
+        (self.saves_dir / JOURNAL_FILE).write_bytes(b"")
+        self.catalog.mtime = _index_mtime(index_path)
+        self.catalog.journal_offset = 0
+        self.catalog.journal_lines = 0
+
+    def _replay_journal(self, catalog):
+        journal_path = self.saves_dir / JOURNAL_FILE
+        if _file_size(journal_path) <= catalog.journal_offset:
+            return
+        with journal_path.open("rb") as handle:
+            handle.seek(catalog.journal_offset)
+            data = handle.read()
+        # A line another process is still writing is picked up on the next read.
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                catalog.apply(json.loads(line))
+            except (json.JSONDecodeError, KeyError, TypeError):
+                continue
+            catalog.journal_lines += 1
+        catalog.journal_offset += end
+
+    # Each write appends one line to the journal instead of rewriting the
+    # whole index. The journal is folded back into index.json once it has as
+    # many lines as the catalog has saves, which keeps the cost per write
+    # constant on average.
+    def _journal(self, change):
+        catalog = self._get_catalog()
+        catalog.apply(change)
+        line = (json.dumps(change, ensure_ascii=True, separators=COMPACT_SEPARATORS) + "\n").encode("ascii")
+        with (self.saves_dir / JOURNAL_FILE).open("ab") as handle:
+            handle.write(line)
+            end = handle.tell()
+        # If another process appended first, the offset stays put and the next
+        # read replays both lines in file order.
+        if end == catalog.journal_offset + len(line):
+            catalog.journal_offset = end
+            catalog.journal_lines += 1
+        if catalog.journal_lines >= max(JOURNAL_MIN_LINES, len(catalog.entries)):
+            self._write_catalog()
+
+    def rebuild_index(self):
+        with self.lock:
+            self.catalog = _Catalog(self._scan(), None)
+            self._write_catalog()
+            return self.catalog
+
+    def _get_catalog(self):
+        index_path = self.saves_dir / INDEX_FILE
+        with self.lock:
+            mtime = _index_mtime(index_path)
+            catalog = self.catalog
+            if (
+                catalog is None
+                or catalog.mtime != mtime
+                or _file_size(self.saves_dir / JOURNAL_FILE) < catalog.journal_offset
+            ):
+                if mtime is None:
+                    return self.rebuild_index()
+                data = _load_save(index_path)
+                if not data or not isinstance(data.get("saves"), list):
+                    return self.rebuild_index()
+                catalog = self.catalog = _Catalog({entry["id"]: entry for entry in data["saves"]}, mtime)
+            self._replay_journal(catalog)
+            return catalog
+
+    def query_saves(self, query=None, match="contains", after=None, limit=None):
+        with self.lock:
+            entries = self._get_catalog().query(query, match, after, limit)
+        return [{"id": entry["id"], "name": entry["name"], "updatedAt": entry["updatedAt"]} for entry in entries]
+
+    def find_by_name(self, name):
+        catalog = self._get_catalog()
+        save_id = catalog.by_name.get(name)
+        return catalog.entries.get(save_id) if save_id else None
+
+    def get_entry(self, save_id):
+        return self._get_catalog().entries.get(save_id)
+
+    def load_record(self, save_id):
+        path = self._path(save_id)
+        return _load_save(path) if path else None
+
+    # Saves are rewritten in the format they already have, so plain .json labs
+    # kept in git are never swapped for .json.gz; compress only picks the
+    # format of new saves.
+    def write_record(self, record):
+        with self.lock:
+            compressed_path, plain_path = self._paths(record["id"])
+            path = self._path(record["id"]) or (compressed_path if self.compress else plain_path)
+            if path == compressed_path:
+                _write_json_atomic(path, record, ensure_ascii=False, separators=COMPACT_SEPARATORS)
+            else:
+                _write_json_atomic(path, record, ensure_ascii=True, indent=2)
+            self._journal({"put": _catalog_entry(record, path)})
+
+    def _history_path(self, save_id):
+        return self.saves_dir / HISTORY_DIR / f"{save_id}.jsonl.gz"
+
+    def load_versions(self, save_id):
+        path = self._history_path(save_id)
+        versions = []
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as handle:
+                for line in handle:
+                    versions.append(json.loads(line))
+        except FileNotFoundError:
+            return []
+        except (OSError, EOFError, json.JSONDecodeError):
+            pass
+        return versions
+
+    def version_summaries(self, save_id):
+        path = self._history_path(save_id)
+        try:
+            stat = path.stat()
+            key = (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            return []
+        cached = self.summaries.get(save_id)
+        if cached and cached[0] == key:
+            return cached[1]
+        summaries = [version_summary(record) for record in self.load_versions(save_id)]
+        self.summaries[save_id] = (key, summaries)
+        return summaries
+
+    def append_version(self, save_id, record):
+        path = self._history_path(save_id)
+        with self.lock:
+            summaries = self.version_summaries(save_id)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with gzip.open(path, "at", encoding="utf-8", compresslevel=6) as handle:
+                handle.write(json.dumps(record, ensure_ascii=False, separators=COMPACT_SEPARATORS) + "\n")
+            stat = path.stat()
+            self.summaries[save_id] = ((stat.st_size, stat.st_mtime_ns), summaries + [version_summary(record)])
+
+    def delete(self, save_id):
+        history_path = self._history_path(save_id)
+        if history_path.exists():
+            with self.lock:
+                history_path.unlink()
+                self.summaries.pop(save_id, None)
+        paths = [path for path in self._paths(save_id) if path.exists()]
+        if not paths:
+            return False
+        with self.lock:
+            try:
+                for path in paths:
+                    path.unlink()
+            except OSError:
+                return None
+            self._journal({"remove": save_id})
+        return True
@@ -0,0 +1,153 @@
+import hashlib
+import json
+
+CHECKPOINT_INTERVAL = 20
+KEYED_LISTS = ("components", "wires", "meters")
+
+
+def snapshot_hash(snapshot):
+    canonical = json.dumps(snapshot, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _keyed(items):
+    if not isinstance(items, list):
+        return None
+    keyed = {}
+    for item in items:
+        if not isinstance(item, dict) or "id" not in item or item["id"] in keyed:
+            return None
+        keyed[item["id"]] = item
+    return keyed
+
+
+def _apply_list_diff(items, diff):
+    removed = set(diff.get("removed", []))
+    changed = {item["id"]: item for item in diff.get("changed", [])}
+    result = [changed.get(item["id"], item) for item in items if item["id"] not in removed]
+    result.extend(diff.get("added", []))
+    if "order" in diff:
+        by_id = {item["id"]: item for item in result}
+        result = [by_id[item_id] for item_id in diff["order"]]
+    return result
+
+
+def _diff_list(old_items, new_items):
+    old_keyed = _keyed(old_items)
+    new_keyed = _keyed(new_items)
+    if old_keyed is None or new_keyed is None:
+        return None
+    diff = {}
+    removed = [item_id for item_id in old_keyed if item_id not in new_keyed]
+    added = [item for item in new_items if item["id"] not in old_keyed]
+    changed = [item for item in new_items if item["id"] in old_keyed and old_keyed[item["id"]] != item]
+    if removed:
+        diff["removed"] = removed
+    if added:
+        diff["added"] = added
+    if changed:
+        diff["changed"] = changed
+    if [item["id"] for item in _apply_list_diff(old_items, diff)] != list(new_keyed):
+        diff["order"] = list(new_keyed)
+    return diff
+
+
+def diff_snapshots(parent, snapshot):
+    if not isinstance(parent, dict) or not isinstance(snapshot, dict):
+        return None
+    diff = {}
+    for key, value in snapshot.items():
+        if key in parent and parent[key] == value:
+            continue
+        if key in KEYED_LISTS and key in parent:
+            list_diff = _diff_list(parent[key], value)
+            if list_diff is not None:
+                diff.setdefault("lists", {})[key] = list_diff
+                continue
+        diff.setdefault("set", {})[key] = value
+    dropped = [key for key in parent if key not in snapshot]
+    if dropped:
+        diff["unset"] = dropped
+    return diff
+
+
+def apply_diff(parent, diff):
+    snapshot = {key: value for key, value in parent.items() if key not in diff.get("unset", ())}
+    for key, list_diff in diff.get("lists", {}).items():
+        snapshot[key] = _apply_list_diff(parent[key], list_diff)
+    snapshot.update(diff.get("set", {}))
+    return snapshot
+
+
+def _payload_size(value):
+    return len(json.dumps(value, ensure_ascii=False, separators=(",", ":")))
+
+
+# Versions form a linear chain per save. A version stores either the full
+# snapshot (a checkpoint), a diff against its parent, or, when its content hash
+# matches an earlier version, a reference to that version and nothing else.
+def next_version(summaries, parent_snapshot, snapshot, timestamp):
+    content_hash = snapshot_hash(snapshot)
+    if summaries and summaries[-1]["hash"] == content_hash:
+        return None
+    record = {
+        "version": summaries[-1]["version"] + 1 if summaries else 1,
+        "hash": content_hash,
+        "createdAt": timestamp,
+    }
+    for previous in reversed(summaries):
+        if previous["hash"] == content_hash:
+            record["ref"] = previous["version"]
+            return record
+
+    since_checkpoint = 0
+    for previous in reversed(summaries):
+        if previous["checkpoint"]:
+            break
+        since_checkpoint += 1
+    diff = None
+    if summaries and parent_snapshot is not None and since_checkpoint + 1 < CHECKPOINT_INTERVAL:
+        diff = diff_snapshots(parent_snapshot, snapshot)
+    if diff is not None and _payload_size(diff) * 2 < _payload_size(snapshot):
+        record["diff"] = diff
+    else:
+        record["snapshot"] = snapshot
+    return record
+
+
+def version_summary(record):
+    summary = {
+        "version": record["version"],
+        "hash": record["hash"],
+        "createdAt": record["createdAt"],
+        "checkpoint": "snapshot" in record,
+    }
+    if "ref" in record:
+        summary["ref"] = record["ref"]
+    return summary
+
+
+def reconstruct(versions, version):
+    by_version = {record["version"]: record for record in versions}
+    while version in by_version and "ref" in by_version[version]:
+        version = by_version[version]["ref"]
+    if version not in by_version:
+        return None
+
+    chain = []
+    current = version
+    while current in by_version:
+        record = by_version[current]
+        chain.append(record)
+        if "snapshot" in record:
+            break
+        current -= 1
+        while current in by_version and "ref" in by_version[current]:
+            current = by_version[current]["ref"]
+    else:
+        return None
+
+    snapshot = chain[-1]["snapshot"]
+    for record in reversed(chain[:-1]):
+        snapshot = apply_diff(snapshot, record["diff"])
+    return snapshot
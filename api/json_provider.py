@@ -0,0 +1,59 @@
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Encodes and decodes with orjson when it is installed: responses are written
+# straight to bytes, request bodies are parsed by the same library, and
+# non-string dict keys (PLC memory indexes) are allowed as in the stdlib
+# encoder. Values orjson refuses, such as integers above 64 bits, fall back
+# to the stdlib provider. Keys are not sorted; the client does not care.
+class FastJSONProvider(DefaultJSONProvider):
+    sort_keys = False
+
+    def _options(self, indent=False):
+        options = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def _encode(self, obj, indent=False):
+        try:
+            return orjson.dumps(obj, default=self.default, option=self._options(indent))
+        except TypeError:
+            return None
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and not kwargs.keys() - {"separators", "indent"}:
+            encoded = self._encode(obj, bool(kwargs.get("indent")))
+            if encoded is not None:
+                return encoded.decode("utf-8")
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            try:
+                return orjson.loads(s)
+            except orjson.JSONDecodeError:
+                pass
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        encoded = self._encode(obj, indent)
+        if encoded is None:
+            return super().response(obj)
+        return self._app.response_class(encoded + b"\n", mimetype=self.mimetype)
+
+
+def init_json(app):
+    if app.config.setdefault("JSON_FAST", True):
+        app.json = FastJSONProvider(app)
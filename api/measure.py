@@ -0,0 +1,143 @@
+import math
+
+from sim.core import compute_branch_quantities, compute_impedances, solve_network
+
+
+def _terminal_voltages(voltages, terminal_nodes, meter):
+    a_ref = meter.get("aRef")
+    b_ref = meter.get("bRef")
+    if not a_ref or not b_ref:
+        return None
+    va = voltages[terminal_nodes[f"{a_ref['compId']}:{a_ref['index']}"]]
+    vb = voltages[terminal_nodes[f"{b_ref['compId']}:{b_ref['index']}"]]
+    return va, vb
+
+
+def _branch_table(result, context):
+    if "branches" not in context:
+        context["branches"] = compute_branch_quantities(result)
+    return context["branches"]
+
+
+def measure_meter(meter, result, context):
+    mode = meter.get("mode")
+    components = result["components"]
+    terminal_nodes = result["terminal_nodes"]
+    dc_voltages = result["dc_solution"]["node_voltages"] if result["dc_solution"] else None
+    ac_voltages = result["ac_solution"]["node_voltages"] if result["ac_solution"] else None
+
+    if mode == "voltage":
+        pair = _terminal_voltages(dc_voltages, terminal_nodes, meter)
+        if pair is None:
+            return {"error": "Saknar mätpunkter."}
+        return {"value": pair[0] - pair[1]}
+
+    if mode in {"ac_voltage", "ac_phase"}:
+        if not meter.get("aRef") or not meter.get("bRef"):
+            return {"error": "Saknar mätpunkter."}
+        if ac_voltages is None:
+            return {"error": "Ingen AC-lösning tillgänglig."}
+        va, vb = _terminal_voltages(ac_voltages, terminal_nodes, meter)
+        v = va - vb
+        if mode == "ac_voltage":
+            return {"value": abs(v)}
+        return {"value": math.degrees(math.atan2(v.im, v.re))}
+
+    if mode == "current":
+        comp = context["components_by_id"].get(meter.get("componentId"))
+        if not comp:
+            return {"error": "Komponent saknas."}
+        entry = _branch_table(result, context)["dc"]["components"].get(comp["id"])
+        return {"value": entry["current"] if entry else None}
+
+    if mode in {"ac_current", "ac_power_p", "ac_power_q", "ac_power_s", "ac_pf"}:
+        comp = context["components_by_id"].get(meter.get("componentId"))
+        if not comp:
+            return {"error": "Komponent saknas."}
+        if ac_voltages is None:
+            return {"error": "Ingen AC-lösning tillgänglig."}
+        entry = _branch_table(result, context)["ac"]["components"].get(comp["id"])
+        if entry is None:
+            return {"value": None}
+        field = {
+            "ac_current": "current",
+            "ac_power_p": "p",
+            "ac_power_q": "q",
+            "ac_power_s": "s",
+            "ac_pf": "pf",
+        }[mode]
+        return {"value": entry[field]}
+
+    if mode == "resistance":
+        a_ref = meter.get("aRef")
+        b_ref = meter.get("bRef")
+        if not a_ref or not b_ref:
+            return {"error": "Saknar mätpunkter."}
+        pair = (
+            terminal_nodes.get(f"{a_ref['compId']}:{a_ref['index']}"),
+            terminal_nodes.get(f"{b_ref['compId']}:{b_ref['index']}"),
+        )
+        impedances = compute_impedances(result, [pair], "dc")
+        if "error" in impedances:
+            return {"error": impedances["error"]}
+        return {"value": impedances["impedances"][0]}
+
+    return {"error": "Okänt mätläge."}
+
+
+def _measure_context(payload, result):
+    return {"components_by_id": {comp.get("id"): comp for comp in result["components"]}}
+
+
+def measure(payload):
+    result = solve_network(payload)
+    if "error" in result:
+        return {"error": result["error"]}
+    return measure_meter(payload, result, _measure_context(payload, result))
+
+
+def measure_batch(payload):
+    result = solve_network(payload)
+    if "error" in result:
+        return {"error": result["error"]}
+    context = _measure_context(payload, result)
+    readings = {}
+    for meter in payload.get("meters", []):
+        try:
+            readings[meter.get("id")] = measure_meter(meter, result, context)
+        except (KeyError, IndexError, TypeError, ZeroDivisionError):
+            readings[meter.get("id")] = {"error": "Mätningen misslyckades."}
+    return {"readings": readings}
+
+
+def _impedance_json(value):
+    if value is None or isinstance(value, float):
+        return value
+    return {"re": value.re, "im": value.im, "magnitude": abs(value), "angle": math.degrees(math.atan2(value.im, value.re))}
+
+
+def impedance(payload):
+    analysis = payload.get("analysis", "dc")
+    if analysis not in {"dc", "ac"}:
+        return {"error": "Okänt analysläge."}
+    result = solve_network(payload)
+    if "error" in result:
+        return {"error": result["error"]}
+    terminal_nodes = result["terminal_nodes"]
+    pairs = []
+    for item in payload.get("pairs", []):
+        a_ref = item.get("aRef") or {}
+        b_ref = item.get("bRef") or {}
+        pairs.append(
+            (
+                terminal_nodes.get(f"{a_ref.get('compId')}:{a_ref.get('index')}"),
+                terminal_nodes.get(f"{b_ref.get('compId')}:{b_ref.get('index')}"),
+            )
+        )
+    impedances = compute_impedances(result, pairs, analysis, bool(payload.get("transfer")))
+    if "error" in impedances:
+        return {"error": impedances["error"]}
+    response = {"impedances": [_impedance_json(z) for z in impedances["impedances"]]}
+    if "transfer" in impedances:
+        response["transfer"] = [[_impedance_json(z) for z in row] for row in impedances["transfer"]]
+    return response
@@ -0,0 +1,285 @@
+import atexit
+import heapq
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from functools import partial
+
+from flask import current_app
+
+from api.singleflight import SingleFlight, request_key
+from sim import metrics
+from sim.core import SolveTimeout
+
+PRIORITIES = {"interactive": 0, "background": 1}
+DEADLINE_GRACE = 1.0
+SPARE_WORKERS = 1
+
+inflight = SingleFlight()
+metrics.register_collector(
+    "ellabb_coalesced_requests_total",
+    "Solver requests by single-flight role.",
+    lambda: [(("executed",), inflight.stats()["executed"]), (("shared",), inflight.stats()["shared"])],
+    ("role",),
+    kind="counter",
+)
+
+
+class SolverBusy(Exception):
+    pass
+
+
+class SolverTimeout(Exception):
+    pass
+
+
+# Runs in the worker process. Metrics recorded there are drained and shipped
+# back with the result so /metrics in the web process covers all workers.
+def _run_job(job, payload):
+    return job(payload), metrics.drain()
+
+
+def _worker_main(conn):
+    import sim.core  # noqa: F401
+
+    conn.send(("ready", os.getpid()))
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        job, payload = message
+        try:
+            reply = ("ok", _run_job(job, payload))
+        except Exception as exc:
+            reply = ("error", exc)
+        try:
+            conn.send(reply)
+        except Exception as exc:
+            conn.send(("error", RuntimeError(repr(exc))))
+
+
+class _Worker:
+    __slots__ = ("slot", "process", "conn", "ready", "future", "killed")
+
+    def __init__(self, context, slot):
+        self.slot = slot
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+        self.ready = threading.Event()
+        self.future = None
+        self.killed = False
+
+
+# Jobs wait in our own priority heap and are only handed to a worker process
+# when one is free, so a queued toggle overtakes queued polls. Background work
+# may fill at most half of the queue; the rest is kept for interactive
+# requests. A job that outlives its deadline is stopped by killing its process,
+# which is then replaced; the spare process takes over its slot meanwhile, so
+# the next request does not wait for the new process to start.
+#
+# Each session prefers one slot, picked by hashing its sessionId, because the
+# incremental topology and the Newton warm start live in the memory of the
+# process that solved the session last. A job only goes to another idle
+# process while its own one is busy or being replaced.
+class SolverPool:
+    def __init__(self, workers, max_queue):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.context = multiprocessing.get_context("spawn")
+        self.lock = threading.Lock()
+        self.queue = []
+        self.running = 0
+        self.counter = itertools.count()
+        self.closed = False
+        self.idle = []
+        self.slots = [None] * (workers + SPARE_WORKERS)
+        for slot in range(len(self.slots)):
+            self._spawn(slot)
+
+    def _spawn(self, slot):
+        worker = _Worker(self.context, slot)
+        with self.lock:
+            self.slots[slot] = worker
+        threading.Thread(target=self._read, args=(worker,), daemon=True).start()
+        return worker
+
+    def _processes(self):
+        return [worker for worker in self.slots if worker is not None]
+
+    def warm_up(self):
+        for worker in self._processes():
+            worker.ready.wait()
+
+    def shutdown(self, wait=False):
+        with self.lock:
+            self.closed = True
+            queued, self.queue = self.queue, []
+            processes = self._processes()
+        for _, _, _, _, future in queued:
+            future.cancel()
+        for worker in processes:
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+        if wait:
+            for worker in processes:
+                worker.process.join()
+
+    def depth(self):
+        with self.lock:
+            return len(self.queue)
+
+    def _limit(self, rank):
+        if rank == PRIORITIES["interactive"]:
+            return self.max_queue
+        return max(1, self.max_queue // 2)
+
+    def submit(self, job, payload, priority):
+        rank = PRIORITIES.get(priority, PRIORITIES["interactive"])
+        future = Future()
+        with self.lock:
+            if self.closed or len(self.queue) >= self._limit(rank):
+                raise SolverBusy()
+            heapq.heappush(self.queue, (rank, next(self.counter), job, payload, future))
+            self._dispatch()
+        return future
+
+    # Stops a job that the caller gave up on: a queued job is dropped, a
+    # running one loses its process.
+    def cancel(self, future):
+        if future.cancel():
+            return
+        with self.lock:
+            for worker in self._processes():
+                if worker.future is future:
+                    worker.killed = True
+                    worker.process.kill()
+
+    def _preferred(self, payload):
+        session_id = payload.get("sessionId")
+        if session_id is None:
+            return None
+        return self.slots[hash(session_id) % len(self.slots)]
+
+    # Takes the oldest job of the most urgent rank whose own process is idle,
+    # and only falls back to the head of the queue on any idle process when
+    # there is none.
+    def _next(self):
+        rank = self.queue[0][0]
+        for entry in sorted(item for item in self.queue if item[0] == rank):
+            worker = self._preferred(entry[3])
+            if worker in self.idle:
+                self.queue.remove(entry)
+                heapq.heapify(self.queue)
+                self.idle.remove(worker)
+                return entry, worker
+        return heapq.heappop(self.queue), self.idle.pop()
+
+    def _dispatch(self):
+        while self.running < self.workers and self.queue and self.idle:
+            (_, _, job, payload, future), worker = self._next()
+            if not future.set_running_or_notify_cancel():
+                self.idle.append(worker)
+                continue
+            deadline = payload.get("deadline")
+            if deadline is not None and time.time() >= deadline:
+                self.idle.append(worker)
+                future.set_exception(SolverTimeout())
+                continue
+            try:
+                worker.conn.send((job, payload))
+            except Exception as exc:
+                self.idle.append(worker)
+                future.set_exception(exc)
+                continue
+            worker.future = future
+            self.running += 1
+
+    def _read(self, worker):
+        while True:
+            try:
+                kind, value = worker.conn.recv()
+            except (EOFError, OSError):
+                self._replace(worker)
+                return
+            with self.lock:
+                future, worker.future = worker.future, None
+                if future is not None:
+                    self.running -= 1
+                self.idle.append(worker)
+                self._dispatch()
+            worker.ready.set()
+            if future is None:
+                continue
+            if kind == "error":
+                future.set_exception(value)
+            else:
+                result, delta = value
+                metrics.merge(delta)
+                future.set_result(result)
+
+    def _replace(self, worker):
+        with self.lock:
+            future, worker.future = worker.future, None
+            if future is not None:
+                self.running -= 1
+            if worker in self.idle:
+                self.idle.remove(worker)
+            self.slots[worker.slot] = None
+            closed = self.closed
+            self._dispatch()
+        worker.ready.set()
+        worker.conn.close()
+        worker.process.join()
+        if future is not None and not future.done():
+            if worker.killed:
+                future.set_exception(SolverTimeout())
+            else:
+                future.set_exception(RuntimeError("Lösarprocessen avslutades oväntat."))
+        if not closed:
+            self._spawn(worker.slot)
+
+
+def init_solver_pool(app):
+    workers = app.config.setdefault("SOLVER_WORKERS", os.cpu_count() or 1)
+    max_queue = app.config.setdefault("SOLVER_QUEUE", workers * 4)
+    pool = SolverPool(workers, max_queue)
+    pool.warm_up()
+    atexit.register(pool.shutdown)
+    app.extensions["solver_pool"] = pool
+    metrics.register_collector("ellabb_solver_queue_depth", "Solver jobs waiting for a worker.", lambda: [((), pool.depth())])
+    return pool
+
+
+def run_solver(job, payload):
+    timeout = current_app.config.get("SOLVER_DEADLINE")
+    if timeout:
+        payload["deadline"] = time.time() + timeout
+    pool = current_app.extensions.get("solver_pool")
+    if current_app.config.get("SOLVER_COALESCE", True):
+        return inflight.do(request_key(job, payload), partial(_execute, pool, job, payload, timeout))
+    return _execute(pool, job, payload, timeout)
+
+
+def _execute(pool, job, payload, timeout):
+    try:
+        if pool is None:
+            return job(payload)
+        future = pool.submit(job, payload, payload.get("priority", "interactive"))
+        try:
+            return future.result(timeout=timeout + DEADLINE_GRACE if timeout else None)
+        except FutureTimeoutError:
+            pool.cancel(future)
+            raise SolverTimeout()
+    except SolveTimeout:
+        raise SolverTimeout()
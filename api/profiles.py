@@ -0,0 +1,33 @@
+import threading
+import uuid
+from collections import OrderedDict
+
+from sim.profiling import PROFILE_DUMP_KEY
+
+PROFILE_KEEP = 16
+
+_lock = threading.Lock()
+_dumps = OrderedDict()
+
+
+# cProfile dumps stay in memory for the last few profiled requests; the
+# response only carries a download link. Results may be shared between
+# coalesced requests, so the body is copied instead of modified.
+def publish_profile(body, keep=PROFILE_KEEP):
+    if PROFILE_DUMP_KEY not in body:
+        return body
+    profile_id = uuid.uuid4().hex
+    with _lock:
+        _dumps[profile_id] = body[PROFILE_DUMP_KEY]
+        while len(_dumps) > keep:
+            _dumps.popitem(last=False)
+    body = {key: value for key, value in body.items() if key != PROFILE_DUMP_KEY}
+    debug_info = dict(body.get("debugInfo", {}))
+    debug_info["profile"] = {**debug_info.get("profile", {}), "id": profile_id, "url": f"/api/profiles/{profile_id}"}
+    body["debugInfo"] = debug_info
+    return body
+
+
+def load_profile(profile_id):
+    with _lock:
+        return _dumps.get(profile_id)
@@ -0,0 +1,64 @@
+import json
+import os
+import threading
+import time
+
+RECORDED_PREFIXES = ("/api/simulate", "/api/measure", "/api/impedance", "/api/contingencies", "/api/saves")
+# The headers that change what the server does: the binary simulation format
+# and conditional save loads.
+RECORDED_HEADERS = ("Accept", "If-None-Match")
+
+
+# Appends one JSON line per API request: when it arrived, what was sent and
+# how it was answered. New saves also get the id they were given, so
+# bench.replay can seed its database with them, and responses keep their ETag
+# so a replayed If-None-Match can be matched to the replayed save.
+class TrafficRecorder:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.handle = open(path, "a", encoding="utf-8")
+
+    def record(self, request, response, started_at, duration):
+        if not request.path.startswith(RECORDED_PREFIXES):
+            return
+        entry = {
+            "ts": round(started_at, 6),
+            "method": request.method,
+            "path": request.path,
+            "query": request.query_string.decode("latin-1"),
+            "status": response.status_code,
+            "durationMs": round(duration * 1000, 3),
+        }
+        headers = {name: request.headers[name] for name in RECORDED_HEADERS if name in request.headers}
+        if headers:
+            entry["headers"] = headers
+        body = request.get_json(silent=True)
+        if body is not None:
+            entry["body"] = body
+        if response.headers.get("ETag"):
+            entry["etag"] = response.headers["ETag"]
+        if request.method == "POST" and request.path == "/api/saves" and response.status_code == 200:
+            save = (response.get_json(silent=True) or {}).get("save") or {}
+            if save.get("id"):
+                entry["saveId"] = save["id"]
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self.lock:
+            self.handle.write(line)
+            self.handle.flush()
+
+    def close(self):
+        with self.lock:
+            self.handle.close()
+
+
+def init_recorder(app):
+    path = app.config.setdefault("TRAFFIC_RECORD_PATH", os.environ.get("ELLABB_RECORD"))
+    if path:
+        app.extensions["traffic_recorder"] = TrafficRecorder(path)
+
+
+def record_request(app, request, response, duration):
+    recorder = app.extensions.get("traffic_recorder")
+    if recorder is not None:
+        recorder.record(request, response, time.time() - duration, duration)
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import threading
+
+from sim.core import TIME_DEPENDENT_TYPES
+
+VOLATILE_KEYS = ("sessionId", "priority", "deadline")
+DEFAULT_PRIORITY = "interactive"
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+# Concurrent calls with the same key share one execution: the first caller
+# runs it, later callers block until it finishes and get the same result (or
+# exception).
+class SingleFlight:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key, fn):
+        with self.lock:
+            call = self.calls.get(key)
+            if call is None:
+                call = _Call()
+                self.calls[key] = call
+                self.executed += 1
+                leader = True
+            else:
+                self.shared += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self.lock:
+            return {"inFlight": len(self.calls), "executed": self.executed, "shared": self.shared}
+
+
+# Requests only share a call with the same priority: an interactive request
+# must not wait behind a matching background poll's place in the queue or
+# inherit its deadline.
+def request_key(job, payload):
+    ignored = set(VOLATILE_KEYS)
+    if not any(comp.get("type") in TIME_DEPENDENT_TYPES for comp in payload.get("components", [])):
+        ignored.add("simTime")
+    canonical = json.dumps(
+        {key: value for key, value in payload.items() if key not in ignored},
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    digest = hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+    priority = payload.get("priority") or DEFAULT_PRIORITY
+    return f"{job.__module__}.{job.__qualname__}:{priority}:{digest}"
@@ -0,0 +1,238 @@
+import json
+import sqlite3
+import threading
+import zlib
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS saves (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        snapshot BLOB NOT NULL,
+        created_at INTEGER NOT NULL,
+        updated_at INTEGER NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS saves_name ON saves (name, updated_at)",
+    "CREATE INDEX IF NOT EXISTS saves_updated_at ON saves (updated_at, id)",
+    "CREATE INDEX IF NOT EXISTS saves_name_nocase ON saves (name COLLATE NOCASE)",
+    """
+    CREATE TABLE IF NOT EXISTS save_versions (
+        save_id TEXT NOT NULL,
+        version INTEGER NOT NULL,
+        hash TEXT NOT NULL,
+        ref INTEGER,
+        checkpoint INTEGER NOT NULL,
+        payload BLOB,
+        created_at INTEGER NOT NULL,
+        PRIMARY KEY (save_id, version)
+    )
+    """,
+)
+
+FTS_SCHEMA = (
+    "CREATE VIRTUAL TABLE saves_fts USING fts5(name, content='saves', content_rowid='rowid', tokenize='trigram')",
+    """
+    CREATE TRIGGER saves_fts_insert AFTER INSERT ON saves BEGIN
+        INSERT INTO saves_fts (rowid, name) VALUES (new.rowid, new.name);
+    END
+    """,
+    """
+    CREATE TRIGGER saves_fts_delete AFTER DELETE ON saves BEGIN
+        INSERT INTO saves_fts (saves_fts, rowid, name) VALUES ('delete', old.rowid, old.name);
+    END
+    """,
+    """
+    CREATE TRIGGER saves_fts_update AFTER UPDATE OF name ON saves BEGIN
+        INSERT INTO saves_fts (saves_fts, rowid, name) VALUES ('delete', old.rowid, old.name);
+        INSERT INTO saves_fts (rowid, name) VALUES (new.rowid, new.name);
+    END
+    """,
+    "INSERT INTO saves_fts (saves_fts) VALUES ('rebuild')",
+)
+
+SQL_HAS_FTS = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'saves_fts'"
+SQL_QUERY = "SELECT saves.id, saves.name, saves.updated_at FROM saves"
+SQL_QUERY_FTS = " JOIN saves_fts ON saves_fts.rowid = saves.rowid AND saves_fts MATCH ?"
+SQL_QUERY_PREFIX = " saves.name >= ? COLLATE NOCASE AND saves.name < ? COLLATE NOCASE"
+SQL_QUERY_CONTAINS = " instr(lower(saves.name), ?) > 0"
+SQL_QUERY_AFTER = " (saves.updated_at < ? OR (saves.updated_at = ? AND saves.id > ?))"
+SQL_QUERY_ORDER = " ORDER BY saves.updated_at DESC, saves.id"
+SQL_FIND_BY_NAME = "SELECT id, name, created_at, updated_at FROM saves WHERE name = ? ORDER BY updated_at DESC LIMIT 1"
+SQL_GET_ENTRY = "SELECT id, name, created_at, updated_at FROM saves WHERE id = ?"
+SQL_LOAD = "SELECT id, name, snapshot, created_at, updated_at FROM saves WHERE id = ?"
+SQL_UPSERT = """
+    INSERT INTO saves (id, name, snapshot, created_at, updated_at) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (id) DO UPDATE SET
+        name = excluded.name,
+        snapshot = excluded.snapshot,
+        updated_at = excluded.updated_at
+"""
+SQL_DELETE = "DELETE FROM saves WHERE id = ?"
+SQL_DELETE_VERSIONS = "DELETE FROM save_versions WHERE save_id = ?"
+SQL_VERSION_SUMMARIES = (
+    "SELECT version, hash, created_at, checkpoint, ref FROM save_versions WHERE save_id = ? ORDER BY version"
+)
+SQL_LOAD_VERSIONS = (
+    "SELECT version, hash, created_at, checkpoint, ref, payload FROM save_versions WHERE save_id = ? ORDER BY version"
+)
+SQL_INSERT_VERSION = """
+    INSERT INTO save_versions (save_id, version, hash, ref, checkpoint, payload, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def _encode_snapshot(snapshot):
+    return zlib.compress(json.dumps(snapshot, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 6)
+
+
+def _decode_snapshot(value):
+    if isinstance(value, bytes):
+        value = zlib.decompressobj().decompress(value)
+    return json.loads(value)
+
+
+def _version_summary(row):
+    summary = {"version": row[0], "hash": row[1], "createdAt": row[2], "checkpoint": bool(row[3])}
+    if row[4] is not None:
+        summary["ref"] = row[4]
+    return summary
+
+
+def _entry(row):
+    return {"id": row[0], "name": row[1], "createdAt": row[2], "updatedAt": row[3]}
+
+
+class SqliteBackend:
+    def __init__(self, db_path, compress=True):
+        self.db_path = db_path
+        self.compress = compress
+        self.local = threading.local()
+        self.fts = False
+
+    def _connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30, cached_statements=64, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def init(self):
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connection()
+        with conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+        self.fts = conn.execute(SQL_HAS_FTS).fetchone() is not None
+        if not self.fts:
+            try:
+                with conn:
+                    for statement in FTS_SCHEMA:
+                        conn.execute(statement)
+                self.fts = True
+            except sqlite3.OperationalError:
+                self.fts = False
+
+    def query_saves(self, query=None, match="contains", after=None, limit=None):
+        sql = SQL_QUERY
+        conditions = []
+        params = []
+        if query and match == "prefix":
+            conditions.append(SQL_QUERY_PREFIX)
+            params += [query, query + "\U0010ffff"]
+        elif query and self.fts and len(query) >= 3:
+            sql += SQL_QUERY_FTS
+            params.append('"' + query.replace('"', '""') + '"')
+        elif query:
+            conditions.append(SQL_QUERY_CONTAINS)
+            params.append(query.lower())
+        if after:
+            conditions.append(SQL_QUERY_AFTER)
+            params += [-after[0], -after[0], after[1]]
+        if conditions:
+            sql += " WHERE" + " AND".join(conditions)
+        sql += SQL_QUERY_ORDER
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        rows = self._connection().execute(sql, params).fetchall()
+        return [{"id": row[0], "name": row[1], "updatedAt": row[2]} for row in rows]
+
+    def find_by_name(self, name):
+        row = self._connection().execute(SQL_FIND_BY_NAME, (name,)).fetchone()
+        return _entry(row) if row else None
+
+    def get_entry(self, save_id):
+        row = self._connection().execute(SQL_GET_ENTRY, (save_id,)).fetchone()
+        return _entry(row) if row else None
+
+    def load_record(self, save_id):
+        row = self._connection().execute(SQL_LOAD, (save_id,)).fetchone()
+        if not row:
+            return None
+        try:
+            snapshot = _decode_snapshot(row[2])
+        except (zlib.error, UnicodeDecodeError, json.JSONDecodeError):
+            return None
+        return {"id": row[0], "name": row[1], "snapshot": snapshot, "createdAt": row[3], "updatedAt": row[4]}
+
+    def write_record(self, record):
+        if self.compress:
+            snapshot = _encode_snapshot(record["snapshot"])
+        else:
+            snapshot = json.dumps(record["snapshot"], ensure_ascii=True, separators=(",", ":"))
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                SQL_UPSERT,
+                (
+                    record["id"],
+                    record["name"],
+                    snapshot,
+                    record["createdAt"],
+                    record["updatedAt"],
+                ),
+            )
+
+    def version_summaries(self, save_id):
+        rows = self._connection().execute(SQL_VERSION_SUMMARIES, (save_id,)).fetchall()
+        return [_version_summary(row) for row in rows]
+
+    def load_versions(self, save_id):
+        versions = []
+        for row in self._connection().execute(SQL_LOAD_VERSIONS, (save_id,)).fetchall():
+            record = _version_summary(row)
+            del record["checkpoint"]
+            if row[5] is not None:
+                record["snapshot" if row[3] else "diff"] = _decode_snapshot(row[5])
+            versions.append(record)
+        return versions
+
+    def append_version(self, save_id, record):
+        payload = record.get("snapshot", record.get("diff"))
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                SQL_INSERT_VERSION,
+                (
+                    save_id,
+                    record["version"],
+                    record["hash"],
+                    record.get("ref"),
+                    int("snapshot" in record),
+                    _encode_snapshot(payload) if payload is not None else None,
+                    record["createdAt"],
+                ),
+            )
+
+    def delete(self, save_id):
+        conn = self._connection()
+        try:
+            with conn:
+                conn.execute(SQL_DELETE_VERSIONS, (save_id,))
+                cursor = conn.execute(SQL_DELETE, (save_id,))
+        except sqlite3.Error:
+            return None
+        return cursor.rowcount > 0
@@ -1,79 +1,158 @@
+import base64
 import json
+import os
 import re
+import threading
 import time
 import uuid
+from collections import OrderedDict
 from pathlib import Path
 
 from flask import current_app
 
+from api.file_backend import FileBackend
+from api.history import next_version, reconstruct
+from api.sqlite_backend import SqliteBackend
 
-def _get_saves_dir():
-    saves_dir = Path(current_app.root_path) / "saves"
-    saves_dir.mkdir(parents=True, exist_ok=True)
-    return saves_dir
+RUNTIME_PROPS = ("plcState", "timerState")
+SNAPSHOT_CACHE_SIZE = 32
+SEARCH_MATCHES = ("contains", "prefix")
 
+BACKENDS = {
+    "file": lambda app: FileBackend(Path(app.root_path) / "saves", compress=app.config["SAVES_COMPRESS"]),
+    "sqlite": lambda app: SqliteBackend(
+        Path(app.config.get("SAVES_DB_PATH") or Path(app.root_path) / "saves" / "saves.db"),
+        compress=app.config["SAVES_COMPRESS"],
+    ),
+}
 
-def _load_save(path):
-    try:
-        with path.open("r", encoding="utf-8") as handle:
-            return json.load(handle)
-    except (OSError, json.JSONDecodeError):
-        return None
+
+_save_lock = threading.Lock()
+_snapshot_cache = OrderedDict()
+_snapshot_cache_lock = threading.Lock()
+
+
+def init_storage(app):
+    app.config.setdefault("SAVES_BACKEND", os.environ.get("ELLABB_SAVES_BACKEND", "file"))
+    app.config.setdefault("SAVES_COMPRESS", True)
+    app.config.setdefault("SAVES_STRIP_RUNTIME", False)
+    app.config.setdefault("SAVES_SNAPSHOT_CACHE_SIZE", SNAPSHOT_CACHE_SIZE)
+    factory = BACKENDS.get(app.config["SAVES_BACKEND"])
+    if factory is None:
+        raise ValueError(f"Unknown saves backend: {app.config['SAVES_BACKEND']}")
+    backend = factory(app)
+    backend.init()
+    app.extensions["saves_backend"] = backend
+    return backend
+
+
+def _backend():
+    backend = current_app.extensions.get("saves_backend")
+    if backend is None:
+        backend = init_storage(current_app)
+    return backend
 
 
 def safe_name(name):
     return re.sub(r"[^a-zA-Z0-9 _-]", "", name).strip()
 
 
-def list_saves():
-    saves = []
-    saves_dir = _get_saves_dir()
-    for path in saves_dir.glob("*.json"):
-        data = _load_save(path)
-        if not data:
-            continue
-        saves.append(
-            {
-                "id": data.get("id", path.stem),
-                "name": data.get("name", path.stem),
-                "updatedAt": data.get("updatedAt", 0),
-            }
-        )
-    return sorted(saves, key=lambda item: item["updatedAt"], reverse=True)
+def strip_runtime_state(snapshot):
+    components = []
+    for comp in snapshot.get("components") or []:
+        props = comp.get("props")
+        if isinstance(props, dict) and any(key in props for key in RUNTIME_PROPS):
+            comp = {**comp, "props": {key: value for key, value in props.items() if key not in RUNTIME_PROPS}}
+        components.append(comp)
+    return {**snapshot, "components": components}
+
+
+def _encode_cursor(item):
+    raw = json.dumps([-item["updatedAt"], item["id"]], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        key = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("Ogiltig cursor.")
+    if not isinstance(key, list) or len(key) != 2 or not isinstance(key[0], int) or not isinstance(key[1], str):
+        raise ValueError("Ogiltig cursor.")
+    return tuple(key)
+
+
+def search_saves(query="", match="contains", limit=50, cursor=None):
+    if match not in SEARCH_MATCHES:
+        raise ValueError("Okänt sökläge.")
+    after = _decode_cursor(cursor) if cursor else None
+    items = _backend().query_saves(query.strip() or None, match, after, limit + 1)
+    next_cursor = _encode_cursor(items[limit - 1]) if len(items) > limit else None
+    return {"saves": items[:limit], "nextCursor": next_cursor}
 
 
+def get_save(save_id):
+    return _backend().get_entry(save_id)
+
+
+def _invalidate_snapshot(save_id):
+    with _snapshot_cache_lock:
+        _snapshot_cache.pop(save_id, None)
+
+
+# Cached snapshots are checked against the catalog's updatedAt, so a save made
+# by another worker process is picked up on the next load.
 def load_snapshot(save_id):
-    path = _get_saves_dir() / f"{save_id}.json"
-    data = _load_save(path)
+    entry = get_save(save_id)
+    with _snapshot_cache_lock:
+        cached = _snapshot_cache.get(save_id)
+        if cached and entry and cached[0] == entry["updatedAt"]:
+            _snapshot_cache.move_to_end(save_id)
+            return cached[1]
+
+    data = _backend().load_record(save_id)
     if not data:
         return None
-    return data.get("snapshot", {})
+    snapshot = data.get("snapshot", {})
+    limit = current_app.config.get("SAVES_SNAPSHOT_CACHE_SIZE", SNAPSHOT_CACHE_SIZE)
+    if limit > 0 and data.get("updatedAt") is not None:
+        with _snapshot_cache_lock:
+            _snapshot_cache[save_id] = (data["updatedAt"], snapshot)
+            _snapshot_cache.move_to_end(save_id)
+            while len(_snapshot_cache) > limit:
+                _snapshot_cache.popitem(last=False)
+    return snapshot
 
 
 def delete_save(save_id):
-    path = _get_saves_dir() / f"{save_id}.json"
-    if not path.exists():
-        return False
-    try:
-        path.unlink()
-    except OSError:
+    with _save_lock:
+        _invalidate_snapshot(save_id)
+        return _backend().delete(save_id)
+
+
+def list_versions(save_id):
+    backend = _backend()
+    if backend.get_entry(save_id) is None:
         return None
-    return True
+    return list(reversed(backend.version_summaries(save_id)))
+
+
+def load_version(save_id, version):
+    return reconstruct(_backend().load_versions(save_id), version)
 
 
 def save_snapshot(name, snapshot, save_id=None):
-    saves_dir = _get_saves_dir()
-    existing = None
-    if save_id:
-        path = saves_dir / f"{save_id}.json"
-        existing = _load_save(path) if path.exists() else None
-    else:
-        for path in saves_dir.glob("*.json"):
-            data = _load_save(path)
-            if data and data.get("name") == name:
-                existing = data
-                save_id = data.get("id", path.stem)
-                break
+    if current_app.config.get("SAVES_STRIP_RUNTIME") and isinstance(snapshot, dict):
+        snapshot = strip_runtime_state(snapshot)
+    with _save_lock:
+        return _save_snapshot(_backend(), name, snapshot, save_id)
+
+
+def _save_snapshot(backend, name, snapshot, save_id):
+    existing = backend.get_entry(save_id) if save_id else backend.find_by_name(name)
+    if not save_id and existing:
+        save_id = existing["id"]
 
     if not save_id:
         save_id = str(uuid.uuid4())
@@ -90,8 +169,15 @@ def save_snapshot(name, snapshot, save_id=None):
     else:
         record["createdAt"] = record["updatedAt"]
 
-    path = saves_dir / f"{save_id}.json"
-    with path.open("w", encoding="utf-8") as handle:
-        json.dump(record, handle, ensure_ascii=True, indent=2)
-
+    summaries = backend.version_summaries(save_id) if existing else []
+    parent = backend.load_record(save_id) if summaries else None
+    version = next_version(summaries, parent and parent.get("snapshot"), snapshot, timestamp)
+    if version is not None:
+        backend.append_version(save_id, version)
+        record["version"] = version["version"]
+    elif summaries:
+        record["version"] = summaries[-1]["version"]
+
+    _invalidate_snapshot(save_id)
+    backend.write_record(record)
     return record
@@ -1,11 +1,16 @@
 from flask import Flask
 
-from api import register_routes
+from api import init_json, init_recorder, init_storage, register_routes
 
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__)
+    if config:
+        app.config.update(config)
+    init_json(app)
     register_routes(app)
+    init_storage(app)
+    init_recorder(app)
     return app
 
 
@@ -0,0 +1,74 @@
+import argparse
+import sys
+
+from bench.circuits import GENERATORS
+from bench.runner import (
+    DEFAULT_BASELINE,
+    DEFAULT_REPEAT,
+    MAX_REGRESSION,
+    MIN_DELTA_MS,
+    TARGETS,
+    confirm_regressions,
+    load_baseline,
+    run_benchmarks,
+    save_baseline,
+)
+
+
+def _names(value, allowed):
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"Okänt namn: {', '.join(unknown)} (välj bland {', '.join(allowed)})")
+    return names
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Mät lösarens prestanda på syntetiska kretsar.")
+    parser.add_argument("--scenarios", type=lambda value: _names(value, list(GENERATORS)), default=None)
+    parser.add_argument("--targets", type=lambda value: _names(value, list(TARGETS)), default=None)
+    parser.add_argument("--sizes", type=lambda value: [int(item) for item in value.split(",")], default=None)
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--warm", action="store_true", help="Behåll cacher och topologi mellan upprepningar.")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--save", metavar="PATH", help="Spara resultaten som ny baslinje.")
+    parser.add_argument("--max-regression", type=float, default=MAX_REGRESSION)
+    parser.add_argument("--min-delta-ms", type=float, default=MIN_DELTA_MS)
+    return parser.parse_args(argv)
+
+
+def _report(key, result):
+    print(
+        f"{key:<40} trimmed {result['trimmedMs']:>10.3f} ms   median {result['medianMs']:>10.3f} ms"
+        f"   min {result['minMs']:>10.3f} ms",
+        flush=True,
+    )
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run_benchmarks(args.scenarios, args.targets, args.sizes, args.repeat, args.warm, _report)
+    if args.save:
+        save_baseline(args.save, results)
+        print(f"Baslinje sparad i {args.save}")
+        return 0
+    baseline = load_baseline(args.baseline)
+    if not baseline:
+        print(f"Ingen baslinje i {args.baseline}; inget att jämföra med.")
+        return 0
+    rows = confirm_regressions(
+        results, baseline, args.repeat, args.warm, args.max_regression, args.min_delta_ms, report=_report
+    )
+    regressions = [row for row in rows if row["regressed"]]
+    for row in rows:
+        if row["ratio"] is not None:
+            mark = "  REGRESSION" if row["regressed"] else ""
+            print(f"{row['key']:<40} {row['baselineMs']:>10.3f} -> {row['ms']:>10.3f} ms  x{row['ratio']:.2f}{mark}")
+    if regressions:
+        print(f"{len(regressions)} regression(er) över {args.max_regression:.0%}.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+import itertools
+
+
+# Generators describe circuits as nets (lists of terminal refs) and wire each
+# net as a chain, the way a student would draw it on the canvas.
+class _Circuit:
+    def __init__(self):
+        self.components = []
+        self.nets = {}
+        self.counter = itertools.count(1)
+
+    def add(self, comp_type, **props):
+        comp_id = f"{comp_type}{next(self.counter)}"
+        self.components.append({"id": comp_id, "type": comp_type, "props": props})
+        return comp_id
+
+    def connect(self, net, comp_id, index):
+        self.nets.setdefault(net, []).append({"compId": comp_id, "index": index})
+
+    def payload(self, sim_time=1_000_000):
+        wires = []
+        for refs in self.nets.values():
+            for a, b in zip(refs, refs[1:]):
+                wires.append({"id": f"w{len(wires) + 1}", "from": a, "to": b})
+        return {"components": self.components, "wires": wires, "simTime": sim_time}
+
+
+def _dc_supply(circuit, volts=24):
+    source = circuit.add("voltage_source", supplyType="DC", value=volts)
+    ground = circuit.add("ground")
+    circuit.connect("+", source, 0)
+    circuit.connect("0", source, 1)
+    circuit.connect("0", ground, 0)
+
+
+# N rungs: a switch energises a contactor coil, one NO pole seals in across
+# the switch and the other lights a lamp. Every other switch is closed.
+def contactor_ladder(rungs):
+    circuit = _Circuit()
+    _dc_supply(circuit)
+    for rung in range(rungs):
+        switch = circuit.add("switch", closed=rung % 2 == 0)
+        contactor = circuit.add(
+            "contactor", poles=["NO", "NO"], contactType="standard", pullInVoltage=18, coilRatedVoltage=24
+        )
+        lamp = circuit.add("lamp", value=80, threshold=12, ratedVoltage=24)
+        coil = f"coil{rung}"
+        out = f"out{rung}"
+        circuit.connect("+", switch, 0)
+        circuit.connect(coil, switch, 1)
+        circuit.connect(coil, contactor, 0)
+        circuit.connect("0", contactor, 1)
+        circuit.connect("+", contactor, 2)
+        circuit.connect(coil, contactor, 3)
+        circuit.connect("+", contactor, 4)
+        circuit.connect(out, contactor, 5)
+        circuit.connect(out, lamp, 0)
+        circuit.connect("0", lamp, 1)
+    return circuit.payload()
+
+
+# N x N grid fed by a 50 Hz AC1 source across opposite corners; the edges
+# cycle through resistors, inductors and capacitors.
+def rlc_mesh(size):
+    circuit = _Circuit()
+    source = circuit.add("voltage_source", supplyType="AC1", value=230, frequency=50)
+    ground = circuit.add("ground")
+    circuit.connect((0, 0), source, 0)
+    circuit.connect((size - 1, size - 1), source, 1)
+    circuit.connect((size - 1, size - 1), ground, 0)
+    kinds = itertools.cycle((("resistor", 100), ("inductor", 0.05), ("capacitor", 1e-5)))
+    for row in range(size):
+        for col in range(size):
+            for neighbour in ((row, col + 1), (row + 1, col)):
+                if neighbour[0] >= size or neighbour[1] >= size:
+                    continue
+                comp_type, value = next(kinds)
+                comp_id = circuit.add(comp_type, value=value)
+                circuit.connect((row, col), comp_id, 0)
+                circuit.connect(neighbour, comp_id, 1)
+    return circuit.payload()
+
+
+# One AC3 supply driving N three-phase motors, alternating Y and Delta.
+def motor_3ph(count):
+    circuit = _Circuit()
+    source = circuit.add("voltage_source", supplyType="AC3", value=400, frequency=50, connection="Y")
+    ground = circuit.add("ground")
+    for phase in range(3):
+        circuit.connect(f"L{phase + 1}", source, phase)
+    circuit.connect("N", source, 3)
+    circuit.connect("N", ground, 0)
+    for idx in range(count):
+        motor = circuit.add("motor_3ph", value=12, connection="Y" if idx % 2 == 0 else "Delta", startVoltage=100)
+        for phase in range(3):
+            circuit.connect(f"L{phase + 1}", motor, phase)
+    return circuit.payload()
+
+
+# Seven-line rungs separated by blank lines (a blank line starts a new rung):
+# Q follows "I(n) and not I(n+1)" and latches through a TON into M.
+def _plc_program(io, lines):
+    rungs = []
+    for rung in range(max(1, lines // 7)):
+        out = rung % io + 1
+        rungs.append(
+            "\n".join(
+                [
+                    f"A I{out}",
+                    f"AN I{out % io + 1}",
+                    f"O M{out}",
+                    f"= Q{out}",
+                    "",
+                    f"A Q{out}",
+                    f"TON T{out} 0.5",
+                    f"= M{out}",
+                ]
+            )
+        )
+    return "\n\n".join(rungs)
+
+
+# N PLCs with 64 inputs and 64 outputs each. Inputs are fed by switches from
+# the 24 V rail, outputs drive lamps, and the program has about `lines`
+# instructions.
+def plc_io(count, io=64, lines=448):
+    circuit = _Circuit()
+    _dc_supply(circuit)
+    for _ in range(count):
+        plc = circuit.add("plc", inputs=io, outputs=io, inputThreshold=12, program=_plc_program(io, lines))
+        circuit.connect("0", plc, 0)
+        circuit.connect("+", plc, 1)
+        for idx in range(io):
+            switch = circuit.add("switch", closed=idx % 3 != 0)
+            circuit.connect("+", switch, 0)
+            circuit.connect((plc, "I", idx), switch, 1)
+            circuit.connect((plc, "I", idx), plc, 2 + idx)
+            lamp = circuit.add("lamp", value=80, threshold=12, ratedVoltage=24)
+            circuit.connect((plc, "Q", idx), plc, 2 + io + idx)
+            circuit.connect((plc, "Q", idx), lamp, 0)
+            circuit.connect("0", lamp, 1)
+    return circuit.payload()
+
+
+# A resistor chain where every third joint is left open, plus two DC sources
+# in parallel with different voltages. The conflicting sources keep the MNA
+# matrix singular, so every solve runs the shunt fallback before giving up.
+def half_wired(length):
+    circuit = _Circuit()
+    _dc_supply(circuit, 24)
+    rival = circuit.add("voltage_source", supplyType="DC", value=12)
+    circuit.connect("+", rival, 0)
+    circuit.connect("0", rival, 1)
+    previous = "+"
+    for idx in range(length):
+        resistor = circuit.add("resistor", value=10 + idx)
+        circuit.connect(previous, resistor, 0)
+        previous = f"j{idx}"
+        if idx % 3 != 2:
+            circuit.connect(previous, resistor, 1)
+    circuit.connect(previous, circuit.add("resistor", value=100), 0)
+    return circuit.payload()
+
+
+GENERATORS = {
+    "ladder": contactor_ladder,
+    "rlc_mesh": rlc_mesh,
+    "motor_3ph": motor_3ph,
+    "plc_io": plc_io,
+    "half_wired": half_wired,
+}
@@ -0,0 +1,256 @@
+import argparse
+import json
+import math
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+SAVE_ROUTE = "/api/saves/<id>"
+UNKNOWN_SAVE = "unknownSave"
+
+
+def load_recording(path):
+    entries = []
+    with Path(path).open(encoding="utf-8") as handle:
+        for line in handle:
+            if line.strip():
+                entries.append(json.loads(line))
+    entries.sort(key=lambda entry: entry["ts"])
+    return entries
+
+
+# Each simulated client replays the whole recording with its own session ids,
+# so one recorded student can stand in for a full class.
+def build_schedule(entries, clients=1):
+    if not entries:
+        return []
+    start = entries[0]["ts"]
+    schedule = []
+    for client in range(clients):
+        for entry in entries:
+            body = entry.get("body")
+            if clients > 1 and isinstance(body, dict) and body.get("sessionId"):
+                body = {**body, "sessionId": f"{body['sessionId']}-{client}"}
+            schedule.append((entry["ts"] - start, client, {**entry, "body": body}))
+    schedule.sort(key=lambda item: (item[0], item[1]))
+    return schedule
+
+
+def _route(path):
+    if path.startswith("/api/saves/"):
+        return SAVE_ROUTE
+    return path
+
+
+# The last snapshot saved under each id during the recording. Saves that
+# already existed when recording started are not in the file.
+def recorded_saves(entries):
+    saves = {}
+    for entry in entries:
+        body = entry.get("body")
+        if entry.get("method") == "POST" and entry.get("saveId") and isinstance(body, dict):
+            saves[entry["saveId"]] = body
+    return saves
+
+
+class TestClientTarget:
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def send(self, entry):
+        client = getattr(self.local, "client", None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        url = entry["path"] + (f"?{entry['query']}" if entry.get("query") else "")
+        headers = entry.get("headers") or {}
+        if entry.get("body") is not None:
+            response = client.open(url, method=entry["method"], json=entry["body"], headers=headers)
+        else:
+            response = client.open(url, method=entry["method"], headers=headers)
+        response.get_data()
+        return response.status_code, response.headers.get("ETag")
+
+
+class HttpTarget:
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def send(self, entry):
+        url = self.base_url + entry["path"] + (f"?{entry['query']}" if entry.get("query") else "")
+        data = None
+        headers = dict(entry.get("headers") or {})
+        if entry.get("body") is not None:
+            data = json.dumps(entry["body"]).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        request = urllib.request.Request(url, data=data, headers=headers, method=entry["method"])
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+                return response.status, response.headers.get("ETag")
+        except urllib.error.HTTPError as exc:
+            return exc.code, exc.headers.get("ETag")
+
+
+# Recorded ETags name save versions on the recording server. Each one is
+# mapped to the ETag the target sent for the same response, so a recorded
+# If-None-Match revalidates against the replayed save instead of always
+# missing.
+def _revalidate(entry, etags):
+    headers = entry.get("headers") or {}
+    etag = etags.get(headers.get("If-None-Match"))
+    if etag is None:
+        return entry
+    return {**entry, "headers": {**headers, "If-None-Match": etag}}
+
+
+# Latency runs from the time a request was due, not from when a thread got to
+# send it, so waiting for a free slot under --concurrency counts as well.
+# With known_saves, a 404 for a save id the recording never saved is counted
+# as UNKNOWN_SAVE instead of an error.
+def replay(schedule, target, concurrency=8, speedup=1.0, known_saves=None):
+    results = []
+    etags = {}
+    lock = threading.Lock()
+
+    def run(entry, due):
+        with lock:
+            request = _revalidate(entry, etags)
+        try:
+            status, etag = target.send(request)
+        except Exception as exc:
+            status, etag = type(exc).__name__, None
+        elapsed = (time.perf_counter() - due) * 1000
+        route = _route(entry["path"])
+        if status == 404 and known_saves is not None and route == SAVE_ROUTE:
+            if entry["path"].split("/")[3] not in known_saves:
+                status = UNKNOWN_SAVE
+        with lock:
+            results.append((route, status, elapsed))
+            if etag and entry.get("etag"):
+                etags[entry["etag"]] = etag
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for offset, _, entry in schedule:
+            if speedup > 0:
+                due = started + offset / speedup
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            else:
+                due = time.perf_counter()
+            executor.submit(run, entry, due)
+    return results, time.perf_counter() - started
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    idx = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return round(sorted_values[idx], 3)
+
+
+def _summary(samples, elapsed):
+    latencies = sorted(latency for _, _, latency in samples)
+    errors = sum(
+        1 for _, status, _ in samples if status != UNKNOWN_SAVE and (not isinstance(status, int) or status >= 400)
+    )
+    statuses = {}
+    for _, status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        "requests": len(samples),
+        "throughput": round(len(samples) / elapsed, 2) if elapsed else None,
+        "p50Ms": _percentile(latencies, 0.50),
+        "p95Ms": _percentile(latencies, 0.95),
+        "p99Ms": _percentile(latencies, 0.99),
+        "errorRate": round(errors / len(samples), 4) if samples else 0.0,
+        "statuses": statuses,
+    }
+
+
+def summarize(results, elapsed):
+    routes = {}
+    for sample in results:
+        routes.setdefault(sample[0], []).append(sample)
+    return {
+        "elapsedS": round(elapsed, 3),
+        "total": _summary(results, elapsed),
+        "routes": {route: _summary(samples, elapsed) for route, samples in sorted(routes.items())},
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.replay", description="Spela upp inspelad API-trafik.")
+    parser.add_argument("recording", help="JSONL-fil från --record / ELLABB_RECORD.")
+    parser.add_argument("--url", help="Bas-URL till en körande server (standard: Flasks testklient i processen).")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--speedup", type=float, default=1.0, help="Tidsfaktor; 0 skickar allt så fort som möjligt.")
+    parser.add_argument("--clients", type=int, default=1, help="Antal samtidiga kopior av inspelningen.")
+    parser.add_argument("--workers", type=int, default=0, help="Lösarprocesser för testklienten (0 = i tråden).")
+    parser.add_argument("--max-error-rate", type=float, default=1.0, help="Avsluta med kod 1 över denna felandel.")
+    parser.add_argument("--json", action="store_true", help="Skriv rapporten som JSON.")
+    return parser.parse_args(argv)
+
+
+def _local_target(workers, db_path, saves):
+    from api.pool import init_solver_pool
+    from api.storage import safe_name, save_snapshot
+    from app import create_app
+
+    # Replayed saves go to a throwaway SQLite database, not the real saves/. It
+    # starts with the saves made during the recording, under their recorded
+    # ids, so loading them works even before the replayed POST has run.
+    app = create_app({"SAVES_BACKEND": "sqlite", "SAVES_DB_PATH": db_path, "TRAFFIC_RECORD_PATH": None})
+    with app.app_context():
+        for save_id, body in saves.items():
+            save_snapshot(safe_name(str(body.get("name", ""))) or save_id, body.get("snapshot") or {}, save_id)
+    if workers:
+        app.config["SOLVER_WORKERS"] = workers
+        init_solver_pool(app)
+    return TestClientTarget(app)
+
+
+def _print_report(report):
+    print(f"{'route':<28} {'req':>7} {'req/s':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'err':>7}")
+    rows = list(report["routes"].items()) + [("total", report["total"])]
+    for route, row in rows:
+        print(
+            f"{route:<28} {row['requests']:>7} {row['throughput'] or 0:>9.1f} {row['p50Ms'] or 0:>9.1f}"
+            f" {row['p95Ms'] or 0:>9.1f} {row['p99Ms'] or 0:>9.1f} {row['errorRate']:>7.1%}"
+        )
+    print(f"Tid: {report['elapsedS']} s, statuskoder: {report['total']['statuses']}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    entries = load_recording(args.recording)
+    schedule = build_schedule(entries, args.clients)
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.url:
+            target = HttpTarget(args.url)
+            known_saves = None
+        else:
+            known_saves = recorded_saves(entries)
+            target = _local_target(args.workers, str(Path(tmp) / "replay.db"), known_saves)
+        results, elapsed = replay(schedule, target, args.concurrency, args.speedup, known_saves)
+        pool = getattr(target, "app", None) and target.app.extensions.get("solver_pool")
+        if pool:
+            pool.shutdown(wait=True)
+    report = summarize(results, elapsed)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print_report(report)
+    return 1 if report["total"]["errorRate"] > args.max_error_rate else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
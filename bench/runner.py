@@ -0,0 +1,180 @@
+import copy
+import json
+import platform
+import statistics
+import time
+import uuid
+from pathlib import Path
+
+from bench.circuits import GENERATORS
+from sim.cache import clear_caches
+from sim.core import get_ac_frequency, get_terminal_count, simulate_circuit, solve_network
+
+SIZES = {
+    "ladder": (8, 32, 128),
+    "rlc_mesh": (4, 8, 12),
+    "motor_3ph": (4, 16, 64),
+    "plc_io": (1, 2, 4),
+    "half_wired": (8, 32, 128),
+}
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baselines" / "default.json"
+DEFAULT_REPEAT = 15
+MAX_REGRESSION = 0.25
+MIN_DELTA_MS = 2.0
+CONFIRM_ROUNDS = 4
+
+
+def _meter(payload):
+    ac = get_ac_frequency(payload["components"]) is not None
+    for comp in payload["components"]:
+        if comp["type"] in ("voltage_source", "ground", "plc") or get_terminal_count(comp) < 2:
+            continue
+        return {
+            "mode": "ac_voltage" if ac else "voltage",
+            "aRef": {"compId": comp["id"], "index": 0},
+            "bRef": {"compId": comp["id"], "index": 1},
+        }
+    return {"mode": "voltage"}
+
+
+def _measure_target():
+    from app import create_app
+
+    client = create_app().test_client()
+
+    def run(payload):
+        response = client.post("/api/measure", json={**payload, **_meter(payload)})
+        if response.status_code != 200:
+            raise RuntimeError(f"/api/measure svarade {response.status_code}: {response.get_data(as_text=True)}")
+        return response.get_json()
+
+    return run
+
+
+TARGETS = {
+    "solve_network": lambda: solve_network,
+    "simulate_circuit": lambda: simulate_circuit,
+    "measure": _measure_target,
+}
+
+
+# Mean of the middle half of the samples: steadier than the median on a busy
+# machine, and unlike the minimum it still moves when most runs get slower.
+def _trimmed_mean(samples):
+    ordered = sorted(samples)
+    cut = len(ordered) // 4
+    middle = ordered[cut : len(ordered) - cut]
+    return statistics.fmean(middle)
+
+
+# Each repetition gets a fresh copy of the payload. Unless warm is set, the
+# solver caches are cleared and a new session id forces a topology rebuild, so
+# the numbers describe a cold solve.
+def time_target(fn, payload, repeat, warm=False):
+    session_id = uuid.uuid4().hex
+    samples = []
+    for _ in range(repeat):
+        request = copy.deepcopy(payload)
+        request["sessionId"] = session_id if warm else uuid.uuid4().hex
+        if not warm:
+            clear_caches()
+        started = time.perf_counter()
+        fn(request)
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        "trimmedMs": round(_trimmed_mean(samples), 3),
+        "medianMs": round(statistics.median(samples), 3),
+        "minMs": round(min(samples), 3),
+        "repeat": repeat,
+    }
+
+
+def run_benchmarks(scenarios=None, targets=None, sizes=None, repeat=DEFAULT_REPEAT, warm=False, report=None):
+    results = {}
+    for target in targets or TARGETS:
+        fn = TARGETS[target]()
+        for scenario in scenarios or GENERATORS:
+            for size in sizes or SIZES[scenario]:
+                payload = GENERATORS[scenario](size)
+                key = f"{scenario}/{target}/{size}"
+                results[key] = time_target(fn, payload, repeat, warm)
+                if report:
+                    report(key, results[key])
+    return results
+
+
+def load_baseline(path):
+    try:
+        with Path(path).open(encoding="utf-8") as handle:
+            return json.load(handle).get("results", {})
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path, results):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = {
+        "version": 1,
+        "createdAt": int(time.time()),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    with path.open("w", encoding="utf-8") as handle:
+        json.dump(data, handle, indent=2, sort_keys=True)
+        handle.write("\n")
+
+
+def _gated_ms(result):
+    return result.get("trimmedMs", result["medianMs"])
+
+
+# A result regresses when its trimmed mean is more than max_regression slower
+# than the baseline and the difference is also above min_delta_ms, so noise of
+# a millisecond or two on small circuits does not fail the gate.
+def compare(results, baseline, max_regression=MAX_REGRESSION, min_delta_ms=MIN_DELTA_MS):
+    rows = []
+    for key, result in results.items():
+        reference = baseline.get(key)
+        current = _gated_ms(result)
+        if reference is None:
+            rows.append({"key": key, "ms": current, "baselineMs": None, "ratio": None, "regressed": False})
+            continue
+        previous = _gated_ms(reference)
+        ratio = current / previous if previous else None
+        regressed = ratio is not None and ratio > 1 + max_regression and current - previous > min_delta_ms
+        rows.append({"key": key, "ms": current, "baselineMs": previous, "ratio": ratio, "regressed": regressed})
+    return rows
+
+
+# Timings on a shared machine come with bursts of noise that last seconds, so
+# a flagged case is timed rounds more times, interleaved with the other
+# flagged cases, and judged by its median attempt. Keeping the fastest attempt
+# would favour passing against a baseline that was timed only once.
+def confirm_regressions(
+    results,
+    baseline,
+    repeat=DEFAULT_REPEAT,
+    warm=False,
+    max_regression=MAX_REGRESSION,
+    min_delta_ms=MIN_DELTA_MS,
+    rounds=CONFIRM_ROUNDS,
+    report=None,
+):
+    targets = {}
+    flagged = [row["key"] for row in compare(results, baseline, max_regression, min_delta_ms) if row["regressed"]]
+    attempts = {key: [results[key]] for key in flagged}
+    for _ in range(rounds):
+        for key in flagged:
+            scenario, target, size = key.split("/")
+            if target not in targets:
+                targets[target] = TARGETS[target]()
+            retry = time_target(targets[target], GENERATORS[scenario](int(size)), repeat, warm)
+            if report:
+                report(key, retry)
+            attempts[key].append(retry)
+    for key, timings in attempts.items():
+        timings.sort(key=_gated_ms)
+        results[key] = timings[len(timings) // 2]
+    return compare(results, baseline, max_regression, min_delta_ms)
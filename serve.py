@@ -0,0 +1,42 @@
+import argparse
+import os
+
+from api.pool import init_solver_pool
+from app import create_app
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Kör El-labb i produktionsläge.")
+    parser.add_argument("--host", default=os.environ.get("ELLABB_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("ELLABB_PORT", "8080")))
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("ELLABB_THREADS", "16")))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("ELLABB_WORKERS", os.cpu_count() or 1)))
+    parser.add_argument("--queue", type=int, default=None, help="Max antal väntande lösningar (standard: 4 per worker).")
+    parser.add_argument("--deadline", type=float, default=float(os.environ.get("ELLABB_DEADLINE", "5")))
+    parser.add_argument("--record", default=os.environ.get("ELLABB_RECORD"), help="Spela in API-trafik till en JSONL-fil.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    app = create_app(
+        {
+            "SOLVER_WORKERS": args.workers,
+            "SOLVER_QUEUE": args.queue or args.workers * 4,
+            "SOLVER_DEADLINE": args.deadline,
+            "TRAFFIC_RECORD_PATH": args.record,
+        }
+    )
+    init_solver_pool(app)
+    try:
+        from waitress import serve
+    except ImportError:
+        from werkzeug.serving import run_simple
+
+        run_simple(args.host, args.port, app, threaded=True)
+    else:
+        serve(app, host=args.host, port=args.port, threads=args.threads)
+
+
+if __name__ == "__main__":
+    main()
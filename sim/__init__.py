@@ -1,8 +1,10 @@
 from sim.core import (
     Complex,
     build_model_dc,
+    compute_branch_quantities,
     compute_contactor_states,
     compute_faults,
+    compute_impedances,
     compute_lamp_lit,
     compute_motor_running,
     compute_motor3ph_direction,
@@ -11,25 +13,46 @@ from sim.core import (
     compute_timer_states,
     get_ac_frequency,
     get_terminal_count,
+    register_stamp,
+    settle_states,
     simulate_circuit,
+    simulation_response,
     solve_mna,
     solve_network,
 )
+from sim.cache import cache_stats, circuit_key
+from sim.circuit import Circuit, Component, Solution, Solver
+from sim.contingency import contingency_table
+from sim.topology import IncrementalTopology, sync_terminal_nodes
 
 __all__ = [
+    "Circuit",
     "Complex",
+    "Component",
+    "IncrementalTopology",
+    "Solution",
+    "Solver",
     "build_model_dc",
+    "cache_stats",
+    "circuit_key",
+    "compute_branch_quantities",
     "compute_contactor_states",
     "compute_faults",
+    "compute_impedances",
     "compute_lamp_lit",
     "compute_motor_running",
     "compute_motor3ph_direction",
     "compute_plc_states",
     "compute_time_timer_states",
     "compute_timer_states",
+    "contingency_table",
     "get_ac_frequency",
     "get_terminal_count",
+    "register_stamp",
+    "settle_states",
     "simulate_circuit",
+    "simulation_response",
     "solve_mna",
     "solve_network",
+    "sync_terminal_nodes",
 ]
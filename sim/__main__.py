@@ -0,0 +1,129 @@
+import argparse
+import gzip
+import json
+import os
+import sys
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from sim.cache import RUNTIME_PROPS
+from sim.circuit import carry_state
+from sim.core import simulate_circuit
+
+LAB_SUFFIXES = (".json", ".json.gz")
+SKIPPED_FILES = {"index.json"}
+DEFAULT_STEP_MS = 300
+
+
+def lab_paths(inputs):
+    paths = []
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            paths.extend(
+                sorted(
+                    child
+                    for child in path.iterdir()
+                    if child.name.endswith(LAB_SUFFIXES) and child.name not in SKIPPED_FILES
+                )
+            )
+        else:
+            paths.append(path)
+    return paths
+
+
+# Accepts both a saves/ record ({"snapshot": {...}}) and a raw
+# serializeCircuit payload ({"components": [...], "wires": [...]}). Timer and
+# PLC state saved from the browser carries wall-clock timestamps, so it is
+# dropped unless keep_state is set and every lab starts from a clean state.
+def load_lab(path, keep_state=False):
+    opener = gzip.open if path.name.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as handle:
+        data = json.load(handle)
+    circuit = data.get("snapshot", data) if isinstance(data, dict) else None
+    if not isinstance(circuit, dict) or not isinstance(circuit.get("components"), list):
+        raise ValueError("Filen innehåller ingen krets.")
+    payload = {key: circuit[key] for key in ("components", "wires", "simTime") if key in circuit}
+    if not keep_state:
+        payload["components"] = [
+            {**comp, "props": {key: value for key, value in comp.get("props", {}).items() if key not in RUNTIME_PROPS}}
+            for comp in payload["components"]
+        ]
+    return payload
+
+
+def _output(response, full):
+    if full:
+        return response
+    return {key: value for key, value in response.items() if key not in ("solution", "debugInfo", "plcMeta")}
+
+
+def run_lab(path, duration=0.0, step_ms=DEFAULT_STEP_MS, start_ms=None, full=False, trace=False, keep_state=False):
+    try:
+        payload = load_lab(path, keep_state)
+    except (OSError, ValueError) as exc:
+        return [{"file": str(path), "error": str(exc)}]
+    sim_time = start_ms if start_ms is not None else payload.get("simTime", 0)
+    steps = max(1, int(duration * 1000 // step_ms) + 1)
+    session_id = uuid.uuid4().hex
+    by_id = {comp.get("id"): comp for comp in payload["components"]}
+    lines = []
+    for step in range(steps):
+        response = simulate_circuit({**payload, "simTime": sim_time, "sessionId": session_id})
+        if "error" in response:
+            return lines + [{"file": str(path), "step": step, "simTime": sim_time, "error": response["error"]}]
+        if trace or step == steps - 1:
+            lines.append({"file": str(path), "step": step, "simTime": sim_time, **_output(response, full)})
+        carry_state(
+            by_id, response.get("timerStates", {}), response.get("plcStates", {}), response.get("plcMeta", {})
+        )
+        sim_time += step_ms
+    return lines
+
+
+def _run_lab(args):
+    return run_lab(*args)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m sim", description="Kör sparade labbar utan webbläsare.")
+    parser.add_argument("inputs", nargs="+", help="Labbfiler (.json/.json.gz) eller kataloger.")
+    parser.add_argument("--duration", type=float, default=0.0, help="Virtuell tid att simulera, i sekunder.")
+    parser.add_argument("--step", type=int, default=DEFAULT_STEP_MS, help="Tidssteg i millisekunder.")
+    parser.add_argument("--start", type=int, default=None, help="simTime för första steget (ms).")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Antal parallella processer.")
+    parser.add_argument("--trace", action="store_true", help="Skriv en rad per tidssteg, inte bara den sista.")
+    parser.add_argument("--full", action="store_true", help="Ta med lösning, debugInfo och PLC-meta.")
+    parser.add_argument("--keep-state", action="store_true", help="Behåll sparat timer- och PLC-tillstånd.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.step <= 0:
+        print("--step måste vara större än 0.", file=sys.stderr)
+        return 2
+    paths = lab_paths(args.inputs)
+    tasks = [(path, args.duration, args.step, args.start, args.full, args.trace, args.keep_state) for path in paths]
+    failed = 0
+    if args.jobs > 1 and len(tasks) > 1:
+        executor = ProcessPoolExecutor(max_workers=args.jobs)
+        results = executor.map(_run_lab, tasks, chunksize=max(1, len(tasks) // (args.jobs * 8)))
+    else:
+        executor = None
+        results = map(_run_lab, tasks)
+    try:
+        for lines in results:
+            for line in lines:
+                failed += "error" in line
+                sys.stdout.write(json.dumps(line, ensure_ascii=False, separators=(",", ":"), default=str) + "\n")
+            sys.stdout.flush()
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from sim import metrics
+
+RUNTIME_PROPS = ("timerState", "plcState", "plcOutputs")
+
+MISSING = object()
+
+_caches = {}
+
+
+class LRUCache:
+    def __init__(self, name, max_size):
+        self.name = name
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        _caches[name] = self
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key, MISSING)
+            if value is MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+        metrics.CACHE_LOOKUPS.inc((self.name, "miss" if value is MISSING else "hit"))
+        return value
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self.lock:
+            return {"size": len(self.entries), "maxSize": self.max_size, "hits": self.hits, "misses": self.misses}
+
+
+def cache_stats():
+    return {name: cache.stats() for name, cache in _caches.items()}
+
+
+def clear_caches():
+    for cache in _caches.values():
+        cache.clear()
+
+
+def _strip_runtime(comp):
+    props = comp.get("props")
+    if not isinstance(props, dict) or not any(key in props for key in RUNTIME_PROPS):
+        return comp
+    return {**comp, "props": {key: value for key, value in props.items() if key not in RUNTIME_PROPS}}
+
+
+# Hash of everything that shapes the network: components without the runtime
+# state the client echoes back, and wires. simTime, sessionId and the like are
+# deliberately left out.
+def circuit_key(components, wires):
+    canonical = json.dumps(
+        {"components": [_strip_runtime(comp) for comp in components], "wires": wires},
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
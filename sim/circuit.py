@@ -0,0 +1,310 @@
+import copy
+import hashlib
+import itertools
+import json
+
+from sim.cache import MISSING, _strip_runtime
+from sim.core import (
+    compute_lamp_lit,
+    compute_motor_running,
+    get_terminal_count,
+    simulation_response,
+    solve_network,
+)
+from sim.topology import IncrementalTopology
+
+COMPONENT_CLASSES = {}
+
+
+# Components are built from Python instead of payload dicts. Terminal handles
+# are plain integers handed out by Circuit.add, so circuit[...] lookups and
+# connect() calls never build "compId:index" strings.
+class Component:
+    __slots__ = ("id", "props", "base", "count")
+    type = None
+    defaults = {}
+
+    def __init__(self, id=None, **props):
+        self.id = id
+        self.props = {**copy.deepcopy(self.defaults), **props}
+        self.base = None
+        self.count = 0
+
+    def terminal(self, index):
+        if self.base is None:
+            raise ValueError("Komponenten är inte tillagd i en krets.")
+        if not 0 <= index < self.count:
+            raise ValueError(f"{self.id} har ingen anslutning {index}.")
+        return self.base + index
+
+    __getitem__ = terminal
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.id!r})"
+
+
+def _component_class(name, comp_type, **defaults):
+    cls = type(name, (Component,), {"__slots__": (), "type": comp_type, "defaults": defaults})
+    COMPONENT_CLASSES[comp_type] = cls
+    return cls
+
+
+VoltageSource = _component_class(
+    "VoltageSource", "voltage_source", value=12, supplyType="DC", frequency=50, connection="Y", neutral=True
+)
+Ground = _component_class("Ground", "ground")
+Node = _component_class("Node", "node")
+Lamp = _component_class("Lamp", "lamp", value=80, threshold=6, ratedVoltage=12)
+Diode = _component_class("Diode", "diode", forwardVoltage=0.7)
+Varistor = _component_class("Varistor", "varistor", clampVoltage=30, alpha=25)
+Motor = _component_class("Motor", "motor", value=20, startVoltage=6)
+Motor3ph = _component_class("Motor3ph", "motor_3ph", value=12, startVoltage=200, connection="Y")
+Resistor = _component_class("Resistor", "resistor", value=100)
+Capacitor = _component_class("Capacitor", "capacitor", value=1e-6)
+Inductor = _component_class("Inductor", "inductor", value=0.1)
+Switch = _component_class("Switch", "switch", closed=True)
+PushButton = _component_class("PushButton", "push_button", closed=False)
+SwitchSPDT = _component_class("SwitchSPDT", "switch_spdt", position="up")
+Timer = _component_class(
+    "Timer", "timer", delayMs=3000, pullInVoltage=9, coilResistance=120, loop=False, initialClosed=False
+)
+TimeTimer = _component_class("TimeTimer", "time_timer", startTime="08:00", endTime="17:00")
+PLC = _component_class(
+    "PLC", "plc", inputs=4, outputs=4, inputThreshold=9, language="LAD", program="A I1\n= Q1"
+)
+Contactor = _component_class(
+    "Contactor",
+    "contactor",
+    coilResistance=120,
+    pullInVoltage=9,
+    coilRatedVoltage=12,
+    contactType="standard",
+    poles=["NO"],
+)
+
+
+def _component_id(comp):
+    return comp.id if isinstance(comp, Component) else comp
+
+
+class Circuit:
+    __slots__ = ("components", "by_id", "terminals", "wires", "counter")
+
+    def __init__(self):
+        self.components = []
+        self.by_id = {}
+        self.terminals = []
+        self.wires = []
+        self.counter = itertools.count(1)
+
+    def add(self, comp):
+        if comp.base is not None:
+            raise ValueError(f"{comp.id} är redan tillagd i en krets.")
+        if comp.id is None:
+            comp.id = f"{comp.type}{next(self.counter)}"
+        if comp.id in self.by_id:
+            raise ValueError(f"Komponent-id {comp.id} finns redan.")
+        comp.base = len(self.terminals)
+        comp.count = get_terminal_count({"type": comp.type, "props": comp.props})
+        self.terminals.extend((comp.id, index) for index in range(comp.count))
+        self.components.append(comp)
+        self.by_id[comp.id] = comp
+        return comp
+
+    def __getitem__(self, comp_id):
+        return self.by_id[comp_id]
+
+    def _ref(self, handle):
+        if not isinstance(handle, int) or not 0 <= handle < len(self.terminals):
+            raise ValueError(f"Okänd anslutning {handle!r}.")
+        comp_id, index = self.terminals[handle]
+        return {"compId": comp_id, "index": index}
+
+    def connect(self, a, b, *more):
+        refs = [self._ref(handle) for handle in (a, b, *more)]
+        for start, end in zip(refs, refs[1:]):
+            self.wires.append({"id": f"w{len(self.wires) + 1}", "from": start, "to": end})
+        return self
+
+    def payload(self):
+        return {
+            "components": [
+                {"id": comp.id, "type": comp.type, "props": copy.deepcopy(comp.props)} for comp in self.components
+            ],
+            "wires": copy.deepcopy(self.wires),
+        }
+
+    def compile(self, sim_time=0):
+        return Solver(self, sim_time)
+
+    @classmethod
+    def from_payload(cls, payload):
+        circuit = cls()
+        for item in payload.get("components", []):
+            comp_cls = COMPONENT_CLASSES.get(item.get("type"))
+            if comp_cls is None:
+                raise ValueError(f"Okänd komponenttyp {item.get('type')!r}.")
+            comp = comp_cls(item["id"])
+            comp.props = copy.deepcopy(item.get("props", {}))
+            circuit.add(comp)
+        for wire in payload.get("wires", []):
+            a, b = wire["from"], wire["to"]
+            circuit.wires.append({"id": wire.get("id", f"w{len(circuit.wires) + 1}"), "from": dict(a), "to": dict(b)})
+        return circuit
+
+
+def _part(comp):
+    return json.dumps(_strip_runtime(comp), sort_keys=True, separators=(",", ":"), default=str)
+
+
+# Fed back into the props between solves, as requestSimulation does in the
+# browser. Timer states are only kept for "timer"; time_timer state is
+# recomputed from the clock.
+def carry_state(by_id, timer_states, plc_states, plc_meta):
+    for comp_id, timer_state in timer_states.items():
+        if comp_id in by_id and by_id[comp_id].get("type") == "timer":
+            by_id[comp_id].setdefault("props", {})["timerState"] = timer_state
+    for comp_id, outputs in plc_states.items():
+        if comp_id in by_id:
+            by_id[comp_id].setdefault("props", {})["plcOutputs"] = outputs
+    for comp_id, meta in plc_meta.items():
+        if comp_id in by_id:
+            by_id[comp_id].setdefault("props", {})["plcState"] = meta
+
+
+# A compiled circuit. It owns its payload dicts and topology, so a solve only
+# re-hashes the components changed since the last one and the terminal nets
+# are reused as long as no prop changes the terminal count.
+class Solver:
+    __slots__ = ("circuit", "components", "by_id", "wires", "topology", "parts", "wire_part", "key", "sim_time")
+
+    def __init__(self, circuit, sim_time=0):
+        payload = circuit.payload()
+        self.circuit = circuit
+        self.components = payload["components"]
+        self.by_id = {comp["id"]: comp for comp in self.components}
+        self.wires = payload["wires"]
+        self.topology = IncrementalTopology()
+        self.parts = {comp["id"]: _part(comp) for comp in self.components}
+        self.wire_part = json.dumps(self.wires, sort_keys=True, separators=(",", ":"))
+        self.key = None
+        self.sim_time = sim_time
+
+    def _component(self, comp):
+        comp_id = _component_id(comp)
+        if comp_id not in self.by_id:
+            raise ValueError(f"Komponenten {comp_id} finns inte i kretsen.")
+        return self.by_id[comp_id]
+
+    def get_prop(self, comp, name, default=None):
+        return self._component(comp)["props"].get(name, default)
+
+    def set_prop(self, comp, name, value):
+        target = self._component(comp)
+        props = target["props"]
+        count = get_terminal_count(target)
+        previous = props.get(name, MISSING)
+        props[name] = value
+        if get_terminal_count(target) != count:
+            if previous is MISSING:
+                del props[name]
+            else:
+                props[name] = previous
+            raise ValueError(f"{name} ändrar antalet anslutningar; bygg en ny krets.")
+        part = _part(target)
+        if part != self.parts[target["id"]]:
+            self.parts[target["id"]] = part
+            self.key = None
+        return self
+
+    def toggle(self, comp):
+        target = self._component(comp)
+        if target["type"] in ("switch", "push_button"):
+            return self.set_prop(comp, "closed", not target["props"].get("closed", False))
+        if target["type"] == "switch_spdt":
+            return self.set_prop(comp, "position", "down" if target["props"].get("position", "up") == "up" else "up")
+        raise ValueError(f"{target['id']} kan inte växlas.")
+
+    def _circuit_key(self):
+        if self.key is None:
+            digest = hashlib.sha1()
+            for comp in self.components:
+                digest.update(self.parts[comp["id"]].encode("utf-8"))
+                digest.update(b"\n")
+            digest.update(self.wire_part.encode("utf-8"))
+            self.key = "compiled:" + digest.hexdigest()
+        return self.key
+
+    def solve(self, sim_time=None):
+        if sim_time is not None:
+            self.sim_time = sim_time
+        payload = {"components": self.components, "wires": self.wires, "simTime": self.sim_time}
+        result = solve_network(payload, self._circuit_key(), self.topology)
+        if "error" in result:
+            raise ValueError(result["error"])
+        carry_state(self.by_id, result["timer_states"], result["plc_states"], result["plc_meta"])
+        return Solution(self, result)
+
+    def advance(self, ms):
+        return self.solve(self.sim_time + ms)
+
+
+class Solution:
+    __slots__ = ("solver", "result", "derived")
+
+    def __init__(self, solver, result):
+        self.solver = solver
+        self.result = result
+        self.derived = {}
+
+    def _node(self, handle):
+        ref = self.solver.circuit._ref(handle)
+        return self.result["terminal_nodes"].get(f"{ref['compId']}:{ref['index']}")
+
+    def _voltages(self, key):
+        solution = self.result[key]
+        return solution["node_voltages"] if solution else None
+
+    def _between(self, voltages, a, b):
+        if voltages is None:
+            return None
+        na = self._node(a)
+        nb = self._node(b) if b is not None else 0
+        if na is None or nb is None:
+            return None
+        return voltages[na] - voltages[nb]
+
+    def voltage(self, a, b=None):
+        return self._between(self._voltages("dc_solution"), a, b)
+
+    def ac_voltage(self, a, b=None):
+        return self._between(self._voltages("ac_solution"), a, b)
+
+    def _derive(self, name, compute):
+        if name not in self.derived:
+            self.derived[name] = compute(
+                self.result["components"],
+                self.result["terminal_nodes"],
+                self._voltages("dc_solution"),
+                self._voltages("ac_solution"),
+            )
+        return self.derived[name]
+
+    def lamp_lit(self, comp):
+        return self._derive("lamp_lit", compute_lamp_lit).get(_component_id(comp), False)
+
+    def motor_running(self, comp):
+        return self._derive("motor_running", compute_motor_running).get(_component_id(comp), False)
+
+    def contactor_closed(self, comp):
+        return self.result["contactor_states"].get(_component_id(comp), False)
+
+    def plc_outputs(self, comp):
+        return list(self.result["plc_states"].get(_component_id(comp), []))
+
+    @property
+    def errors(self):
+        return self.result["solve_errors"]
+
+    def response(self, branches=False):
+        return simulation_response(self.result, branches)
@@ -0,0 +1,524 @@
+import copy
+import heapq
+import math
+import time
+from collections import Counter
+
+from sim import metrics
+from sim.core import (
+    SHUNT_RESISTANCE,
+    Complex,
+    SolveTimeout,
+    _find_floating_nodes,
+    _model_context,
+    _solve_electrical,
+    assemble_mna,
+    assemble_mna_ac,
+    compute_faults,
+    compute_lamp_lit,
+    compute_motor_running,
+    gaussian_solve,
+    get_ac_frequency,
+    lu_factor,
+    settle_states,
+    stamp_components,
+)
+from sim.topology import get_topology
+
+MAX_UPDATE_RANK = 24
+MAX_REFERENCES = 8
+TOGGLED_TYPES = ("switch", "push_button", "switch_spdt", "contactor")
+
+
+# Nodes with the fewest neighbours are eliminated first (minimum degree), so
+# rails shared by many rungs come last and the LU factors stay sparse. Source
+# currents follow the nodes.
+def _elimination_order(node_count, elements, source_count):
+    n = node_count - 1
+    neighbours = [set() for _ in range(n)]
+    for elem in elements:
+        a = elem["n1"] - 1
+        b = elem["n2"] - 1
+        if a >= 0 and b >= 0 and a != b:
+            neighbours[a].add(b)
+            neighbours[b].add(a)
+    heap = [(len(around), node) for node, around in enumerate(neighbours)]
+    heapq.heapify(heap)
+    eliminated = [False] * n
+    order = []
+    while heap:
+        degree, node = heapq.heappop(heap)
+        if eliminated[node] or degree != len(neighbours[node]):
+            continue
+        eliminated[node] = True
+        order.append(node)
+        around = neighbours[node]
+        for other in around:
+            linked = neighbours[other]
+            linked.discard(node)
+            linked |= around
+            linked.discard(other)
+            heapq.heappush(heap, (len(linked), other))
+        neighbours[node] = set()
+    return order + list(range(n, n + source_count))
+
+
+# One factored MNA system for a reference state. Every node gets a
+# SHUNT_RESISTANCE to ground, so opening a contact never makes the matrix
+# singular; the Woodbury identity then gives the solution with a few contacts
+# changed from one sparse triangular solve per changed node pair, which is
+# cached across contingencies. AC systems are kept in Python's complex type,
+# which does the many small multiplications far faster than Complex, and are
+# converted back in solution().
+class _System:
+    __slots__ = (
+        "analysis",
+        "model",
+        "sources",
+        "n",
+        "size",
+        "rows",
+        "order",
+        "lower",
+        "upper",
+        "diag",
+        "x",
+        "zero",
+        "one",
+        "columns",
+        "adjacency",
+        "floating",
+        "source_nodes",
+    )
+
+    def __init__(self, analysis, model, factorization, order, vector, floating):
+        lu = factorization["lu"] if factorization else []
+        self.analysis = analysis
+        self.model = model
+        self.sources = model["sources"]
+        self.n = model["node_count"] - 1
+        self.size = len(lu)
+        self.order = order
+        self.rows = [order[p] for p in factorization["perm"]] if factorization else []
+        self.lower = [[(j, row[j]) for j in range(i) if abs(row[j]) != 0] for i, row in enumerate(lu)]
+        self.upper = [[(j, row[j]) for j in range(i + 1, self.size) if abs(row[j]) != 0] for i, row in enumerate(lu)]
+        self.diag = [row[i] for i, row in enumerate(lu)]
+        if analysis == "dc":
+            self.zero, self.one = 0.0, 1.0
+        else:
+            self.zero, self.one = 0j, 1 + 0j
+        self.columns = {}
+        self.floating = floating
+        self.source_nodes = {node for src in self.sources for node in (src["n1"], src["n2"])}
+        self.adjacency = {}
+        for elem in model["resistors" if analysis == "dc" else "impedances"] + self.sources:
+            if elem["n1"] is None or elem["n2"] is None or elem["n1"] == elem["n2"]:
+                continue
+            self.adjacency.setdefault(elem["n1"], Counter())[elem["n2"]] += 1
+            self.adjacency.setdefault(elem["n2"], Counter())[elem["n1"]] += 1
+        self.x = self._solve(vector) if factorization else [self.zero] * (self.n + len(self.sources))
+
+    def _solve(self, vector):
+        y = [vector[row] for row in self.rows]
+        for i in range(self.size):
+            acc = y[i]
+            for j, value in self.lower[i]:
+                acc = acc - value * y[j]
+            y[i] = acc
+        for i in range(self.size - 1, -1, -1):
+            acc = y[i]
+            for j, value in self.upper[i]:
+                acc = acc - value * y[j]
+            y[i] = acc / self.diag[i]
+        x = [self.zero] * self.size
+        for i, index in enumerate(self.order):
+            x[index] = y[i]
+        return x
+
+    def _column(self, pair):
+        column = self.columns.get(pair)
+        if column is None:
+            rhs = [self.zero] * self.size
+            a, b = pair
+            if a > 0:
+                rhs[a - 1] = self.one
+            if b > 0:
+                rhs[b - 1] = rhs[b - 1] - self.one
+            column = self.columns[pair] = self._solve(rhs)
+        return column
+
+    def _across(self, vector, pair):
+        a, b = pair
+        return (vector[a - 1] if a > 0 else self.zero) - (vector[b - 1] if b > 0 else self.zero)
+
+    def solution(self, x):
+        zero = self.zero
+        if self.analysis == "ac":
+            zero, x = Complex(0, 0), [Complex(value.real, value.imag) for value in x]
+        return {
+            "node_voltages": [zero] + x[: self.n],
+            "source_currents": {src["id"]: x[self.n + idx] for idx, src in enumerate(self.sources)},
+        }
+
+    def update(self, changes):
+        if not changes or not self.sources:
+            return self.solution(self.x)
+        columns = [self._column(pair) for pair, _ in changes]
+        matrix = []
+        rhs = []
+        for i, (pair, g) in enumerate(changes):
+            row = [self._across(column, pair) for column in columns]
+            row[i] = row[i] + self.one / g
+            matrix.append(row)
+            rhs.append(self._across(self.x, pair))
+        coefficients = gaussian_solve(matrix, rhs)
+        if coefficients is None:
+            return None
+        x = list(self.x)
+        for column, coefficient in zip(columns, coefficients):
+            for k in range(self.size):
+                x[k] = x[k] - column[k] * coefficient
+        return self.solution(x)
+
+    def _neighbours(self, node, extra):
+        linked = self.adjacency.get(node, {})
+        change = extra.get(node)
+        if not change:
+            return list(linked)
+        found = [other for other, count in linked.items() if count + change.get(other, 0) > 0]
+        found.extend(other for other, count in change.items() if count > 0 and other not in linked)
+        return found
+
+    def _reach(self, start, extra):
+        seen = {start}
+        stack = self._neighbours(start, extra)
+        while stack and 0 not in seen:
+            node = stack.pop()
+            if node not in seen:
+                seen.add(node)
+                stack.extend(self._neighbours(node, extra))
+        return seen
+
+    # The shunts only give the full solve's answer while every part cut off
+    # from ground is also cut off from the sources; the full solve then leaves
+    # it at 0 V. Removing the last contact to such a part is ill-conditioned
+    # as an update, so the part is tied to ground through the same conductance
+    # instead, which gives it 0 V as well. Changes at floating nodes, or that
+    # cut off a source, are left to the full solve.
+    def ground_ties(self, changes, edges):
+        if not self.sources:
+            return []
+        extra = {}
+        for (a, b), count in edges.items():
+            if a in self.floating or b in self.floating:
+                return None
+            extra.setdefault(a, Counter())[b] += count
+            extra.setdefault(b, Counter())[a] += count
+        conductances = dict(changes)
+        ties = []
+        islands = []
+        for pair, count in edges.items():
+            if count >= 0 or pair not in conductances:
+                continue
+            for node in pair:
+                if node == 0 or any(node in island for island in islands):
+                    continue
+                seen = self._reach(node, extra)
+                if 0 in seen:
+                    continue
+                if seen & self.source_nodes:
+                    return None
+                islands.append(seen)
+                ties.append(((0, node), self.zero - conductances[pair]))
+        return ties
+
+
+def _factor_system(analysis, model):
+    if model["devices"]:
+        return None
+    elements = model["resistors"] if analysis == "dc" else model["impedances"]
+    sources = model["sources"]
+    node_count = model["node_count"]
+    floating, _, _ = _find_floating_nodes(node_count, elements + sources)
+    if any(src["n1"] in floating or src["n2"] in floating for src in sources):
+        return None
+    if not sources:
+        return _System(analysis, model, None, [], None, floating)
+    if analysis == "dc":
+        shunts = [{"n1": node, "n2": 0, "value": SHUNT_RESISTANCE} for node in range(1, node_count)]
+        matrix, vector = assemble_mna(node_count, elements + shunts, sources)
+    else:
+        shunts = [{"n1": node, "n2": 0, "value": Complex(SHUNT_RESISTANCE, 0)} for node in range(1, node_count)]
+        matrix, vector = assemble_mna_ac(node_count, elements + shunts, sources)
+        matrix = [[complex(value.re, value.im) for value in row] for row in matrix]
+        vector = [complex(value.re, value.im) for value in vector]
+    order = _elimination_order(node_count, [elem for elem in elements if elem["n1"] is not None], len(sources))
+    factorization = lu_factor([[matrix[i][j] for j in order] for i in order])
+    if factorization is None:
+        return None
+    return _System(analysis, model, factorization, order, vector, floating)
+
+
+def _stamp_subset(analysis, model, components, states, omega):
+    ctx = _model_context(analysis, model, *states)
+    if analysis == "ac":
+        ctx["real"] = lambda value: Complex(value, 0)
+        ctx["omega"] = omega
+    stamp_components(components, ctx)
+    return ctx["elements"]
+
+
+def _element_key(elem):
+    value = elem["value"]
+    a, b = sorted((elem["n1"], elem["n2"]))
+    return a, b, (value.re, value.im) if isinstance(value, Complex) else value
+
+
+# Restamped elements of the changed components, net of what they stamped in
+# the reference state, as a conductance per node pair and an edge count delta.
+def _element_delta(analysis, before, after):
+    net = Counter(_element_key(elem) for elem in after if elem["n1"] != elem["n2"])
+    net.subtract(_element_key(elem) for elem in before if elem["n1"] != elem["n2"])
+    conductances = {}
+    edges = Counter()
+    for (a, b, value), count in net.items():
+        if count == 0:
+            continue
+        if analysis == "dc":
+            g = count / max(value, 1e-9)
+        else:
+            g = count / (complex(*value) or 1e-9)
+        conductances[(a, b)] = conductances[(a, b)] + g if (a, b) in conductances else g
+        edges[(a, b)] += count
+    return [(pair, g) for pair, g in conductances.items() if abs(g) > 1e-15], edges
+
+
+class _Reference:
+    __slots__ = ("overrides", "states", "stage", "systems")
+
+    def __init__(self, overrides, states, stage, systems):
+        self.overrides = overrides
+        self.states = states
+        self.stage = stage
+        self.systems = systems
+
+    def changed(self, overrides, states):
+        contactor_states, timer_states, plc_states = states
+        ref_contactors, ref_timers, ref_plcs = self.states
+        changed = [
+            comp_id
+            for comp_id in set(overrides) | set(self.overrides)
+            if overrides.get(comp_id) is not self.overrides.get(comp_id)
+        ]
+        changed.extend(comp_id for comp_id, on in contactor_states.items() if ref_contactors.get(comp_id) != on)
+        changed.extend(
+            comp_id
+            for comp_id, state in timer_states.items()
+            if bool(state.get("outputClosed")) != bool(ref_timers.get(comp_id, {}).get("outputClosed"))
+        )
+        changed.extend(comp_id for comp_id, outputs in plc_states.items() if ref_plcs.get(comp_id) != outputs)
+        return changed
+
+
+# Solves the states a contingency passes through against the closest
+# reference: the reference states are the fixed-point iterations of the
+# unmodified circuit, so a toggle usually differs from one of them by a couple
+# of contacts. Circuits the update cannot handle (nonlinear devices,
+# singular or floating sources) and large changes go through _solve_electrical.
+class _Network:
+    def __init__(self, components, wires, freq, terminal_data, deadline=None):
+        self.by_id = {comp["id"]: comp for comp in components}
+        self.wires = wires
+        self.freq = freq
+        self.omega = max(2 * math.pi * freq, 1e-6) if freq is not None else None
+        self.terminal_data = terminal_data
+        self.deadline = deadline
+        self.references = []
+        self.supported = True
+        self.stats = Counter()
+
+    def electrical(self, components, overrides):
+        def solve(contactor_states, timer_states, plc_states, timings):
+            return self.stage(components, overrides, (contactor_states, timer_states, plc_states))
+
+        return solve
+
+    def _full(self, components, states):
+        self.stats["full"] += 1
+        metrics.CONTINGENCY_SOLVES.inc(("full",))
+        return _solve_electrical(
+            components, self.wires, *states, self.freq, self.terminal_data, deadline=self.deadline
+        )
+
+    def stage(self, components, overrides, states):
+        if not self.supported:
+            return self._full(components, states)
+        best = None
+        for ref in self.references:
+            changed = ref.changed(overrides, states)
+            if best is None or len(changed) < len(best[1]):
+                best = (ref, changed)
+        if best is not None and best[0].systems is not None:
+            stage = self._update(best[0], best[1], overrides, states)
+            if stage is not None:
+                self.stats["lowRank"] += 1
+                metrics.CONTINGENCY_SOLVES.inc(("low_rank",))
+                return stage
+        if len(self.references) >= MAX_REFERENCES or (best is not None and not best[1]):
+            return self._full(components, states)
+        stage = self._full(components, states)
+        if "error" in stage:
+            return stage
+        systems = {}
+        for analysis in ("dc", "ac"):
+            model = stage[f"{analysis}_model"]
+            if model is None:
+                continue
+            system = _factor_system(analysis, model)
+            if system is None:
+                systems = None
+                break
+            systems[analysis] = system
+        if systems is None and not self.references:
+            self.supported = False
+        self.references.append(_Reference(overrides, states, stage, systems))
+        return stage
+
+    def _update(self, ref, changed, overrides, states):
+        before = [ref.overrides.get(comp_id) or self.by_id[comp_id] for comp_id in changed]
+        after = [overrides.get(comp_id) or self.by_id[comp_id] for comp_id in changed]
+        solutions = {}
+        for analysis, system in ref.systems.items():
+            changes, edges = _element_delta(
+                analysis,
+                _stamp_subset(analysis, system.model, before, ref.states, self.omega),
+                _stamp_subset(analysis, system.model, after, states, self.omega),
+            )
+            ties = system.ground_ties(changes, edges)
+            if ties is None or len(changes) + len(ties) > MAX_UPDATE_RANK:
+                return None
+            solution = system.update(changes + ties)
+            if solution is None:
+                return None
+            solutions[analysis] = solution
+        return {
+            **ref.stage,
+            "dc_solution": solutions.get("dc", ref.stage["dc_solution"]),
+            "ac_solution": solutions.get("ac", ref.stage["ac_solution"]),
+        }
+
+
+def _toggle(comp, contactor_states):
+    props = comp.get("props", {})
+    comp_type = comp.get("type")
+    if comp_type in ("switch", "push_button"):
+        closed = not props.get("closed", False)
+        return ("close" if closed else "open"), {**comp, "props": {**props, "closed": closed}}, None
+    if comp_type == "switch_spdt":
+        position = "down" if props.get("position", "up") == "up" else "up"
+        return position, {**comp, "props": {**props, "position": position}}, None
+    energized = not contactor_states.get(comp["id"], False)
+    return ("energize" if energized else "release"), None, {comp["id"]: energized}
+
+
+# PLC programs keep timer, counter and edge state in their props, so every run
+# gets its own copy.
+def _isolated(components, override=None):
+    isolated = []
+    for comp in components:
+        if override is not None and comp["id"] == override["id"]:
+            comp = override
+        if comp.get("type") == "plc":
+            comp = {**comp, "props": copy.deepcopy(comp.get("props", {}))}
+        isolated.append(comp)
+    return isolated
+
+
+def _outcome(components, settled):
+    stage = settled["stage"]
+    terminal_nodes = stage["dc_model"]["terminal_nodes"]
+    dc_voltages = stage["dc_solution"]["node_voltages"] if stage["dc_solution"] else None
+    ac_voltages = stage["ac_solution"]["node_voltages"] if stage["ac_solution"] else None
+    return {
+        "contactorStates": settled["contactor_states"],
+        "lampLit": compute_lamp_lit(components, terminal_nodes, dc_voltages, ac_voltages),
+        "motorRunning": compute_motor_running(components, terminal_nodes, dc_voltages, ac_voltages),
+        "faults": compute_faults(components, terminal_nodes, dc_voltages, ac_voltages),
+        "solveErrors": settled["solve_errors"],
+    }
+
+
+def _changes(outcome, base):
+    changes = {}
+    for field, values in outcome.items():
+        reference = base[field]
+        diff = {
+            key: values.get(key)
+            for key in sorted(set(values) | set(reference))
+            if values.get(key) != reference.get(key)
+        }
+        if diff:
+            changes[field] = diff
+    return changes
+
+
+# One row per switch, push button, changeover switch and contactor: the state
+# of the circuit with only that element toggled, as the difference from the
+# base state. Contactors are held in the opposite state, as if pushed in or
+# held open by hand.
+def contingency_table(payload):
+    started = time.perf_counter()
+    components = payload.get("components", [])
+    wires = payload.get("wires", [])
+    sim_time = payload.get("simTime")
+    deadline = payload.get("deadline")
+    freq = get_ac_frequency(components)
+    if isinstance(freq, dict):
+        return freq
+    topology = get_topology(payload.get("sessionId"))
+    with topology.lock:
+        terminal_data = topology.sync(components, wires)
+    network = _Network(components, wires, freq, terminal_data, deadline)
+
+    base_components = _isolated(components)
+    settled = settle_states(base_components, sim_time, network.electrical(base_components, {}))
+    if "error" in settled:
+        return settled
+    base = _outcome(base_components, settled)
+
+    rows = []
+    partial = False
+    for comp in components:
+        if comp.get("type") not in TOGGLED_TYPES:
+            continue
+        if deadline is not None and time.time() >= deadline:
+            partial = True
+            break
+        action, override, forced = _toggle(comp, base["contactorStates"])
+        overrides = {comp["id"]: override} if override is not None else {}
+        toggled = _isolated(components, override)
+        try:
+            settled = settle_states(toggled, sim_time, network.electrical(toggled, overrides), forced=forced)
+        except SolveTimeout:
+            partial = True
+            break
+        row = {"componentId": comp["id"], "type": comp["type"], "action": action}
+        if "error" in settled:
+            row["error"] = settled["error"]
+        else:
+            row["changes"] = _changes(_outcome(toggled, settled), base)
+        rows.append(row)
+
+    response = {
+        "base": base,
+        "contingencies": rows,
+        "debugInfo": {
+            "references": len(network.references),
+            "lowRank": network.stats["lowRank"],
+            "full": network.stats["full"],
+            "ms": (time.perf_counter() - started) * 1000,
+        },
+    }
+    if partial:
+        response["partial"] = True
+    return response
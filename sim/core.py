@@ -1,10 +1,38 @@
 import math
 import time
+from collections import Counter
+
+from sim import metrics
+from sim.cache import MISSING, LRUCache, circuit_key
+from sim.profiling import PROFILE_DUMP_KEY, add_phase, profile_level, run_cprofile
+from sim.terminals import (
+    contactor_layout,
+    contactor_layout_key,
+    get_terminal_count,
+    motor3ph_layout,
+    plc_io_counts,
+    plc_layout,
+    three_terminal_layout,
+    timer_layout,
+    two_terminal_layout,
+    voltage_source_layout,
+)
+from sim.topology import get_topology
 
 EPSILON_V = 1e-2
 FAULT_MIN_V = 0.1
 FAULT_TOLERANCE = 0.1
 SHUNT_RESISTANCE = 1e9
+TIME_DEPENDENT_TYPES = {"timer", "time_timer", "plc"}
+
+SOLVE_CACHE = LRUCache("solves", 256)
+RESULT_CACHE = LRUCache("results", 128)
+
+
+# Raised from inside a factorization once the request deadline has passed, so
+# a single large solve cannot hold a worker past its time budget.
+class SolveTimeout(Exception):
+    pass
 
 class Complex:
     def __init__(self, re=0.0, im=0.0):
@@ -46,43 +74,6 @@ def complex_from_polar(magnitude, degrees):
     return Complex(magnitude * math.cos(angle), magnitude * math.sin(angle))
 
 
-
-def get_terminal_count(component):
-    comp_type = component.get("type")
-    if comp_type == "contactor":
-        props = component.get("props", {})
-        poles = props.get("poles") or ["NO"]
-        if props.get("contactType", "standard") == "changeover":
-            return 2 + 3 * len(poles)
-        return 2 + 2 * len(poles)
-    if comp_type == "timer":
-        return 5
-    if comp_type == "time_timer":
-        return 3
-    if comp_type == "plc":
-        props = component.get("props", {})
-        inputs = max(1, min(64, int(props.get("inputs", 4))))
-        outputs = max(1, min(64, int(props.get("outputs", 4))))
-        return 2 + inputs + outputs
-    if comp_type == "voltage_source":
-        props = component.get("props", {})
-        supply = props.get("supplyType", "DC")
-        if supply == "AC3":
-            if props.get("connection", "Y") == "Delta":
-                return 3
-            return 4
-        return 2
-    if comp_type == "switch_spdt":
-        return 3
-    if comp_type == "motor_3ph":
-        return 3
-    if comp_type == "node":
-        return 4
-    if comp_type == "ground":
-        return 1
-    return 2
-
-
 def _terminal_exists(component, index):
     return index < get_terminal_count(component)
 
@@ -185,356 +176,347 @@ def build_terminal_nodes(components, wires, contactor_states):
     return {"terminal_nodes": terminal_nodes, "node_count": node_count + 1, "virtual_ground": virtual_ground}
 
 
-def build_model_dc(components, wires, contactor_states, timer_states, plc_states):
-    terminal_data = build_terminal_nodes(components, wires, contactor_states)
-    if "error" in terminal_data:
-        return terminal_data
+CONTACT_RESISTANCE = 0.01
+LAYOUT_CACHE_SIZE = 4096
+
+STAMP_HANDLERS = {}
+_layout_cache = {}
 
-    terminal_nodes = terminal_data["terminal_nodes"]
-    node_count = terminal_data["node_count"]
-    resistors = []
-    sources = []
 
+def register_stamp(comp_type, layout, dc=None, ac=None, layout_key=None):
+    STAMP_HANDLERS[comp_type] = {"layout": layout, "layout_key": layout_key, "dc": dc, "ac": ac}
+    stale = [key for key in _layout_cache if key[1] == comp_type]
+    for key in stale:
+        del _layout_cache[key]
+
+
+def _component_layout(comp, handler):
+    props = comp.get("props", {})
+    layout_key = handler["layout_key"](props) if handler["layout_key"] else None
+    key = (comp["id"], comp.get("type"), layout_key)
+    layout = _layout_cache.get(key)
+    if layout is None:
+        if len(_layout_cache) >= LAYOUT_CACHE_SIZE:
+            _layout_cache.clear()
+        layout = handler["layout"](comp["id"], props)
+        _layout_cache[key] = layout
+    return layout
+
+
+def _group_by_type(components):
+    groups = {}
     for comp in components:
-        comp_type = comp.get("type")
-        props = comp.get("props", {})
-        count = get_terminal_count(comp)
-        n1 = terminal_nodes.get(f"{comp['id']}:0")
-        n2 = terminal_nodes.get(f"{comp['id']}:1") if count > 1 else None
+        handler = STAMP_HANDLERS.get(comp.get("type"))
+        if handler is None:
+            continue
+        groups.setdefault(comp.get("type"), []).append(
+            (comp, comp.get("props", {}), _component_layout(comp, handler))
+        )
+    return groups
 
-        if comp_type == "resistor":
-            if n1 is None or n2 is None:
-                continue
-            resistors.append({"n1": n1, "n2": n2, "value": props.get("value", 1)})
-        elif comp_type == "switch":
-            if props.get("closed", False):
-                if n1 is None or n2 is None:
-                    continue
-                resistors.append({"n1": n1, "n2": n2, "value": 0.01})
-        elif comp_type == "push_button":
-            if props.get("closed", False):
-                if n1 is None or n2 is None:
-                    continue
-                resistors.append({"n1": n1, "n2": n2, "value": 0.01})
-        elif comp_type == "switch_spdt":
-            if n1 is None:
-                continue
-            n_up = terminal_nodes.get(f"{comp['id']}:1")
-            n_down = terminal_nodes.get(f"{comp['id']}:2")
-            position = props.get("position", "up")
-            if position == "up" and n_up is not None:
-                resistors.append({"n1": n1, "n2": n_up, "value": 0.01})
-            elif position != "up" and n_down is not None:
-                resistors.append({"n1": n1, "n2": n_down, "value": 0.01})
-        elif comp_type == "inductor":
-            if n1 is None or n2 is None:
-                continue
-            resistors.append({"n1": n1, "n2": n2, "value": 0.01})
-        elif comp_type == "motor":
-            if n1 is None or n2 is None:
-                continue
-            resistors.append({"n1": n1, "n2": n2, "value": props.get("value", 10)})
-        elif comp_type == "motor_3ph":
+
+def stamp_components(components, ctx):
+    analysis = ctx["analysis"]
+    for comp_type, entries in _group_by_type(components).items():
+        stamp = STAMP_HANDLERS[comp_type][analysis]
+        if stamp is not None:
+            stamp(entries, ctx)
+
+
+def _add_element(ctx, n1, n2, value, comp_id, role="main"):
+    if n1 is None or n2 is None:
+        return
+    ctx["elements"].append({"n1": n1, "n2": n2, "value": value, "comp": comp_id, "role": role})
+
+
+def _add_contact(ctx, n1, n2, comp_id, role="main"):
+    _add_element(ctx, n1, n2, ctx["real"](CONTACT_RESISTANCE), comp_id, role)
+
+
+def _stamp_fixed(default):
+    def stamp(entries, ctx):
+        nodes = ctx["terminal_nodes"]
+        real = ctx["real"]
+        for comp, props, (k1, k2) in entries:
+            _add_element(ctx, nodes.get(k1), nodes.get(k2), real(props.get("value", default)), comp["id"])
+
+    return stamp
+
+
+def _stamp_switch(entries, ctx):
+    nodes = ctx["terminal_nodes"]
+    for comp, props, (k1, k2) in entries:
+        if props.get("closed", False):
+            _add_contact(ctx, nodes.get(k1), nodes.get(k2), comp["id"])
+
+
+def _stamp_switch_spdt(entries, ctx):
+    nodes = ctx["terminal_nodes"]
+    for comp, props, (k_common, k_up, k_down) in entries:
+        target = k_up if props.get("position", "up") == "up" else k_down
+        _add_contact(ctx, nodes.get(k_common), nodes.get(target), comp["id"])
+
+
+def _stamp_inductor_dc(entries, ctx):
+    nodes = ctx["terminal_nodes"]
+    for comp, props, (k1, k2) in entries:
+        _add_contact(ctx, nodes.get(k1), nodes.get(k2), comp["id"])
+
+
+def _stamp_inductor_ac(entries, ctx):
+    nodes = ctx["terminal_nodes"]
+    omega = ctx["omega"]
+    for comp, props, (k1, k2) in entries:
+        inductance = max(props.get("value", 0.0), 1e-12)
+        _add_element(ctx, nodes.get(k1), nodes.get(k2), Complex(0, omega * inductance), comp["id"])
+
+
+def _stamp_capacitor_ac(entries, ctx):
+    nodes = ctx["terminal_nodes"]
+    omega = ctx["omega"]
+    for comp, props, (k1, k2) in entries:
+        capacitance = max(props.get("value", 0.0), 1e-12)
+        _add_element(ctx, nodes.get(k1), nodes.get(k2), Complex(0, -1 / (omega * capacitance)), comp["id"])
+
+
+def _stamp_motor3ph_ac(entries, ctx):
+    nodes = ctx["terminal_nodes"]
+    for comp, props, (k_l1, k_l2, k_l3, k_internal) in entries:
+        n_l1 = nodes.get(k_l1)
+        n_l2 = nodes.get(k_l2)
+        n_l3 = nodes.get(k_l3)
+        if n_l1 is None or n_l2 is None or n_l3 is None:
             continue
-        elif comp_type == "lamp":
-            if n1 is None or n2 is None:
-                continue
-            resistors.append({"n1": n1, "n2": n2, "value": props.get("value", 80)})
-        elif comp_type == "contactor":
-            coil_n1 = terminal_nodes.get(f"{comp['id']}:0")
-            coil_n2 = terminal_nodes.get(f"{comp['id']}:1")
-            if coil_n1 is not None and coil_n2 is not None:
-                resistors.append(
-                    {"n1": coil_n1, "n2": coil_n2, "value": props.get("coilResistance", 120)}
-                )
-            poles = props.get("poles") or ["NO"]
-            energized = contactor_states.get(comp["id"], False)
-            if props.get("contactType", "standard") == "changeover":
-                for idx in range(len(poles)):
-                    n_common = terminal_nodes.get(f"{comp['id']}:{2 + idx * 3}")
-                    n_no = terminal_nodes.get(f"{comp['id']}:{3 + idx * 3}")
-                    n_nc = terminal_nodes.get(f"{comp['id']}:{4 + idx * 3}")
-                    target = n_no if energized else n_nc
-                    if n_common is None or target is None:
-                        continue
-                    resistors.append({"n1": n_common, "n2": target, "value": 0.01})
-            else:
-                for idx, pole in enumerate(poles):
-                    closed = pole == "NO" if energized else pole == "NC"
-                    if not closed:
-                        continue
-                    n1_pole = terminal_nodes.get(f"{comp['id']}:{2 + idx * 2}")
-                    n2_pole = terminal_nodes.get(f"{comp['id']}:{3 + idx * 2}")
-                    if n1_pole is None or n2_pole is None:
-                        continue
-                    resistors.append({"n1": n1_pole, "n2": n2_pole, "value": 0.01})
-        elif comp_type == "timer":
-            coil_n1 = terminal_nodes.get(f"{comp['id']}:0")
-            coil_n2 = terminal_nodes.get(f"{comp['id']}:1")
-            if coil_n1 is not None and coil_n2 is not None:
-                resistors.append(
-                    {"n1": coil_n1, "n2": coil_n2, "value": props.get("coilResistance", 120)}
+        z = Complex(props.get("value", 12), 0)
+        if props.get("connection", "Y") == "Y":
+            internal = nodes.get(k_internal)
+            if internal is None:
+                internal = ctx["node_count"]
+                nodes[k_internal] = internal
+                ctx["node_count"] += 1
+            _add_element(ctx, n_l1, internal, z, comp["id"], "L1")
+            _add_element(ctx, n_l2, internal, z, comp["id"], "L2")
+            _add_element(ctx, n_l3, internal, z, comp["id"], "L3")
+        else:
+            _add_element(ctx, n_l1, n_l2, z, comp["id"], "L1L2")
+            _add_element(ctx, n_l2, n_l3, z, comp["id"], "L2L3")
+            _add_element(ctx, n_l3, n_l1, z, comp["id"], "L3L1")
+
+
+def _stamp_contactor(entries, ctx):
+    nodes = ctx["terminal_nodes"]
+    real = ctx["real"]
+    states = ctx["contactor_states"]
+    for comp, props, (coil, poles) in entries:
+        _add_element(
+            ctx, nodes.get(coil[0]), nodes.get(coil[1]), real(props.get("coilResistance", 120)), comp["id"], "coil"
+        )
+        energized = states.get(comp["id"], False)
+        if props.get("contactType", "standard") == "changeover":
+            for idx, (k_common, k_no, k_nc) in enumerate(poles):
+                _add_contact(
+                    ctx, nodes.get(k_common), nodes.get(k_no if energized else k_nc), comp["id"], f"pole{idx + 1}"
                 )
-            state = timer_states.get(comp["id"], {})
-            output_closed = state.get("outputClosed", False)
-            n_common = terminal_nodes.get(f"{comp['id']}:2")
-            n_no = terminal_nodes.get(f"{comp['id']}:3")
-            n_nc = terminal_nodes.get(f"{comp['id']}:4")
-            target = n_no if output_closed else n_nc
-            if n_common is not None and target is not None:
-                resistors.append({"n1": n_common, "n2": target, "value": 0.01})
-        elif comp_type == "time_timer":
-            state = timer_states.get(comp["id"], {})
-            output_closed = state.get("outputClosed", False)
-            n_common = terminal_nodes.get(f"{comp['id']}:0")
-            n_no = terminal_nodes.get(f"{comp['id']}:1")
-            n_nc = terminal_nodes.get(f"{comp['id']}:2")
-            target = n_no if output_closed else n_nc
-            if n_common is not None and target is not None:
-                resistors.append({"n1": n_common, "n2": target, "value": 0.01})
-        elif comp_type == "plc":
-            outputs_state = plc_states.get(comp["id"], [])
-            props = comp.get("props", {})
-            inputs = max(1, min(64, int(props.get("inputs", 4))))
-            outputs = max(1, min(64, int(props.get("outputs", 4))))
-            node_m = terminal_nodes.get(f"{comp['id']}:0")
-            node_l = terminal_nodes.get(f"{comp['id']}:1")
-            if node_l is None:
-                continue
-            for idx in range(outputs):
-                if idx >= len(outputs_state) or not outputs_state[idx]:
-                    continue
-                n_out = terminal_nodes.get(f"{comp['id']}:{2 + inputs + idx}")
-                if n_out is None:
-                    continue
-                resistors.append({"n1": node_l, "n2": n_out, "value": 0.01})
-        elif comp_type == "voltage_source":
-            if props.get("supplyType", "DC") != "DC":
-                continue
-            if n1 is None or n2 is None:
-                continue
-            sources.append(
-                {"n1": n1, "n2": n2, "value": props.get("value", 0), "id": comp["id"]}
-            )
-        elif comp_type == "switch_spdt":
-            if n1 is None:
-                continue
-            n_up = terminal_nodes.get(f"{comp['id']}:1")
-            n_down = terminal_nodes.get(f"{comp['id']}:2")
-            position = props.get("position", "up")
-            if position == "up" and n_up is not None:
-                resistors.append({"n1": n1, "n2": n_up, "value": 0.01})
-            elif position != "up" and n_down is not None:
-                resistors.append({"n1": n1, "n2": n_down, "value": 0.01})
+        else:
+            for idx, (pole, (k1, k2)) in enumerate(zip(props.get("poles") or ["NO"], poles)):
+                closed = pole == "NO" if energized else pole == "NC"
+                if closed:
+                    _add_contact(ctx, nodes.get(k1), nodes.get(k2), comp["id"], f"pole{idx + 1}")
+
+
+def _stamp_timer(entries, ctx):
+    nodes = ctx["terminal_nodes"]
+    real = ctx["real"]
+    states = ctx["timer_states"]
+    for comp, props, (k_coil1, k_coil2, k_common, k_no, k_nc) in entries:
+        _add_element(
+            ctx, nodes.get(k_coil1), nodes.get(k_coil2), real(props.get("coilResistance", 120)), comp["id"], "coil"
+        )
+        output_closed = states.get(comp["id"], {}).get("outputClosed", False)
+        _add_contact(ctx, nodes.get(k_common), nodes.get(k_no if output_closed else k_nc), comp["id"], "contact")
+
 
+def _stamp_time_timer(entries, ctx):
+    nodes = ctx["terminal_nodes"]
+    states = ctx["timer_states"]
+    for comp, props, (k_common, k_no, k_nc) in entries:
+        output_closed = states.get(comp["id"], {}).get("outputClosed", False)
+        _add_contact(ctx, nodes.get(k_common), nodes.get(k_no if output_closed else k_nc), comp["id"])
+
+
+def _stamp_plc(entries, ctx):
+    nodes = ctx["terminal_nodes"]
+    states = ctx["plc_states"]
+    for comp, props, (k_m, k_l, k_inputs, k_outputs) in entries:
+        node_l = nodes.get(k_l)
+        if node_l is None:
+            continue
+        outputs_state = states.get(comp["id"], [])
+        for idx, (on, k_out) in enumerate(zip(outputs_state, k_outputs)):
+            if on:
+                _add_contact(ctx, node_l, nodes.get(k_out), comp["id"], f"Q{idx + 1}")
+
+
+def _add_device(ctx, n1, n2, comp_id, kind, params):
+    if n1 is None or n2 is None:
+        return
+    ctx["devices"].append({"n1": n1, "n2": n2, "comp": comp_id, "role": "main", "kind": kind, "params": params})
+
+
+# Lamps stay a fixed resistance unless coldResistance is set below value.
+def _stamp_lamp(entries, ctx):
+    nodes = ctx["terminal_nodes"]
+    for comp, props, (k1, k2) in entries:
+        hot = float(props.get("value", 80))
+        cold = float(props.get("coldResistance") or 0)
+        if 0 < cold < hot:
+            rated = max(float(props.get("ratedVoltage", 12)), 1e-6)
+            _add_device(ctx, nodes.get(k1), nodes.get(k2), comp["id"], "lamp", (cold, hot, rated))
+        else:
+            _add_element(ctx, nodes.get(k1), nodes.get(k2), ctx["real"](hot), comp["id"])
+
+
+# Terminal 0 is the anode. forwardVoltage is the drop at 10 mA.
+def _stamp_diode(entries, ctx):
+    nodes = ctx["terminal_nodes"]
+    nvt = DIODE_EMISSION * THERMAL_VOLTAGE
+    for comp, props, (k1, k2) in entries:
+        forward = max(float(props.get("forwardVoltage", 0.7)), 0.05)
+        saturation = DIODE_REFERENCE_CURRENT / math.expm1(forward / nvt)
+        _add_device(ctx, nodes.get(k1), nodes.get(k2), comp["id"], "diode", (saturation, nvt))
+
+
+# clampVoltage is the voltage at 1 mA; alpha sets how sharp the knee is.
+def _stamp_varistor(entries, ctx):
+    nodes = ctx["terminal_nodes"]
+    for comp, props, (k1, k2) in entries:
+        clamp = max(float(props.get("clampVoltage", 30)), 1e-3)
+        alpha = min(max(float(props.get("alpha", 25)), 1.0), 60.0)
+        _add_device(ctx, nodes.get(k1), nodes.get(k2), comp["id"], "varistor", (clamp, alpha))
+
+
+def _stamp_voltage_source_dc(entries, ctx):
+    nodes = ctx["terminal_nodes"]
+    for comp, props, (k1, k2, k3, k4) in entries:
+        if props.get("supplyType", "DC") != "DC":
+            continue
+        n1 = nodes.get(k1)
+        n2 = nodes.get(k2)
+        if n1 is None or n2 is None:
+            continue
+        ctx["sources"].append(
+            {"n1": n1, "n2": n2, "value": props.get("value", 0), "id": comp["id"], "comp": comp["id"], "role": "main"}
+        )
+
+
+def _add_ac_source(ctx, n1, n2, value, comp_id, role="main"):
+    if n1 is None or n2 is None:
+        return
+    source_id = comp_id if role == "main" else f"{comp_id}_{role}"
+    ctx["sources"].append({"n1": n1, "n2": n2, "value": value, "id": source_id, "comp": comp_id, "role": role})
+
+
+def _stamp_voltage_source_ac(entries, ctx):
+    nodes = ctx["terminal_nodes"]
+    for comp, props, (k1, k2, k3, k4) in entries:
+        supply = props.get("supplyType", "DC")
+        comp_id = comp["id"]
+        if supply == "AC1":
+            _add_ac_source(ctx, nodes.get(k1), nodes.get(k2), Complex(props.get("value", 0), 0), comp_id)
+        elif supply == "AC3":
+            v_ll = props.get("value", 400)
+            n_l1 = nodes.get(k1)
+            n_l2 = nodes.get(k2)
+            n_l3 = nodes.get(k3)
+            if props.get("connection", "Y") == "Delta":
+                _add_ac_source(ctx, n_l1, n_l2, complex_from_polar(v_ll, 0), comp_id, "L1L2")
+                _add_ac_source(ctx, n_l2, n_l3, complex_from_polar(v_ll, -120), comp_id, "L2L3")
+                _add_ac_source(ctx, n_l3, n_l1, complex_from_polar(v_ll, 120), comp_id, "L3L1")
+            else:
+                v_phase = v_ll / math.sqrt(3)
+                n_n = nodes.get(k4)
+                _add_ac_source(ctx, n_n, n_l1, complex_from_polar(v_phase, 0), comp_id, "L1")
+                _add_ac_source(ctx, n_n, n_l2, complex_from_polar(v_phase, -120), comp_id, "L2")
+                _add_ac_source(ctx, n_n, n_l3, complex_from_polar(v_phase, 120), comp_id, "L3")
+
+
+register_stamp("resistor", two_terminal_layout, dc=_stamp_fixed(1), ac=_stamp_fixed(1))
+register_stamp("motor", two_terminal_layout, dc=_stamp_fixed(10), ac=_stamp_fixed(10))
+register_stamp("lamp", two_terminal_layout, dc=_stamp_lamp, ac=_stamp_lamp)
+register_stamp("diode", two_terminal_layout, dc=_stamp_diode)
+register_stamp("varistor", two_terminal_layout, dc=_stamp_varistor, ac=_stamp_varistor)
+register_stamp("switch", two_terminal_layout, dc=_stamp_switch, ac=_stamp_switch)
+register_stamp("push_button", two_terminal_layout, dc=_stamp_switch, ac=_stamp_switch)
+register_stamp("switch_spdt", three_terminal_layout, dc=_stamp_switch_spdt, ac=_stamp_switch_spdt)
+register_stamp("inductor", two_terminal_layout, dc=_stamp_inductor_dc, ac=_stamp_inductor_ac)
+register_stamp("capacitor", two_terminal_layout, ac=_stamp_capacitor_ac)
+register_stamp("motor_3ph", motor3ph_layout, ac=_stamp_motor3ph_ac)
+register_stamp(
+    "contactor",
+    contactor_layout,
+    dc=_stamp_contactor,
+    ac=_stamp_contactor,
+    layout_key=contactor_layout_key,
+)
+register_stamp("timer", timer_layout, dc=_stamp_timer, ac=_stamp_timer)
+register_stamp("time_timer", three_terminal_layout, dc=_stamp_time_timer, ac=_stamp_time_timer)
+register_stamp("plc", plc_layout, dc=_stamp_plc, ac=_stamp_plc, layout_key=plc_io_counts)
+register_stamp("voltage_source", voltage_source_layout, dc=_stamp_voltage_source_dc, ac=_stamp_voltage_source_ac)
+
+
+def _model_context(analysis, terminal_data, contactor_states, timer_states, plc_states):
     return {
-        "terminal_nodes": terminal_nodes,
-        "node_count": node_count,
-        "resistors": resistors,
-        "sources": sources,
-        "virtual_ground": terminal_data.get("virtual_ground", False),
+        "analysis": analysis,
+        "terminal_nodes": terminal_data["terminal_nodes"],
+        "node_count": terminal_data["node_count"],
+        "contactor_states": contactor_states,
+        "timer_states": timer_states,
+        "plc_states": plc_states,
+        "elements": [],
+        "sources": [],
+        "devices": [],
+        "real": float,
+        "omega": None,
     }
 
 
-def build_model_ac(components, wires, contactor_states, timer_states, plc_states, frequency_hz):
-    terminal_data = build_terminal_nodes(components, wires, contactor_states)
+def build_model_dc(components, wires, contactor_states, timer_states, plc_states, terminal_data=None):
+    if terminal_data is None:
+        terminal_data = build_terminal_nodes(components, wires, contactor_states)
     if "error" in terminal_data:
         return terminal_data
 
-    terminal_nodes = terminal_data["terminal_nodes"]
-    node_count = terminal_data["node_count"]
-    impedances = []
-    sources = []
-    omega = max(2 * math.pi * frequency_hz, 1e-6)
+    ctx = _model_context("dc", terminal_data, contactor_states, timer_states, plc_states)
+    stamp_components(components, ctx)
 
-    for comp in components:
-        comp_type = comp.get("type")
-        props = comp.get("props", {})
-        count = get_terminal_count(comp)
-        n1 = terminal_nodes.get(f"{comp['id']}:0")
-        n2 = terminal_nodes.get(f"{comp['id']}:1") if count > 1 else None
+    return {
+        "terminal_nodes": ctx["terminal_nodes"],
+        "node_count": ctx["node_count"],
+        "resistors": ctx["elements"],
+        "sources": ctx["sources"],
+        "devices": ctx["devices"],
+        "virtual_ground": terminal_data.get("virtual_ground", False),
+    }
 
-        if comp_type == "resistor":
-            if n1 is None or n2 is None:
-                continue
-            impedances.append({"n1": n1, "n2": n2, "value": Complex(props.get("value", 1), 0)})
-        elif comp_type == "switch":
-            if props.get("closed", False):
-                if n1 is None or n2 is None:
-                    continue
-                impedances.append({"n1": n1, "n2": n2, "value": Complex(0.01, 0)})
-        elif comp_type == "push_button":
-            if props.get("closed", False):
-                if n1 is None or n2 is None:
-                    continue
-                impedances.append({"n1": n1, "n2": n2, "value": Complex(0.01, 0)})
-        elif comp_type == "inductor":
-            if n1 is None or n2 is None:
-                continue
-            inductance = max(props.get("value", 0.0), 1e-12)
-            impedances.append({"n1": n1, "n2": n2, "value": Complex(0, omega * inductance)})
-        elif comp_type == "capacitor":
-            if n1 is None or n2 is None:
-                continue
-            capacitance = max(props.get("value", 0.0), 1e-12)
-            impedances.append({"n1": n1, "n2": n2, "value": Complex(0, -1 / (omega * capacitance))})
-        elif comp_type == "motor":
-            if n1 is None or n2 is None:
-                continue
-            impedances.append({"n1": n1, "n2": n2, "value": Complex(props.get("value", 10), 0)})
-        elif comp_type == "motor_3ph":
-            n_l1 = terminal_nodes.get(f"{comp['id']}:0")
-            n_l2 = terminal_nodes.get(f"{comp['id']}:1")
-            n_l3 = terminal_nodes.get(f"{comp['id']}:2")
-            if n_l1 is None or n_l2 is None or n_l3 is None:
-                continue
-            z = Complex(props.get("value", 12), 0)
-            if props.get("connection", "Y") == "Y":
-                internal = terminal_nodes.get(f"{comp['id']}:N")
-                if internal is None:
-                    internal = node_count
-                    terminal_nodes[f"{comp['id']}:N"] = internal
-                    node_count += 1
-                impedances.append({"n1": n_l1, "n2": internal, "value": z})
-                impedances.append({"n1": n_l2, "n2": internal, "value": z})
-                impedances.append({"n1": n_l3, "n2": internal, "value": z})
-            else:
-                impedances.append({"n1": n_l1, "n2": n_l2, "value": z})
-                impedances.append({"n1": n_l2, "n2": n_l3, "value": z})
-                impedances.append({"n1": n_l3, "n2": n_l1, "value": z})
-        elif comp_type == "lamp":
-            if n1 is None or n2 is None:
-                continue
-            impedances.append({"n1": n1, "n2": n2, "value": Complex(props.get("value", 80), 0)})
-        elif comp_type == "contactor":
-            coil_n1 = terminal_nodes.get(f"{comp['id']}:0")
-            coil_n2 = terminal_nodes.get(f"{comp['id']}:1")
-            if coil_n1 is not None and coil_n2 is not None:
-                impedances.append(
-                    {"n1": coil_n1, "n2": coil_n2, "value": Complex(props.get("coilResistance", 120), 0)}
-                )
-            poles = props.get("poles") or ["NO"]
-            energized = contactor_states.get(comp["id"], False)
-            if props.get("contactType", "standard") == "changeover":
-                for idx in range(len(poles)):
-                    n_common = terminal_nodes.get(f"{comp['id']}:{2 + idx * 3}")
-                    n_no = terminal_nodes.get(f"{comp['id']}:{3 + idx * 3}")
-                    n_nc = terminal_nodes.get(f"{comp['id']}:{4 + idx * 3}")
-                    target = n_no if energized else n_nc
-                    if n_common is None or target is None:
-                        continue
-                    impedances.append({"n1": n_common, "n2": target, "value": Complex(0.01, 0)})
-            else:
-                for idx, pole in enumerate(poles):
-                    closed = pole == "NO" if energized else pole == "NC"
-                    if not closed:
-                        continue
-                    n1_pole = terminal_nodes.get(f"{comp['id']}:{2 + idx * 2}")
-                    n2_pole = terminal_nodes.get(f"{comp['id']}:{3 + idx * 2}")
-                    if n1_pole is None or n2_pole is None:
-                        continue
-                    impedances.append({"n1": n1_pole, "n2": n2_pole, "value": Complex(0.01, 0)})
-        elif comp_type == "timer":
-            coil_n1 = terminal_nodes.get(f"{comp['id']}:0")
-            coil_n2 = terminal_nodes.get(f"{comp['id']}:1")
-            if coil_n1 is not None and coil_n2 is not None:
-                impedances.append(
-                    {"n1": coil_n1, "n2": coil_n2, "value": Complex(props.get("coilResistance", 120), 0)}
-                )
-            state = timer_states.get(comp["id"], {})
-            output_closed = state.get("outputClosed", False)
-            n_common = terminal_nodes.get(f"{comp['id']}:2")
-            n_no = terminal_nodes.get(f"{comp['id']}:3")
-            n_nc = terminal_nodes.get(f"{comp['id']}:4")
-            target = n_no if output_closed else n_nc
-            if n_common is not None and target is not None:
-                impedances.append({"n1": n_common, "n2": target, "value": Complex(0.01, 0)})
-        elif comp_type == "time_timer":
-            state = timer_states.get(comp["id"], {})
-            output_closed = state.get("outputClosed", False)
-            n_common = terminal_nodes.get(f"{comp['id']}:0")
-            n_no = terminal_nodes.get(f"{comp['id']}:1")
-            n_nc = terminal_nodes.get(f"{comp['id']}:2")
-            target = n_no if output_closed else n_nc
-            if n_common is not None and target is not None:
-                impedances.append({"n1": n_common, "n2": target, "value": Complex(0.01, 0)})
-        elif comp_type == "plc":
-            outputs_state = plc_states.get(comp["id"], [])
-            props = comp.get("props", {})
-            inputs = max(1, min(64, int(props.get("inputs", 4))))
-            outputs = max(1, min(64, int(props.get("outputs", 4))))
-            node_l = terminal_nodes.get(f"{comp['id']}:1")
-            if node_l is None:
-                continue
-            for idx in range(outputs):
-                if idx >= len(outputs_state) or not outputs_state[idx]:
-                    continue
-                n_out = terminal_nodes.get(f"{comp['id']}:{2 + inputs + idx}")
-                if n_out is None:
-                    continue
-                impedances.append({"n1": node_l, "n2": n_out, "value": Complex(0.01, 0)})
-        elif comp_type == "switch_spdt":
-            if n1 is None:
-                continue
-            n_up = terminal_nodes.get(f"{comp['id']}:1")
-            n_down = terminal_nodes.get(f"{comp['id']}:2")
-            position = props.get("position", "up")
-            if position == "up" and n_up is not None:
-                impedances.append({"n1": n1, "n2": n_up, "value": Complex(0.01, 0)})
-            elif position != "up" and n_down is not None:
-                impedances.append({"n1": n1, "n2": n_down, "value": Complex(0.01, 0)})
-        elif comp_type == "voltage_source":
-            supply = props.get("supplyType", "DC")
-            if supply == "DC":
-                continue
-            if supply == "AC1":
-                if n1 is None or n2 is None:
-                    continue
-                value = Complex(props.get("value", 0), 0)
-                sources.append({"n1": n1, "n2": n2, "value": value, "id": comp["id"]})
-            elif supply == "AC3":
-                connection = props.get("connection", "Y")
-                v_ll = props.get("value", 400)
-                if connection == "Delta":
-                    n_l1 = terminal_nodes.get(f"{comp['id']}:0")
-                    n_l2 = terminal_nodes.get(f"{comp['id']}:1")
-                    n_l3 = terminal_nodes.get(f"{comp['id']}:2")
-                    if n_l1 is not None and n_l2 is not None:
-                        sources.append(
-                            {"n1": n_l1, "n2": n_l2, "value": complex_from_polar(v_ll, 0), "id": f"{comp['id']}_L1L2"}
-                        )
-                    if n_l2 is not None and n_l3 is not None:
-                        sources.append(
-                            {"n1": n_l2, "n2": n_l3, "value": complex_from_polar(v_ll, -120), "id": f"{comp['id']}_L2L3"}
-                        )
-                    if n_l3 is not None and n_l1 is not None:
-                        sources.append(
-                            {"n1": n_l3, "n2": n_l1, "value": complex_from_polar(v_ll, 120), "id": f"{comp['id']}_L3L1"}
-                        )
-                else:
-                    v_phase = v_ll / math.sqrt(3)
-                    n_l1 = terminal_nodes.get(f"{comp['id']}:0")
-                    n_l2 = terminal_nodes.get(f"{comp['id']}:1")
-                    n_l3 = terminal_nodes.get(f"{comp['id']}:2")
-                    n_n = terminal_nodes.get(f"{comp['id']}:3")
-                    if n_l1 is not None and n_n is not None:
-                        sources.append(
-                            {"n1": n_n, "n2": n_l1, "value": complex_from_polar(v_phase, 0), "id": f"{comp['id']}_L1"}
-                        )
-                    if n_l2 is not None and n_n is not None:
-                        sources.append(
-                            {"n1": n_n, "n2": n_l2, "value": complex_from_polar(v_phase, -120), "id": f"{comp['id']}_L2"}
-                        )
-                    if n_l3 is not None and n_n is not None:
-                        sources.append(
-                            {"n1": n_n, "n2": n_l3, "value": complex_from_polar(v_phase, 120), "id": f"{comp['id']}_L3"}
-                        )
+
+def build_model_ac(components, wires, contactor_states, timer_states, plc_states, frequency_hz, terminal_data=None):
+    if terminal_data is None:
+        terminal_data = build_terminal_nodes(components, wires, contactor_states)
+    if "error" in terminal_data:
+        return terminal_data
+
+    ctx = _model_context("ac", terminal_data, contactor_states, timer_states, plc_states)
+    ctx["terminal_nodes"] = dict(terminal_data["terminal_nodes"])
+    ctx["real"] = lambda value: Complex(value, 0)
+    ctx["omega"] = max(2 * math.pi * frequency_hz, 1e-6)
+    stamp_components(components, ctx)
 
     return {
-        "terminal_nodes": terminal_nodes,
-        "node_count": node_count,
-        "impedances": impedances,
-        "sources": sources,
+        "terminal_nodes": ctx["terminal_nodes"],
+        "node_count": ctx["node_count"],
+        "impedances": ctx["elements"],
+        "sources": ctx["sources"],
+        "devices": ctx["devices"],
         "virtual_ground": terminal_data.get("virtual_ground", False),
     }
 
@@ -569,7 +551,7 @@ def _find_floating_nodes(node_count, elements):
 
 def _filter_elements(elements, floating):
     if not floating:
-        return elements
+        return list(elements)
     filtered = []
     for elem in elements:
         n1 = elem.get("n1")
@@ -628,37 +610,69 @@ def _reachable_from_sources(node_count, elements, sources):
     return reachable
 
 
-def gaussian_solve(matrix, vector):
+def lu_factor(matrix, deadline=None):
     n = len(matrix)
-    augmented = [row[:] + [vector[i]] for i, row in enumerate(matrix)]
+    lu = [row[:] for row in matrix]
+    perm = list(range(n))
 
     for i in range(n):
-        max_row = max(range(i, n), key=lambda r: abs(augmented[r][i]))
-        if abs(augmented[max_row][i]) < 1e-12:
+        if deadline is not None and time.time() >= deadline:
+            raise SolveTimeout()
+        max_row = max(range(i, n), key=lambda r: abs(lu[r][i]))
+        if abs(lu[max_row][i]) < 1e-12:
             return None
-        augmented[i], augmented[max_row] = augmented[max_row], augmented[i]
+        if max_row != i:
+            lu[i], lu[max_row] = lu[max_row], lu[i]
+            perm[i], perm[max_row] = perm[max_row], perm[i]
+
+        pivot_row = lu[i]
+        pivot = pivot_row[i]
+        for k in range(i + 1, n):
+            row = lu[k]
+            if abs(row[i]) == 0:
+                continue
+            factor = row[i] / pivot
+            row[i] = factor
+            for j in range(i + 1, n):
+                row[j] = row[j] - factor * pivot_row[j]
 
-        pivot = augmented[i][i]
-        for j in range(i, n + 1):
-            augmented[i][j] /= pivot
+    return {"lu": lu, "perm": perm}
 
-        for k in range(n):
-            if k == i:
-                continue
-            factor = augmented[k][i]
-            for j in range(i, n + 1):
-                augmented[k][j] -= factor * augmented[i][j]
 
-    return [row[n] for row in augmented]
+def lu_solve(factorization, vector):
+    lu = factorization["lu"]
+    n = len(lu)
+    y = [vector[p] for p in factorization["perm"]]
 
+    for i in range(n):
+        row = lu[i]
+        acc = y[i]
+        for j in range(i):
+            if abs(row[j]) != 0:
+                acc = acc - row[j] * y[j]
+        y[i] = acc
+
+    for i in range(n - 1, -1, -1):
+        row = lu[i]
+        acc = y[i]
+        for j in range(i + 1, n):
+            if abs(row[j]) != 0:
+                acc = acc - row[j] * y[j]
+        y[i] = acc / row[i]
+
+    return y
+
+
+def gaussian_solve(matrix, vector):
+    factorization = lu_factor(matrix)
+    if factorization is None:
+        return None
+    return lu_solve(factorization, vector)
 
-def solve_mna(node_count, resistors, sources):
-    n = node_count - 1
-    m = len(sources)
-    size = n + m
-    if size == 0:
-        return {"error": "Inga noder att simulera."}
 
+def assemble_mna(node_count, resistors, sources):
+    n = node_count - 1
+    size = n + len(sources)
     matrix = [[0.0 for _ in range(size)] for _ in range(size)]
     vector = [0.0 for _ in range(size)]
 
@@ -688,46 +702,32 @@ def solve_mna(node_count, resistors, sources):
             matrix[row][n2] -= 1
         vector[row] = src["value"]
 
-    solution = gaussian_solve(matrix, vector)
-    if solution is None:
+    return matrix, vector
+
+
+def solve_mna(node_count, resistors, sources, deadline=None):
+    n = node_count - 1
+    if n + len(sources) == 0:
+        return {"error": "Inga noder att simulera."}
+
+    matrix, vector = assemble_mna(node_count, resistors, sources)
+    factorization = lu_factor(matrix, deadline)
+    if factorization is None:
         return {"error": "Kunde inte lösa nätet (singulärt)."}
+    solution = lu_solve(factorization, vector)
 
     node_voltages = [0.0] + solution[:n]
     source_currents = {src["id"]: solution[n + idx] for idx, src in enumerate(sources)}
-    return {"node_voltages": node_voltages, "source_currents": source_currents}
+    return {"node_voltages": node_voltages, "source_currents": source_currents, "factorization": factorization}
 
 
 def gaussian_solve_complex(matrix, vector):
-    n = len(matrix)
-    augmented = [row[:] + [vector[i]] for i, row in enumerate(matrix)]
-
-    for i in range(n):
-        max_row = max(range(i, n), key=lambda r: abs(augmented[r][i]))
-        if abs(augmented[max_row][i]) < 1e-12:
-            return None
-        augmented[i], augmented[max_row] = augmented[max_row], augmented[i]
-
-        pivot = augmented[i][i]
-        for j in range(i, n + 1):
-            augmented[i][j] = augmented[i][j] / pivot
-
-        for k in range(n):
-            if k == i:
-                continue
-            factor = augmented[k][i]
-            for j in range(i, n + 1):
-                augmented[k][j] = augmented[k][j] - factor * augmented[i][j]
-
-    return [row[n] for row in augmented]
+    return gaussian_solve(matrix, vector)
 
 
-def solve_mna_ac(node_count, impedances, sources):
+def assemble_mna_ac(node_count, impedances, sources):
     n = node_count - 1
-    m = len(sources)
-    size = n + m
-    if size == 0:
-        return {"error": "Inga noder att simulera."}
-
+    size = n + len(sources)
     matrix = [[Complex(0, 0) for _ in range(size)] for _ in range(size)]
     vector = [Complex(0, 0) for _ in range(size)]
 
@@ -755,15 +755,444 @@ def solve_mna_ac(node_count, impedances, sources):
         if n2 >= 0:
             matrix[n2][row] = matrix[n2][row] - Complex(1, 0)
             matrix[row][n2] = matrix[row][n2] - Complex(1, 0)
-        vector[row] = src["value"]
+        vector[row] = to_complex(src["value"])
 
-    solution = gaussian_solve_complex(matrix, vector)
-    if solution is None:
+    return matrix, vector
+
+
+def solve_mna_ac(node_count, impedances, sources, deadline=None):
+    n = node_count - 1
+    if n + len(sources) == 0:
+        return {"error": "Inga noder att simulera."}
+
+    matrix, vector = assemble_mna_ac(node_count, impedances, sources)
+    factorization = lu_factor(matrix, deadline)
+    if factorization is None:
         return {"error": "Kunde inte lösa nätet (singulärt)."}
+    solution = lu_solve(factorization, vector)
 
     node_voltages = [Complex(0, 0)] + solution[:n]
     source_currents = {src["id"]: solution[n + idx] for idx, src in enumerate(sources)}
-    return {"node_voltages": node_voltages, "source_currents": source_currents}
+    return {"node_voltages": node_voltages, "source_currents": source_currents, "factorization": factorization}
+
+
+PHASE_ROTATION = complex_from_polar(1, -120)
+PHASE_CHAINS = (("L1", "L2", "L3"), ("L1L2", "L2L3", "L3L1"))
+BALANCED_TOLERANCE = 1e-9
+
+
+def _value_key(value):
+    value = to_complex(value)
+    return (value.re, value.im)
+
+
+def _map_node(sigma, inverse, a, b):
+    if a in sigma or b in inverse:
+        return sigma.get(a) == b
+    sigma[a] = b
+    inverse[b] = a
+    return True
+
+
+# Looks for a node permutation sigma of order three that takes phase L1 to L2
+# and L2 to L3. Seeded from the AC3 sources, it spreads over elements of equal
+# impedance. Nodes that are never reached are treated as fixed points, such as
+# star points and the neutral. The caller checks the result, so a wrong guess
+# only costs the full solve.
+def _phase_permutation(node_count, impedances, sources):
+    sigma = {}
+    inverse = {}
+    by_comp = {}
+    for src in sources:
+        by_comp.setdefault(src["comp"], {})[src["role"]] = src
+    seeded = []
+    for roles in by_comp.values():
+        for chain in PHASE_CHAINS:
+            if not all(role in roles for role in chain):
+                continue
+            for role, target in zip(chain, chain[1:] + chain[:1]):
+                for end in ("n1", "n2"):
+                    if not _map_node(sigma, inverse, roles[role][end], roles[target][end]):
+                        return None
+            seeded.extend(roles[role]["n2"] for role in chain)
+    if not seeded:
+        return None
+
+    adjacency = {}
+    for imp in impedances:
+        key = _value_key(imp["value"])
+        adjacency.setdefault(imp["n1"], []).append((imp["n2"], key))
+        adjacency.setdefault(imp["n2"], []).append((imp["n1"], key))
+    pending = [node for node in seeded if sigma[node] != node]
+    progress = True
+    while pending and progress:
+        progress = False
+        waiting = []
+        for node in pending:
+            image = sigma[node]
+            open_edges = False
+            for other, key in adjacency.get(node, ()):
+                if other in sigma:
+                    continue
+                candidates = {target for target, target_key in adjacency.get(image, ()) if target_key == key}
+                if other in candidates:
+                    candidates = {other}
+                candidates = {target for target in candidates if target not in inverse}
+                if len(candidates) != 1:
+                    open_edges = True
+                    continue
+                target = candidates.pop()
+                _map_node(sigma, inverse, other, target)
+                progress = True
+                if target != other:
+                    waiting.append(other)
+            if open_edges:
+                waiting.append(node)
+        pending = waiting
+    if pending:
+        return None
+
+    for node in range(node_count):
+        if node not in sigma:
+            if not _map_node(sigma, inverse, node, node):
+                return None
+    for node, image in sigma.items():
+        if image != node and (sigma[image] == node or sigma[sigma[image]] != node):
+            return None
+    return sigma
+
+
+def _edge_key(n1, n2, value):
+    return (min(n1, n2), max(n1, n2), _value_key(value))
+
+
+def _source_map(sigma, sources):
+    by_ends = {}
+    for idx, src in enumerate(sources):
+        by_ends.setdefault((src["n1"], src["n2"]), []).append(idx)
+    images = []
+    used = set()
+    for src in sources:
+        expected = PHASE_ROTATION * to_complex(src["value"])
+        match = None
+        for idx in by_ends.get((sigma[src["n1"]], sigma[src["n2"]]), ()):
+            value = to_complex(sources[idx]["value"])
+            if idx not in used and abs(value - expected) <= BALANCED_TOLERANCE * max(1.0, abs(value)):
+                match = idx
+                break
+        if match is None:
+            return None
+        used.add(match)
+        images.append(match)
+    for idx, image in enumerate(images):
+        if image == idx or images[image] == idx or images[images[image]] != idx:
+            return None
+    return images
+
+
+def _orbits(sigma_of, items):
+    orbit_of = {}
+    representatives = []
+    for item in items:
+        if item in orbit_of:
+            continue
+        representatives.append(item)
+        current = item
+        for power in range(3):
+            orbit_of[current] = (len(representatives) - 1, power)
+            current = sigma_of(current)
+    return orbit_of, representatives
+
+
+# Per-phase equivalent of a balanced three-phase network. When sigma maps every
+# impedance onto an equal one and every source onto one rotated by -120
+# degrees, the solution satisfies V(sigma n) = a * V(n) with a = 1/-120. Fixed
+# nodes then sit at 0 V. Each orbit of three nodes (or sources) has one
+# unknown, so the system is about a third of the full size. If node 0 is a
+# phase node (virtual ground on a delta source), the voltages are shifted so
+# node 0 stays at 0 V, as in the full solve. Returns None when the network is
+# not balanced, so the caller falls back to solve_mna_ac.
+def solve_mna_ac_balanced(node_count, impedances, sources, deadline=None):
+    sigma = _phase_permutation(node_count, impedances, sources)
+    if sigma is None:
+        return None
+    edges = Counter(_edge_key(imp["n1"], imp["n2"], imp["value"]) for imp in impedances if imp["n1"] != imp["n2"])
+    mapped = Counter(
+        _edge_key(sigma[imp["n1"]], sigma[imp["n2"]], imp["value"]) for imp in impedances if imp["n1"] != imp["n2"]
+    )
+    if edges != mapped:
+        return None
+    source_images = _source_map(sigma, sources)
+    if source_images is None:
+        return None
+
+    node_orbit, node_reps = _orbits(sigma.get, [node for node in range(node_count) if sigma[node] != node])
+    source_orbit, source_reps = _orbits(source_images.__getitem__, range(len(sources)))
+    powers = [Complex(1, 0), PHASE_ROTATION, PHASE_ROTATION * PHASE_ROTATION]
+    n = len(node_reps)
+    size = n + len(source_reps)
+    if size == 0:
+        return None
+    matrix = [[Complex(0, 0) for _ in range(size)] for _ in range(size)]
+    vector = [Complex(0, 0) for _ in range(size)]
+
+    def add(row, node, scale):
+        if node in node_orbit:
+            col, power = node_orbit[node]
+            matrix[row][col] = matrix[row][col] + scale * powers[power]
+
+    rows = {rep: idx for idx, rep in enumerate(node_reps)}
+    for imp in impedances:
+        if imp["n1"] == imp["n2"]:
+            continue
+        g = Complex(1, 0) / imp["value"]
+        for node, other in ((imp["n1"], imp["n2"]), (imp["n2"], imp["n1"])):
+            row = rows.get(node)
+            if row is not None:
+                add(row, node, g)
+                add(row, other, Complex(0, 0) - g)
+    for idx, src in enumerate(sources):
+        col, power = source_orbit[idx]
+        current = powers[power]
+        row = rows.get(src["n1"])
+        if row is not None:
+            matrix[row][n + col] = matrix[row][n + col] + current
+        row = rows.get(src["n2"])
+        if row is not None:
+            matrix[row][n + col] = matrix[row][n + col] - current
+    for col, idx in enumerate(source_reps):
+        src = sources[idx]
+        add(n + col, src["n1"], Complex(1, 0))
+        add(n + col, src["n2"], Complex(-1, 0))
+        vector[n + col] = to_complex(src["value"])
+
+    factorization = lu_factor(matrix, deadline)
+    if factorization is None:
+        return None
+    solution = lu_solve(factorization, vector)
+
+    node_voltages = []
+    for node in range(node_count):
+        if node in node_orbit:
+            rep, power = node_orbit[node]
+            node_voltages.append(solution[rep] * powers[power])
+        else:
+            node_voltages.append(Complex(0, 0))
+    offset = node_voltages[0]
+    if offset.re or offset.im:
+        node_voltages = [voltage - offset for voltage in node_voltages]
+    source_currents = {}
+    for idx, src in enumerate(sources):
+        rep, power = source_orbit[idx]
+        source_currents[src["id"]] = solution[n + rep] * powers[power]
+    return {
+        "node_voltages": node_voltages,
+        "source_currents": source_currents,
+        "system": (node_count, impedances, sources),
+        "reduced_size": size,
+    }
+
+
+THERMAL_VOLTAGE = 0.025852
+DIODE_EMISSION = 2.0
+DIODE_REFERENCE_CURRENT = 0.01
+VARISTOR_REFERENCE_CURRENT = 0.001
+VARISTOR_MAX_EXPONENT = 300.0
+LAMP_EXPONENT = 0.42
+GMIN = 1e-12
+NEWTON_MAX_ITERATIONS = 100
+NEWTON_TOLERANCE = 1e-6
+JACOBIAN_REUSE_RATIO = 0.5
+
+
+# Filament resistance grows with temperature: cold below a knee, then about
+# value * (V / ratedVoltage) ** 0.42, so it equals value at rated voltage.
+def _lamp_iv(v, params):
+    cold, hot, rated = params
+    resistance = max(cold, hot * (abs(v) / rated) ** LAMP_EXPONENT)
+    if resistance == cold:
+        return v / cold, 1 / cold
+    return v / resistance, (1 - LAMP_EXPONENT) / resistance
+
+
+def _diode_iv(v, params):
+    saturation, nvt = params
+    growth = math.exp(min(v / nvt, 80.0))
+    return saturation * (growth - 1) + GMIN * v, saturation * growth / nvt + GMIN
+
+
+# SPICE-style junction limiting keeps the exponential from overshooting.
+def _diode_limit(v_new, v_old, params):
+    saturation, nvt = params
+    critical = nvt * math.log(nvt / (math.sqrt(2) * saturation))
+    if v_new <= critical or abs(v_new - v_old) <= 2 * nvt:
+        return v_new
+    if v_old > 0:
+        step = 1 + (v_new - v_old) / nvt
+        return v_old + nvt * math.log(step) if step > 0 else critical
+    return nvt * math.log(v_new / nvt)
+
+
+# Evaluated in log space: with alpha up to 60, (V / clamp) ** alpha leaves the
+# float range long before V is unreasonable.
+def _varistor_iv(v, params):
+    clamp, alpha = params
+    magnitude = abs(v)
+    if not magnitude:
+        return GMIN * v, GMIN
+    exponent = min(alpha * math.log(magnitude / clamp), VARISTOR_MAX_EXPONENT)
+    current = VARISTOR_REFERENCE_CURRENT * math.exp(exponent)
+    slope = alpha * current / magnitude
+    return math.copysign(current, v) + GMIN * v, slope + GMIN
+
+
+# Above the clamp voltage each step may raise the current about e-fold.
+def _varistor_limit(v_new, v_old, params):
+    clamp, alpha = params
+    ceiling = max(abs(v_old), clamp) * (1 + 1 / alpha)
+    if abs(v_new) > ceiling:
+        return math.copysign(ceiling, v_new)
+    return v_new
+
+
+# Diodes are DC only; a phasor has no polarity to rectify (see _ac_diode_errors).
+DEVICE_MODELS = {
+    "lamp": {"iv": _lamp_iv, "limit": None},
+    "diode": {"iv": _diode_iv, "limit": _diode_limit},
+    "varistor": {"iv": _varistor_iv, "limit": _varistor_limit},
+}
+
+
+def _device_voltage(voltages, device):
+    return voltages[device["n1"]] - voltages[device["n2"]]
+
+
+# AC devices follow their I-V curve on the phasor magnitude: the current is
+# the secant conductance times the phasor and the Jacobian uses the slope.
+def _evaluate_device(model, device, v, ac):
+    if not ac:
+        return model["iv"](v, device["params"])
+    magnitude = abs(v)
+    current, slope = model["iv"](magnitude, device["params"])
+    secant = current / magnitude if magnitude > 1e-12 else slope
+    return v * Complex(secant, 0), Complex(slope, 0)
+
+
+def _limit_device(model, device, v_new, v_old, ac):
+    if model["limit"] is None:
+        return v_new
+    if not ac:
+        return model["limit"](v_new, v_old, device["params"])
+    magnitude = abs(v_new)
+    limited = model["limit"](magnitude, abs(v_old), device["params"])
+    if limited == magnitude:
+        return v_new
+    return v_new * Complex(limited / magnitude, 0)
+
+
+def _stamp_conductance(matrix, device, g):
+    n1 = device["n1"] - 1
+    n2 = device["n2"] - 1
+    if n1 >= 0:
+        matrix[n1][n1] = matrix[n1][n1] + g
+    if n2 >= 0:
+        matrix[n2][n2] = matrix[n2][n2] + g
+    if n1 >= 0 and n2 >= 0:
+        matrix[n1][n2] = matrix[n1][n2] - g
+        matrix[n2][n1] = matrix[n2][n1] - g
+
+
+# Newton-Raphson over the nonlinear devices. The linear part of the MNA
+# matrix is assembled once. Each device adds its slope to a copy of it and a
+# companion current to the right-hand side. An LU factorization is kept
+# across iterations (modified Newton) while every step at least halves the
+# previous one. Otherwise the next iteration refactors with fresh slopes.
+# initial (last poll's node voltages) warm-starts the iteration.
+def solve_mna_nonlinear(node_count, elements, sources, devices, initial=None, ac=False, deadline=None):
+    n = node_count - 1
+    if n + len(sources) == 0:
+        return {"error": "Inga noder att simulera."}
+    zero = Complex(0, 0) if ac else 0.0
+    matrix, base_vector = (assemble_mna_ac if ac else assemble_mna)(node_count, elements, sources)
+    voltages = list(initial) if initial is not None and len(initial) == node_count else [zero] * node_count
+    models = [DEVICE_MODELS[device["kind"]] for device in devices]
+    device_voltages = [
+        _limit_device(model, device, _device_voltage(voltages, device), zero, ac)
+        for model, device in zip(models, devices)
+    ]
+    factorization = None
+    last_factorization = None
+    slopes = None
+    factorizations = 0
+    previous_change = None
+    converged = False
+    iterations = 0
+    solution = None
+    while iterations < NEWTON_MAX_ITERATIONS:
+        iterations += 1
+        evaluated = [_evaluate_device(m, d, v, ac) for m, d, v in zip(models, devices, device_voltages)]
+        if factorization is None:
+            slopes = [slope for _, slope in evaluated]
+            jacobian = [row[:] for row in matrix]
+            for device, slope in zip(devices, slopes):
+                _stamp_conductance(jacobian, device, slope)
+            factorization = lu_factor(jacobian, deadline)
+            factorizations += 1
+            if factorization is None:
+                return {"error": "Kunde inte lösa nätet (singulärt)."}
+            last_factorization = factorization
+        vector = base_vector[:]
+        for device, (current, _), slope, v in zip(devices, evaluated, slopes, device_voltages):
+            offset = current - slope * v
+            if device["n1"] > 0:
+                vector[device["n1"] - 1] = vector[device["n1"] - 1] - offset
+            if device["n2"] > 0:
+                vector[device["n2"] - 1] = vector[device["n2"] - 1] + offset
+        solution = lu_solve(factorization, vector)
+        new_voltages = [zero] + solution[:n]
+        change = max((abs(a - b) for a, b in zip(new_voltages, voltages)), default=0.0)
+        limited = False
+        next_device_voltages = []
+        for model, device, v_old in zip(models, devices, device_voltages):
+            v_new = _device_voltage(new_voltages, device)
+            v_limited = _limit_device(model, device, v_new, v_old, ac)
+            limited = limited or v_limited is not v_new
+            next_device_voltages.append(v_limited)
+        voltages = new_voltages
+        device_voltages = next_device_voltages
+        scale = max((abs(v) for v in voltages), default=0.0)
+        if not limited and change <= NEWTON_TOLERANCE * (1 + scale):
+            converged = True
+            break
+        if previous_change is not None and change > JACOBIAN_REUSE_RATIO * previous_change:
+            factorization = None
+        previous_change = change
+
+    source_currents = {src["id"]: solution[n + idx] for idx, src in enumerate(sources)}
+    return {
+        "node_voltages": voltages,
+        "source_currents": source_currents,
+        "factorization": last_factorization,
+        "newton": {"iterations": iterations, "factorizations": factorizations, "converged": converged},
+    }
+
+
+# Devices as fixed elements at their operating point (V / I), so branch
+# currents, power and meters work as for linear components.
+def _secant_elements(devices, voltages, ac):
+    elements = []
+    for device in devices:
+        model = DEVICE_MODELS[device["kind"]]
+        v = _device_voltage(voltages, device)
+        current, slope = _evaluate_device(model, device, v, ac)
+        if abs(current) > 1e-15 and abs(v) > 1e-12:
+            value = v / current
+        else:
+            value = Complex(1, 0) / slope if ac else 1 / slope
+        elements.append(
+            {"n1": device["n1"], "n2": device["n2"], "value": value, "comp": device["comp"], "role": device["role"]}
+        )
+    return elements
 
 
 def _voltage_magnitude(comp, terminal_nodes, dc_voltages, ac_voltages):
@@ -1034,7 +1463,7 @@ def compute_plc_states(components, terminal_nodes, dc_voltages, ac_voltages, sim
                     if acc_value:
                         if not prev_in:
                             start_at = now
-                        elapsed = max(0, now - (start_at or now))
+                        elapsed = max(0, now - (now if start_at is None else start_at))
                         output = elapsed >= delay_ms
                         if not output and start_at is not None and delay_ms > 0:
                             remaining = max(0, delay_ms - elapsed)
@@ -1050,7 +1479,7 @@ def compute_plc_states(components, terminal_nodes, dc_voltages, ac_voltages, sim
                     else:
                         if prev_in:
                             start_at = now
-                        elapsed = max(0, now - (start_at or now))
+                        elapsed = max(0, now - (now if start_at is None else start_at))
                         output = elapsed < delay_ms
                         if output and start_at is not None and delay_ms > 0:
                             remaining = max(0, delay_ms - elapsed)
@@ -1397,6 +1826,189 @@ def compute_motor3ph_direction(components, terminal_nodes, ac_voltages):
     return directions
 
 
+def _line_current(currents):
+    if "L1" in currents:
+        return currents["L1"]
+    if "L1L2" in currents and "L3L1" in currents:
+        return currents["L1L2"] - currents["L3L1"]
+    return currents.get("main", currents.get("coil"))
+
+
+def _dc_branch_table(model, solution):
+    voltages = solution["node_voltages"]
+    source_currents = solution["source_currents"]
+    branches = []
+    for elem in model["resistors"]:
+        dv = voltages[elem["n1"]] - voltages[elem["n2"]]
+        current = dv / max(elem["value"], 1e-9)
+        branches.append((elem, dv, current))
+    for src in model["sources"]:
+        dv = voltages[src["n1"]] - voltages[src["n2"]]
+        branches.append((src, dv, source_currents.get(src["id"], 0.0)))
+
+    rows = []
+    per_component = {}
+    for elem, dv, current in branches:
+        power = dv * current
+        rows.append(
+            {
+                "id": elem["comp"],
+                "role": elem["role"],
+                "n1": elem["n1"],
+                "n2": elem["n2"],
+                "voltage": dv,
+                "current": current,
+                "power": power,
+            }
+        )
+        entry = per_component.setdefault(elem["comp"], {"currents": {}, "power": 0.0})
+        entry["currents"][elem["role"]] = current
+        entry["power"] += power
+
+    components = {}
+    for comp_id, entry in per_component.items():
+        components[comp_id] = {"current": _line_current(entry["currents"]), "power": entry["power"]}
+    return {"branches": rows, "components": components}
+
+
+def _power_fields(s):
+    s_abs = abs(s)
+    return {"p": s.re, "q": s.im, "s": s_abs, "pf": s.re / s_abs if s_abs else None}
+
+
+def _ac_branch_table(model, solution):
+    voltages = solution["node_voltages"]
+    source_currents = solution["source_currents"]
+    branches = []
+    for elem in model["impedances"]:
+        dv = voltages[elem["n1"]] - voltages[elem["n2"]]
+        branches.append((elem, dv, dv / elem["value"]))
+    for src in model["sources"]:
+        dv = voltages[src["n1"]] - voltages[src["n2"]]
+        branches.append((src, dv, source_currents.get(src["id"], Complex(0, 0))))
+
+    rows = []
+    per_component = {}
+    for elem, dv, current in branches:
+        s = dv * current.conjugate()
+        row = {
+            "id": elem["comp"],
+            "role": elem["role"],
+            "n1": elem["n1"],
+            "n2": elem["n2"],
+            "voltage": abs(dv),
+            "current": abs(current),
+            "angle": _phase_angle(current),
+        }
+        row.update(_power_fields(s))
+        rows.append(row)
+        entry = per_component.setdefault(elem["comp"], {"currents": {}, "power": Complex(0, 0)})
+        entry["currents"][elem["role"]] = current
+        entry["power"] = entry["power"] + s
+
+    components = {}
+    for comp_id, entry in per_component.items():
+        current = _line_current(entry["currents"])
+        summary = {"current": abs(current) if current is not None else None}
+        summary.update(_power_fields(entry["power"]))
+        components[comp_id] = summary
+    return {"branches": rows, "components": components}
+
+
+def _add_open_components(table, components, terminal_nodes, empty):
+    for comp in components:
+        comp_id = comp.get("id")
+        if comp_id in table["components"] or comp.get("type") not in STAMP_HANDLERS:
+            continue
+        if terminal_nodes.get(f"{comp_id}:0") is None or terminal_nodes.get(f"{comp_id}:1") is None:
+            continue
+        table["components"][comp_id] = dict(empty)
+
+
+def compute_branch_quantities(result):
+    dc_model = result.get("dc_model")
+    ac_model = result.get("ac_model")
+    terminal_nodes = result["terminal_nodes"]
+    table = {"dc": None, "ac": None}
+    if dc_model is not None and result.get("dc_solution"):
+        table["dc"] = _dc_branch_table(dc_model, result["dc_solution"])
+        _add_open_components(table["dc"], result["components"], terminal_nodes, {"current": 0.0, "power": 0.0})
+    if ac_model is not None and result.get("ac_solution"):
+        table["ac"] = _ac_branch_table(ac_model, result["ac_solution"])
+        _add_open_components(
+            table["ac"],
+            result["components"],
+            terminal_nodes,
+            {"current": 0.0, "p": 0.0, "q": 0.0, "s": 0.0, "pf": None},
+        )
+    return table
+
+
+def _impedance_factorization(result, analysis):
+    cache = result.setdefault("impedance_factorizations", {})
+    if analysis in cache:
+        return cache[analysis]
+    model = result.get(f"{analysis}_model")
+    solution = result.get(f"{analysis}_solution")
+    factorization = solution.get("factorization") if solution else None
+    if factorization is None and solution and solution.get("system"):
+        factorization = lu_factor(assemble_mna_ac(*solution["system"])[0])
+    elif factorization is None and model is not None:
+        node_count = model["node_count"]
+        if analysis == "dc":
+            shunts = [{"n1": node, "n2": 0, "value": SHUNT_RESISTANCE} for node in range(1, node_count)]
+            matrix, _ = assemble_mna(node_count, model["resistors"] + shunts, model["sources"])
+        else:
+            shunts = [{"n1": node, "n2": 0, "value": Complex(SHUNT_RESISTANCE, 0)} for node in range(1, node_count)]
+            matrix, _ = assemble_mna_ac(node_count, model["impedances"] + shunts, model["sources"])
+        if matrix:
+            factorization = lu_factor(matrix)
+    cache[analysis] = factorization
+    return factorization
+
+
+def compute_impedances(result, pairs, analysis="dc", transfer=False):
+    model = result.get(f"{analysis}_model")
+    if model is None:
+        return {"error": "Ingen AC-lösning tillgänglig." if analysis == "ac" else "Inga noder att simulera."}
+    factorization = _impedance_factorization(result, analysis)
+    if factorization is None:
+        return {"error": "Kunde inte lösa nätet (singulärt)."}
+
+    size = len(factorization["lu"])
+    n = model["node_count"] - 1
+    if analysis == "dc":
+        zero, one, minus_one = 0.0, 1.0, -1.0
+    else:
+        zero, one, minus_one = Complex(0, 0), Complex(1, 0), Complex(-1, 0)
+
+    responses = []
+    for a, b in pairs:
+        if a is None or b is None:
+            responses.append(None)
+            continue
+        rhs = [zero] * size
+        if a > 0:
+            rhs[a - 1] = one
+        if b > 0:
+            rhs[b - 1] = rhs[b - 1] + minus_one
+        responses.append([zero] + lu_solve(factorization, rhs)[:n])
+
+    def across(voltages, pair):
+        if voltages is None or pair[0] is None or pair[1] is None:
+            return None
+        z = voltages[pair[0]] - voltages[pair[1]]
+        if abs(z) >= SHUNT_RESISTANCE * 0.1:
+            return None
+        return z
+
+    impedances = [across(voltages, pair) for voltages, pair in zip(responses, pairs)]
+    if not transfer:
+        return {"impedances": impedances}
+    matrix = [[across(voltages, pair) for voltages in responses] for pair in pairs]
+    return {"impedances": impedances, "transfer": matrix}
+
+
 def get_ac_frequency(components):
     frequencies = set()
     for comp in components:
@@ -1413,157 +2025,305 @@ def get_ac_frequency(components):
     return frequencies.pop()
 
 
-def solve_network(payload):
-    components = payload.get("components", [])
-    wires = payload.get("wires", [])
-    sim_time = payload.get("simTime")
-    contactor_states = {comp["id"]: False for comp in components if comp.get("type") == "contactor"}
-    timer_states = {}
-    for comp in components:
-        if comp.get("type") == "timer":
-            timer_states[comp["id"]] = comp.get("props", {}).get("timerState", {}) or {}
-    timer_states.update(compute_time_timer_states(components))
-    plc_states = {}
-    plc_meta = {}
-    for comp in components:
-        if comp.get("type") == "plc":
-            outputs = max(1, min(64, int(comp.get("props", {}).get("outputs", 4))))
-            plc_states[comp["id"]] = [False] * outputs
-    dc_solution = None
-    dc_model = None
-    ac_solution = None
-    ac_model = None
-    freq = get_ac_frequency(components)
-    if isinstance(freq, dict):
-        return freq
-
+def _solve_electrical(
+    components,
+    wires,
+    contactor_states,
+    timer_states,
+    plc_states,
+    freq,
+    terminal_data,
+    timings=None,
+    warm=None,
+    deadline=None,
+):
     solve_errors = {}
     debug_info = {"dc": {}, "ac": {}}
-
-    for _ in range(3):
-        dc_model = build_model_dc(components, wires, contactor_states, timer_states, plc_states)
-        if "error" in dc_model:
-            return dc_model
-        dc_elements = dc_model["resistors"] + dc_model["sources"]
-        dc_floating, dc_reachable, dc_active = _find_floating_nodes(dc_model["node_count"], dc_elements)
-        dc_inactive = set(range(1, dc_model["node_count"])) - dc_active
-        dc_floating_all = dc_floating | dc_inactive
-        dc_source_reachable = _reachable_from_sources(
-            dc_model["node_count"], dc_elements, dc_model["sources"]
+    ac_model = None
+    ac_solution = None
+    started = time.perf_counter()
+    dc_model = build_model_dc(components, wires, contactor_states, timer_states, plc_states, terminal_data)
+    metrics.BUILD_SECONDS.observe(time.perf_counter() - started, ("dc",))
+    add_phase(timings, "dcBuild", started)
+    if "error" in dc_model:
+        return dc_model
+    started = time.perf_counter()
+    dc_elements = dc_model["resistors"] + dc_model["devices"] + dc_model["sources"]
+    dc_floating, dc_reachable, dc_active = _find_floating_nodes(dc_model["node_count"], dc_elements)
+    dc_inactive = set(range(1, dc_model["node_count"])) - dc_active
+    dc_floating_all = dc_floating | dc_inactive
+    dc_source_reachable = _reachable_from_sources(dc_model["node_count"], dc_elements, dc_model["sources"])
+    debug_info["dc"] = {
+        "nodes": dc_model["node_count"],
+        "sources": len(dc_model["sources"]),
+        "elements": len(dc_elements),
+        "floating": len(dc_floating),
+        "inactive": len(dc_inactive),
+        "active": len(dc_active),
+        "virtualGround": dc_model.get("virtual_ground", False),
+    }
+    solve_errors.update(
+        _component_errors_for_floating(
+            components,
+            dc_model["terminal_nodes"],
+            dc_floating,
+            dc_active,
+            dc_source_reachable,
+            "DC",
         )
-        debug_info["dc"] = {
-            "nodes": dc_model["node_count"],
-            "sources": len(dc_model["sources"]),
-            "elements": len(dc_elements),
-            "floating": len(dc_floating),
-            "inactive": len(dc_inactive),
-            "active": len(dc_active),
-            "virtualGround": dc_model.get("virtual_ground", False),
+    )
+    dc_resistors = _filter_elements(dc_model["resistors"], dc_floating_all)
+    dc_sources = _filter_elements(dc_model["sources"], dc_floating_all)
+    dc_devices = _filter_elements(dc_model["devices"], dc_floating_all)
+    for node in dc_floating_all:
+        if node == 0:
+            continue
+        dc_resistors.append({"n1": node, "n2": 0, "value": SHUNT_RESISTANCE})
+    add_phase(timings, "floating", started)
+    if dc_sources:
+        started = time.perf_counter()
+        if dc_devices:
+            initial = _warm_voltages(warm, "dc", dc_devices)
+            dc_solution = solve_mna_nonlinear(
+                dc_model["node_count"], dc_resistors, dc_sources, dc_devices, initial, deadline=deadline
+            )
+        else:
+            dc_solution = solve_mna(dc_model["node_count"], dc_resistors, dc_sources, deadline)
+        if "error" in dc_solution:
+            for node in dc_active:
+                if node == 0:
+                    continue
+                dc_resistors.append({"n1": node, "n2": 0, "value": SHUNT_RESISTANCE})
+            if dc_devices:
+                dc_solution = solve_mna_nonlinear(
+                    dc_model["node_count"], dc_resistors, dc_sources, dc_devices, deadline=deadline
+                )
+            else:
+                dc_solution = solve_mna(dc_model["node_count"], dc_resistors, dc_sources, deadline)
+            if "error" in dc_solution:
+                metrics.SINGULAR_FALLBACKS.inc(("dc", "failed"))
+                solve_errors["__network_dc"] = "Kunde inte lösa DC-nätet."
+                dc_solution = {"node_voltages": [0.0] * dc_model["node_count"], "source_currents": {}}
+            else:
+                metrics.SINGULAR_FALLBACKS.inc(("dc", "recovered"))
+        if "newton" in dc_solution:
+            _finish_nonlinear("dc", dc_model, dc_solution, dc_devices, debug_info, solve_errors, warm)
+        metrics.SOLVE_SECONDS.observe(time.perf_counter() - started, ("dc",))
+        add_phase(timings, "dcSolve", started)
+        metrics.MATRIX_SIZE.observe(dc_model["node_count"], ("dc",))
+    else:
+        dc_solution = {"node_voltages": [0.0] * dc_model["node_count"], "source_currents": {}}
+
+    if freq is not None:
+        started = time.perf_counter()
+        ac_model = build_model_ac(components, wires, contactor_states, timer_states, plc_states, freq, terminal_data)
+        metrics.BUILD_SECONDS.observe(time.perf_counter() - started, ("ac",))
+        add_phase(timings, "acBuild", started)
+        if "error" in ac_model:
+            return ac_model
+        started = time.perf_counter()
+        ac_elements = ac_model["impedances"] + ac_model["devices"] + ac_model["sources"]
+        ac_floating, ac_reachable, ac_active = _find_floating_nodes(ac_model["node_count"], ac_elements)
+        ac_inactive = set(range(1, ac_model["node_count"])) - ac_active
+        ac_floating_all = ac_floating | ac_inactive
+        ac_source_reachable = _reachable_from_sources(ac_model["node_count"], ac_elements, ac_model["sources"])
+        debug_info["ac"] = {
+            "nodes": ac_model["node_count"],
+            "sources": len(ac_model["sources"]),
+            "elements": len(ac_elements),
+            "floating": len(ac_floating),
+            "inactive": len(ac_inactive),
+            "active": len(ac_active),
+            "virtualGround": ac_model.get("virtual_ground", False),
         }
         solve_errors.update(
             _component_errors_for_floating(
                 components,
-                dc_model["terminal_nodes"],
-                dc_floating,
-                dc_active,
-                dc_source_reachable,
-                "DC",
+                ac_model["terminal_nodes"],
+                ac_floating,
+                ac_active,
+                ac_source_reachable,
+                "AC",
             )
         )
-        dc_resistors = _filter_elements(dc_model["resistors"], dc_floating_all)
-        dc_sources = _filter_elements(dc_model["sources"], dc_floating_all)
-        for node in dc_floating_all:
+        ac_impedances = _filter_elements(ac_model["impedances"], ac_floating_all)
+        ac_sources = _filter_elements(ac_model["sources"], ac_floating_all)
+        ac_devices = _filter_elements(ac_model["devices"], ac_floating_all)
+        for node in ac_floating_all:
             if node == 0:
                 continue
-            dc_resistors.append({"n1": node, "n2": 0, "value": SHUNT_RESISTANCE})
-        if dc_sources:
-            dc_solution = solve_mna(dc_model["node_count"], dc_resistors, dc_sources)
-            if "error" in dc_solution:
-                for node in dc_active:
+            ac_impedances.append({"n1": node, "n2": 0, "value": Complex(SHUNT_RESISTANCE, 0)})
+        add_phase(timings, "floating", started)
+        if ac_sources:
+            started = time.perf_counter()
+            ac_solution = None
+            if ac_devices:
+                initial = _warm_voltages(warm, "ac", ac_devices)
+                ac_solution = solve_mna_nonlinear(
+                    ac_model["node_count"], ac_impedances, ac_sources, ac_devices, initial, True, deadline
+                )
+            elif any(src["role"] != "main" for src in ac_sources):
+                ac_solution = solve_mna_ac_balanced(ac_model["node_count"], ac_impedances, ac_sources, deadline)
+                metrics.BALANCED_SOLVES.inc(("per_phase" if ac_solution else "full",))
+                if ac_solution is not None:
+                    debug_info["ac"]["perPhase"] = ac_solution["reduced_size"]
+            if ac_solution is None:
+                ac_solution = solve_mna_ac(ac_model["node_count"], ac_impedances, ac_sources, deadline)
+            if "error" in ac_solution:
+                for node in ac_active:
                     if node == 0:
                         continue
-                    dc_resistors.append({"n1": node, "n2": 0, "value": SHUNT_RESISTANCE})
-                dc_solution = solve_mna(dc_model["node_count"], dc_resistors, dc_sources)
-                if "error" in dc_solution:
-                    solve_errors["__network_dc"] = "Kunde inte lösa DC-nätet."
-                    dc_solution = {"node_voltages": [0.0] * dc_model["node_count"], "source_currents": {}}
-        else:
-            dc_solution = {"node_voltages": [0.0] * dc_model["node_count"], "source_currents": {}}
-
-        if freq is not None:
-            ac_model = build_model_ac(components, wires, contactor_states, timer_states, plc_states, freq)
-            if "error" in ac_model:
-                return ac_model
-            ac_elements = ac_model["impedances"] + ac_model["sources"]
-            ac_floating, ac_reachable, ac_active = _find_floating_nodes(ac_model["node_count"], ac_elements)
-            ac_inactive = set(range(1, ac_model["node_count"])) - ac_active
-            ac_floating_all = ac_floating | ac_inactive
-            ac_source_reachable = _reachable_from_sources(
-                ac_model["node_count"], ac_elements, ac_model["sources"]
-            )
-            debug_info["ac"] = {
-                "nodes": ac_model["node_count"],
-                "sources": len(ac_model["sources"]),
-                "elements": len(ac_elements),
-                "floating": len(ac_floating),
-                "inactive": len(ac_inactive),
-                "active": len(ac_active),
-                "virtualGround": ac_model.get("virtual_ground", False),
-            }
-            solve_errors.update(
-                _component_errors_for_floating(
-                    components,
-                    ac_model["terminal_nodes"],
-                    ac_floating,
-                    ac_active,
-                    ac_source_reachable,
-                    "AC",
-                )
-            )
-            ac_impedances = _filter_elements(ac_model["impedances"], ac_floating_all)
-            ac_sources = _filter_elements(ac_model["sources"], ac_floating_all)
-            for node in ac_floating_all:
-                if node == 0:
-                    continue
-                ac_impedances.append({"n1": node, "n2": 0, "value": Complex(SHUNT_RESISTANCE, 0)})
-            if ac_sources:
-                ac_solution = solve_mna_ac(ac_model["node_count"], ac_impedances, ac_sources)
+                    ac_impedances.append({"n1": node, "n2": 0, "value": Complex(SHUNT_RESISTANCE, 0)})
+                if ac_devices:
+                    ac_solution = solve_mna_nonlinear(
+                        ac_model["node_count"], ac_impedances, ac_sources, ac_devices, ac=True, deadline=deadline
+                    )
+                else:
+                    ac_solution = solve_mna_ac(ac_model["node_count"], ac_impedances, ac_sources, deadline)
                 if "error" in ac_solution:
-                    for node in ac_active:
-                        if node == 0:
-                            continue
-                        ac_impedances.append({"n1": node, "n2": 0, "value": Complex(SHUNT_RESISTANCE, 0)})
-                    ac_solution = solve_mna_ac(ac_model["node_count"], ac_impedances, ac_sources)
-                    if "error" in ac_solution:
-                        solve_errors["__network_ac"] = "Kunde inte lösa AC-nätet."
-                        ac_solution = {"node_voltages": [Complex(0, 0)] * ac_model["node_count"], "source_currents": {}}
-            else:
-                ac_solution = {"node_voltages": [Complex(0, 0)] * ac_model["node_count"], "source_currents": {}}
+                    metrics.SINGULAR_FALLBACKS.inc(("ac", "failed"))
+                    solve_errors["__network_ac"] = "Kunde inte lösa AC-nätet."
+                    ac_solution = {"node_voltages": [Complex(0, 0)] * ac_model["node_count"], "source_currents": {}}
+                else:
+                    metrics.SINGULAR_FALLBACKS.inc(("ac", "recovered"))
+            if "newton" in ac_solution:
+                _finish_nonlinear("ac", ac_model, ac_solution, ac_devices, debug_info, solve_errors, warm)
+            solve_errors.update(_ac_diode_errors(components, ac_model["terminal_nodes"], ac_solution["node_voltages"]))
+            metrics.SOLVE_SECONDS.observe(time.perf_counter() - started, ("ac",))
+            add_phase(timings, "acSolve", started)
+            metrics.MATRIX_SIZE.observe(ac_model["node_count"], ("ac",))
         else:
-            ac_solution = None
+            ac_solution = {"node_voltages": [Complex(0, 0)] * ac_model["node_count"], "source_currents": {}}
+    return {
+        "dc_model": dc_model,
+        "dc_solution": dc_solution,
+        "ac_model": ac_model,
+        "ac_solution": ac_solution,
+        "solve_errors": solve_errors,
+        "debug_info": debug_info,
+    }
 
-        terminal_nodes = dc_model["terminal_nodes"]
-        updated = compute_contactor_states(
-            components,
-            terminal_nodes,
-            dc_solution["node_voltages"] if dc_solution else None,
-            ac_solution["node_voltages"] if ac_solution else None,
-        )
-        updated_timers = compute_timer_states(
-            components,
-            terminal_nodes,
-            dc_solution["node_voltages"] if dc_solution else None,
-            ac_solution["node_voltages"] if ac_solution else None,
-            sim_time,
-        )
+
+def _device_signature(devices):
+    return tuple((device["n1"], device["n2"], device["kind"], device["params"]) for device in devices)
+
+
+# The last solution is only a useful guess for the same devices with the same
+# parameters; after a prop change it can be far from the new operating point.
+def _warm_voltages(warm, analysis, devices):
+    entry = warm.get(analysis) if warm is not None else None
+    if entry is None or entry[0] != _device_signature(devices):
+        return None
+    return entry[1]
+
+
+# A phasor solve has no polarity, so diodes are left open in AC. A diode with
+# AC voltage across it would need rectification, which is refused with an
+# error rather than answered wrongly.
+def _ac_diode_errors(components, terminal_nodes, voltages):
+    errors = {}
+    for comp in components:
+        if comp.get("type") != "diode":
+            continue
+        n1 = terminal_nodes.get(f"{comp['id']}:0")
+        n2 = terminal_nodes.get(f"{comp['id']}:1")
+        if n1 is None or n2 is None:
+            continue
+        if abs(voltages[n1] - voltages[n2]) > EPSILON_V:
+            errors[comp["id"]] = "Dioder kan inte simuleras med växelström (AC)."
+    return errors
+
+
+def _finish_nonlinear(analysis, model, solution, devices, debug_info, solve_errors, warm):
+    newton = solution["newton"]
+    metrics.NEWTON_ITERATIONS.observe(newton["iterations"], (analysis,))
+    debug_info[analysis]["newton"] = newton
+    if not newton["converged"]:
+        solve_errors[f"__network_{analysis}"] = f"Olinjära komponenter konvergerade inte ({analysis.upper()})."
+    elif warm is not None:
+        warm[analysis] = (_device_signature(devices), solution["node_voltages"])
+    key = "resistors" if analysis == "dc" else "impedances"
+    model[key] = model[key] + _secant_elements(devices, solution["node_voltages"], analysis == "ac")
+
+
+def _electrical_key(circuit, contactor_states, timer_states, plc_states):
+    return (
+        circuit,
+        tuple(sorted(contactor_states.items())),
+        tuple(sorted((comp_id, bool(state.get("outputClosed"))) for comp_id, state in timer_states.items())),
+        tuple(sorted((comp_id, tuple(outputs)) for comp_id, outputs in plc_states.items())),
+    )
+
+
+def _initial_states(components):
+    contactor_states = {comp["id"]: False for comp in components if comp.get("type") == "contactor"}
+    timer_states = {}
+    for comp in components:
+        if comp.get("type") == "timer":
+            timer_states[comp["id"]] = comp.get("props", {}).get("timerState", {}) or {}
+    timer_states.update(compute_time_timer_states(components))
+    plc_states = {}
+    for comp in components:
+        if comp.get("type") == "plc":
+            outputs = max(1, min(64, int(comp.get("props", {}).get("outputs", 4))))
+            plc_states[comp["id"]] = [False] * outputs
+    return contactor_states, timer_states, plc_states
+
+
+# Solves until contactor, timer and PLC states stop changing, at most three
+# times. electrical(contactor_states, timer_states, plc_states, timings)
+# returns a _solve_electrical stage. forced pins contactor states, which the
+# contingency analysis uses to toggle a contactor by hand. A SolveTimeout
+# after the first iteration returns the last finished one as partial.
+def settle_states(components, sim_time, electrical, deadline=None, phase_timings=None, forced=None):
+    contactor_states, timer_states, plc_states = _initial_states(components)
+    if forced:
+        contactor_states.update(forced)
+    plc_meta = {}
+    solve_errors = {}
+    debug_info = {}
+    partial = False
+    iterations = 0
+    stage = None
+    for _ in range(3):
+        iterations += 1
+        timings = {} if phase_timings is not None else None
+        if phase_timings is not None:
+            phase_timings["iterations"].append(timings)
+        try:
+            stage = electrical(contactor_states, timer_states, plc_states, timings)
+        except SolveTimeout:
+            if stage is None:
+                raise
+            partial = True
+            break
+        if "error" in stage:
+            return stage
+        dc_solution = stage["dc_solution"]
+        ac_solution = stage["ac_solution"]
+        solve_errors.update(stage["solve_errors"])
+        debug_info["dc"] = stage["debug_info"]["dc"]
+        debug_info["ac"] = stage["debug_info"]["ac"]
+
+        terminal_nodes = stage["dc_model"]["terminal_nodes"]
+        dc_voltages = dc_solution["node_voltages"] if dc_solution else None
+        ac_voltages = ac_solution["node_voltages"] if ac_solution else None
+        started = time.perf_counter()
+        updated = compute_contactor_states(components, terminal_nodes, dc_voltages, ac_voltages)
+        if forced:
+            updated.update(forced)
+        add_phase(timings, "contactors", started)
+        started = time.perf_counter()
+        updated_timers = compute_timer_states(components, terminal_nodes, dc_voltages, ac_voltages, sim_time)
         updated_timers.update(compute_time_timer_states(components))
+        add_phase(timings, "timers", started)
+        started = time.perf_counter()
         updated_plc, updated_plc_meta = compute_plc_states(
-            components,
-            terminal_nodes,
-            dc_solution["node_voltages"] if dc_solution else None,
-            ac_solution["node_voltages"] if ac_solution else None,
-            sim_time,
+            components, terminal_nodes, dc_voltages, ac_voltages, sim_time
         )
+        if plc_states:
+            metrics.PLC_SECONDS.observe(time.perf_counter() - started)
+        add_phase(timings, "plc", started)
         plc_meta = updated_plc_meta
         if (
             updated == contactor_states
@@ -1574,26 +2334,127 @@ def solve_network(payload):
         contactor_states = updated
         timer_states = updated_timers
         plc_states = updated_plc
-
+        if deadline is not None and time.time() >= deadline:
+            partial = True
+            break
     return {
-        "components": components,
-        "terminal_nodes": dc_model["terminal_nodes"],
+        "stage": stage,
         "contactor_states": contactor_states,
         "timer_states": timer_states,
         "plc_states": plc_states,
         "plc_meta": plc_meta,
-        "dc_solution": dc_solution,
-        "ac_solution": ac_solution,
         "solve_errors": solve_errors,
         "debug_info": debug_info,
+        "iterations": iterations,
+        "partial": partial,
     }
 
 
+# circuit and topology let a caller that tracks its own changes (sim.circuit)
+# skip hashing the whole circuit and the per-session topology lookup. The
+# topology also carries the last nonlinear solution as a Newton warm start.
+def solve_network(payload, circuit=None, topology=None):
+    components = payload.get("components", [])
+    wires = payload.get("wires", [])
+    freq = get_ac_frequency(components)
+    if isinstance(freq, dict):
+        return freq
+
+    profiling = profile_level(payload) is not None
+    phase_timings = {"unit": "ms", "iterations": []} if profiling else None
+    if circuit is None:
+        circuit = circuit_key(components, wires)
+    started = time.perf_counter()
+    if topology is None:
+        topology = get_topology(payload.get("sessionId"))
+    with topology.lock:
+        terminal_data = topology.sync(components, wires)
+    metrics.TOPOLOGY_SECONDS.observe(time.perf_counter() - started)
+    add_phase(phase_timings, "topology", started)
+
+    def electrical(contactor_states, timer_states, plc_states, timings):
+        key = _electrical_key(circuit, contactor_states, timer_states, plc_states)
+        # A profiled request always solves so its timings describe real work.
+        stage = MISSING if profiling else SOLVE_CACHE.get(key)
+        if stage is MISSING:
+            stage = _solve_electrical(
+                components,
+                wires,
+                contactor_states,
+                timer_states,
+                plc_states,
+                freq,
+                terminal_data,
+                timings,
+                topology.warm_start,
+                payload.get("deadline"),
+            )
+            if "error" not in stage:
+                SOLVE_CACHE.put(key, stage)
+        return stage
+
+    settled = settle_states(components, payload.get("simTime"), electrical, payload.get("deadline"), phase_timings)
+    if "error" in settled:
+        return settled
+    metrics.ITERATIONS.observe(settled["iterations"])
+    stage = settled["stage"]
+    debug_info = settled["debug_info"]
+    debug_info["topology"] = {
+        "changedNodes": len(terminal_data["changed_nodes"]),
+        "rebuilt": terminal_data["rebuilt"],
+    }
+    if profiling:
+        debug_info["timings"] = phase_timings
+    return {
+        "components": components,
+        "terminal_nodes": stage["dc_model"]["terminal_nodes"],
+        "contactor_states": settled["contactor_states"],
+        "timer_states": settled["timer_states"],
+        "plc_states": settled["plc_states"],
+        "plc_meta": settled["plc_meta"],
+        "dc_solution": stage["dc_solution"],
+        "ac_solution": stage["ac_solution"],
+        "dc_model": stage["dc_model"],
+        "ac_model": stage["ac_model"] if stage["ac_solution"] else None,
+        "solve_errors": settled["solve_errors"],
+        "debug_info": debug_info,
+        "partial": settled["partial"],
+    }
+
+
+# Circuits without timers or PLCs do not depend on simTime, so the whole
+# response can be reused. Other circuits still share SOLVE_CACHE entries for the
+# electrical solve of each contactor/timer/PLC output combination.
 def simulate_circuit(payload):
+    components = payload.get("components", [])
+    level = profile_level(payload)
+    if level == "cprofile":
+        response, top, dump = run_cprofile(_simulate_circuit, payload)
+        if "error" not in response:
+            response["debugInfo"]["profile"] = {"top": top}
+            response[PROFILE_DUMP_KEY] = dump
+        return response
+    if level or any(comp.get("type") in TIME_DEPENDENT_TYPES for comp in components):
+        return _simulate_circuit(payload)
+    key = (circuit_key(components, payload.get("wires", [])), bool(payload.get("branches")))
+    response = RESULT_CACHE.get(key)
+    if response is MISSING:
+        response = _simulate_circuit(payload)
+        if "error" not in response and not response.get("partial"):
+            RESULT_CACHE.put(key, response)
+    return response
+
+
+def _simulate_circuit(payload):
+    started = time.perf_counter()
     result = solve_network(payload)
     if "error" in result:
         return result
+    return simulation_response(result, payload.get("branches"), started)
 
+
+def simulation_response(result, branches=False, started=None):
+    finished = time.perf_counter()
     terminal_nodes = result["terminal_nodes"]
     dc_solution = result["dc_solution"]
     ac_solution = result["ac_solution"]
@@ -1622,15 +2483,13 @@ def simulate_circuit(payload):
         terminal_nodes,
         ac_solution["node_voltages"] if ac_solution else None,
     )
-    return {
+    ac_voltages = ac_solution["node_voltages"] if ac_solution else []
+    response = {
         "solution": {
             "nodeVoltages": dc_solution["node_voltages"] if dc_solution else [],
             "terminalNodes": terminal_nodes,
-            "acNodeVoltages": (
-                [{"re": v.re, "im": v.im} for v in ac_solution["node_voltages"]]
-                if ac_solution
-                else []
-            ),
+            # Parallel float lists instead of one {re, im} object per node.
+            "acNodeVoltages": {"re": [v.re for v in ac_voltages], "im": [v.im for v in ac_voltages]},
         },
         "contactorStates": result["contactor_states"],
         "lampLit": lamp_lit,
@@ -1643,3 +2502,12 @@ def simulate_circuit(payload):
         "plcMeta": result.get("plc_meta", {}),
         "debugInfo": result.get("debug_info", {}),
     }
+    if result["partial"]:
+        response["partial"] = True
+    if branches:
+        response["branches"] = compute_branch_quantities(result)
+    timings = response["debugInfo"].get("timings")
+    if timings is not None:
+        add_phase(timings, "response", finished)
+        add_phase(timings, "total", started if started is not None else finished)
+    return response
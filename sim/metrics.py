@@ -0,0 +1,171 @@
+import bisect
+import math
+import threading
+
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048)
+
+_registry = {}
+_collectors = {}
+
+
+# Metrics are plain dicts keyed by label tuples and updated under a lock;
+# nothing is formatted until /metrics is scraped. drain() and merge() move
+# values out of solver worker processes into the web process.
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.lock = threading.Lock()
+        self.values = {}
+        _registry[name] = self
+
+    def inc(self, labels=(), amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def drain(self):
+        with self.lock:
+            values, self.values = self.values, {}
+        return values
+
+    def merge(self, values):
+        with self.lock:
+            for labels, amount in values.items():
+                self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, labels, value) for labels, value in sorted(self.values.items())]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=TIME_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.values = {}
+        _registry[name] = self
+
+    def observe(self, value, labels=()):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(labels)
+            if state is None:
+                state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][idx] += 1
+            state[1] += value
+            state[2] += 1
+
+    def drain(self):
+        with self.lock:
+            values, self.values = self.values, {}
+        return values
+
+    def merge(self, values):
+        with self.lock:
+            for labels, (counts, total, count) in values.items():
+                state = self.values.get(labels)
+                if state is None:
+                    state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                for idx, value in enumerate(counts):
+                    state[0][idx] += value
+                state[1] += total
+                state[2] += count
+
+    def samples(self):
+        rows = []
+        with self.lock:
+            items = sorted((labels, (list(counts), total, count)) for labels, (counts, total, count) in self.values.items())
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, value in zip(self.buckets + (math.inf,), counts):
+                cumulative += value
+                rows.append((f"{self.name}_bucket", labels + (_format_value(bound),), cumulative))
+            rows.append((f"{self.name}_sum", labels, total))
+            rows.append((f"{self.name}_count", labels, count))
+        return rows
+
+
+# Values owned by other modules (queue depth, single-flight counters) are read
+# through a callback at scrape time instead of being mirrored here.
+def register_collector(name, help_text, collect, labelnames=(), kind="gauge"):
+    _collectors[name] = (help_text, labelnames, kind, collect)
+
+
+def drain():
+    return {name: metric.drain() for name, metric in _registry.items()}
+
+
+def merge(delta):
+    for name, values in delta.items():
+        metric = _registry.get(name)
+        if metric is not None and values:
+            metric.merge(values)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, labels))
+    return "{" + pairs + "}"
+
+
+def render():
+    lines = []
+    for name, metric in sorted(_registry.items()):
+        lines.append(f"# HELP {name} {metric.help}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        names = metric.labelnames
+        for sample, labels, value in metric.samples():
+            label_names = names + ("le",) if sample.endswith("_bucket") else names
+            lines.append(f"{sample}{_format_labels(label_names, labels)} {_format_value(value)}")
+    for name, (help_text, names, kind, collect) in sorted(_collectors.items()):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in collect():
+            lines.append(f"{name}{_format_labels(names, labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+REQUEST_SECONDS = Histogram(
+    "ellabb_http_request_duration_seconds", "HTTP request latency.", ("route", "method", "status")
+)
+TOPOLOGY_SECONDS = Histogram("ellabb_topology_sync_seconds", "Time spent syncing terminal nodes.")
+BUILD_SECONDS = Histogram("ellabb_model_build_seconds", "Time spent building the MNA model.", ("analysis",))
+SOLVE_SECONDS = Histogram("ellabb_mna_solve_seconds", "Time spent assembling and solving MNA.", ("analysis",))
+ITERATIONS = Histogram(
+    "ellabb_fixed_point_iterations", "Fixed-point iterations per solve_network call.", buckets=(1, 2, 3)
+)
+MATRIX_SIZE = Histogram("ellabb_matrix_nodes", "Node count of solved networks.", ("analysis",), SIZE_BUCKETS)
+PLC_SECONDS = Histogram("ellabb_plc_scan_seconds", "Time spent evaluating PLC programs.")
+CACHE_LOOKUPS = Counter("ellabb_cache_lookups_total", "Solver cache lookups.", ("cache", "result"))
+SINGULAR_FALLBACKS = Counter(
+    "ellabb_singular_fallbacks_total", "Solves that needed the extra shunt fallback.", ("analysis", "outcome")
+)
+BALANCED_SOLVES = Counter("ellabb_balanced_ac_solves_total", "Three-phase AC solves by path taken.", ("path",))
+CONTINGENCY_SOLVES = Counter(
+    "ellabb_contingency_solves_total", "Contingency analysis solves by path taken.", ("path",)
+)
+NEWTON_ITERATIONS = Histogram(
+    "ellabb_newton_iterations", "Newton iterations per nonlinear solve.", ("analysis",), (1, 2, 3, 5, 10, 20, 50, 100)
+)
@@ -0,0 +1,48 @@
+import cProfile
+import marshal
+import pstats
+import time
+
+PROFILE_DUMP_KEY = "profileDump"
+TOP_FUNCTIONS = 15
+
+
+# "profile": true (or "phases") adds wall times per phase to debugInfo;
+# "profile": "cprofile" also runs the request under cProfile.
+def profile_level(payload):
+    value = payload.get("profile")
+    if value in (True, 1, "phases"):
+        return "phases"
+    if value in (2, "cprofile"):
+        return "cprofile"
+    return None
+
+
+def add_phase(timings, phase, started):
+    if timings is None:
+        return
+    timings[phase] = timings.get(phase, 0.0) + (time.perf_counter() - started) * 1000
+
+
+def _function_label(key):
+    filename, line, name = key
+    if filename == "~":
+        return name
+    return f"{filename.rsplit('/', 1)[-1]}:{line}({name})"
+
+
+def run_cprofile(fn, *args):
+    profiler = cProfile.Profile()
+    result = profiler.runcall(fn, *args)
+    stats = pstats.Stats(profiler).stats
+    ranked = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:TOP_FUNCTIONS]
+    top = [
+        {
+            "function": _function_label(key),
+            "calls": calls,
+            "totalMs": round(total * 1000, 3),
+            "cumulativeMs": round(cumulative * 1000, 3),
+        }
+        for key, (_, calls, total, cumulative, _) in ranked
+    ]
+    return result, top, marshal.dumps(stats)
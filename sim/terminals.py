@@ -0,0 +1,89 @@
+def get_terminal_count(component):
+    comp_type = component.get("type")
+    if comp_type == "contactor":
+        props = component.get("props", {})
+        poles = props.get("poles") or ["NO"]
+        if props.get("contactType", "standard") == "changeover":
+            return 2 + 3 * len(poles)
+        return 2 + 2 * len(poles)
+    if comp_type == "timer":
+        return 5
+    if comp_type == "time_timer":
+        return 3
+    if comp_type == "plc":
+        inputs, outputs = plc_io_counts(component.get("props", {}))
+        return 2 + inputs + outputs
+    if comp_type == "voltage_source":
+        props = component.get("props", {})
+        supply = props.get("supplyType", "DC")
+        if supply == "AC3":
+            if props.get("connection", "Y") == "Delta":
+                return 3
+            return 4
+        return 2
+    if comp_type == "switch_spdt":
+        return 3
+    if comp_type == "motor_3ph":
+        return 3
+    if comp_type == "node":
+        return 4
+    if comp_type == "ground":
+        return 1
+    return 2
+
+
+def terminals(comp_id, count):
+    return tuple(f"{comp_id}:{idx}" for idx in range(count))
+
+
+def two_terminal_layout(comp_id, props):
+    return terminals(comp_id, 2)
+
+
+def three_terminal_layout(comp_id, props):
+    return terminals(comp_id, 3)
+
+
+def motor3ph_layout(comp_id, props):
+    return terminals(comp_id, 3) + (f"{comp_id}:N",)
+
+
+def contactor_layout_key(props):
+    return (props.get("contactType", "standard"), len(props.get("poles") or ["NO"]))
+
+
+def contactor_layout(comp_id, props):
+    contact_type, pole_count = contactor_layout_key(props)
+    coil = terminals(comp_id, 2)
+    if contact_type == "changeover":
+        poles = tuple(
+            (f"{comp_id}:{2 + idx * 3}", f"{comp_id}:{3 + idx * 3}", f"{comp_id}:{4 + idx * 3}")
+            for idx in range(pole_count)
+        )
+    else:
+        poles = tuple((f"{comp_id}:{2 + idx * 2}", f"{comp_id}:{3 + idx * 2}") for idx in range(pole_count))
+    return coil, poles
+
+
+def timer_layout(comp_id, props):
+    return terminals(comp_id, 5)
+
+
+def plc_io_counts(props):
+    inputs = max(1, min(64, int(props.get("inputs", 4))))
+    outputs = max(1, min(64, int(props.get("outputs", 4))))
+    return inputs, outputs
+
+
+def plc_layout(comp_id, props):
+    inputs, outputs = plc_io_counts(props)
+    return (
+        f"{comp_id}:0",
+        f"{comp_id}:1",
+        tuple(f"{comp_id}:{2 + idx}" for idx in range(inputs)),
+        tuple(f"{comp_id}:{2 + inputs + idx}" for idx in range(outputs)),
+    )
+
+
+def voltage_source_layout(comp_id, props):
+    return terminals(comp_id, 4)
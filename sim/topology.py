@@ -0,0 +1,314 @@
+import threading
+from collections import Counter, OrderedDict
+
+from sim.terminals import get_terminal_count
+
+MAX_TOPOLOGIES = 256
+REBUILD_FRACTION = 0.5
+
+
+def _wire_key(wire):
+    return (
+        (wire["from"]["compId"], wire["from"]["index"]),
+        (wire["to"]["compId"], wire["to"]["index"]),
+    )
+
+
+# Nets are explicit terminal sets indexed by node number. Adding a wire merges
+# the smaller net into the larger; removing one searches from both ends so only
+# the smaller side of a split is relabelled. Freed indices are filled by the
+# last net and the ground net is kept at node 0, as in build_terminal_nodes.
+class IncrementalTopology:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.specs = {}
+        self.order = []
+        self.wires = Counter()
+        self.wires_by_comp = {}
+        self.presence = Counter()
+        self.adjacency = {}
+        self.node_of = {}
+        self.nets = []
+        self.virtual_ground = False
+        self.changed = set()
+        self.initialized = False
+        # Device signature and node voltages of the last nonlinear solve, per
+        # analysis. Dropped whenever a sync renumbers any node.
+        self.warm_start = {}
+
+    def _valid(self, ref):
+        spec = self.specs.get(ref[0])
+        return spec is not None and ref[1] < spec[1]
+
+    def _key(self, ref):
+        return f"{ref[0]}:{ref[1]}"
+
+    def _new_net(self, terminals):
+        index = len(self.nets)
+        self.nets.append(set(terminals))
+        for key in terminals:
+            self.node_of[key] = index
+        self.changed.add(index)
+        return index
+
+    def _free_net(self, index):
+        last = len(self.nets) - 1
+        if index != last:
+            moved = self.nets[last]
+            self.nets[index] = moved
+            for key in moved:
+                self.node_of[key] = index
+        self.nets.pop()
+        self.changed.add(index)
+        self.changed.add(last)
+
+    def _touch(self, key):
+        self.presence[key] += 1
+        if self.presence[key] == 1:
+            self._new_net([key])
+
+    def _untouch(self, key):
+        self.presence[key] -= 1
+        if self.presence[key] > 0:
+            return
+        del self.presence[key]
+        index = self.node_of.pop(key)
+        net = self.nets[index]
+        net.discard(key)
+        self.changed.add(index)
+        if not net:
+            self._free_net(index)
+
+    def _link(self, a, b):
+        if a == b:
+            return
+        self.adjacency.setdefault(a, Counter())[b] += 1
+        self.adjacency.setdefault(b, Counter())[a] += 1
+        ia = self.node_of[a]
+        ib = self.node_of[b]
+        if ia == ib:
+            return
+        if len(self.nets[ia]) < len(self.nets[ib]):
+            ia, ib = ib, ia
+        small = self.nets[ib]
+        self.nets[ia] |= small
+        for key in small:
+            self.node_of[key] = ia
+        self.nets[ib] = set()
+        self.changed.add(ia)
+        self._free_net(ib)
+
+    def _drop_edge(self, a, b):
+        for x, y in ((a, b), (b, a)):
+            neighbours = self.adjacency[x]
+            neighbours[y] -= 1
+            if neighbours[y] <= 0:
+                del neighbours[y]
+            if not neighbours:
+                del self.adjacency[x]
+
+    def _unlink(self, a, b):
+        if a == b:
+            return
+        self._drop_edge(a, b)
+        if b in self.adjacency.get(a, ()):
+            return
+        side = self._smaller_side(a, b)
+        if side is None:
+            return
+        index = self.node_of[a]
+        self.nets[index] -= side
+        self.changed.add(index)
+        self._new_net(side)
+
+    def _smaller_side(self, a, b):
+        seen = ({a}, {b})
+        stacks = ([a], [b])
+        while stacks[0] and stacks[1]:
+            for side in (0, 1):
+                node = stacks[side].pop()
+                for neighbour in self.adjacency.get(node, ()):
+                    if neighbour in seen[1 - side]:
+                        return None
+                    if neighbour not in seen[side]:
+                        seen[side].add(neighbour)
+                        stacks[side].append(neighbour)
+                if not stacks[side]:
+                    return seen[side]
+        return seen[0] if not stacks[0] else seen[1]
+
+    def _add_wire(self, wire_key):
+        ra, rb = wire_key
+        ka = self._key(ra) if self._valid(ra) else None
+        kb = self._key(rb) if self._valid(rb) else None
+        if ka is not None:
+            self._touch(ka)
+        if kb is not None:
+            self._touch(kb)
+        if ka is not None and kb is not None:
+            self._link(ka, kb)
+
+    def _remove_wire(self, wire_key):
+        ra, rb = wire_key
+        ka = self._key(ra) if self._valid(ra) else None
+        kb = self._key(rb) if self._valid(rb) else None
+        if ka is not None and kb is not None:
+            self._unlink(ka, kb)
+        if ka is not None:
+            self._untouch(ka)
+        if kb is not None:
+            self._untouch(kb)
+
+    def _pinned_terminals(self, comp_id):
+        comp_type, count = self.specs[comp_id]
+        if comp_type == "node":
+            return [f"{comp_id}:{idx}" for idx in range(count)]
+        if comp_type == "ground":
+            return [f"{comp_id}:0"]
+        return []
+
+    def _index_wire(self, wire_key, delta):
+        for comp_id in {wire_key[0][0], wire_key[1][0]}:
+            bucket = self.wires_by_comp.setdefault(comp_id, Counter())
+            bucket[wire_key] += delta
+            if bucket[wire_key] <= 0:
+                del bucket[wire_key]
+            if not bucket:
+                del self.wires_by_comp[comp_id]
+
+    def _replace_component(self, comp_id, spec):
+        attached = list(self.wires_by_comp.get(comp_id, Counter()).items())
+        for wire_key, count in attached:
+            for _ in range(count):
+                self._remove_wire(wire_key)
+        if comp_id in self.specs:
+            for key in self._pinned_terminals(comp_id):
+                self._untouch(key)
+            del self.specs[comp_id]
+        if spec is not None:
+            self.specs[comp_id] = spec
+            for key in self._pinned_terminals(comp_id):
+                self._touch(key)
+        for wire_key, count in attached:
+            for _ in range(count):
+                self._add_wire(wire_key)
+
+    def _ground_terminal(self):
+        for comp_id in self.order:
+            if self.specs[comp_id][0] == "ground":
+                return f"{comp_id}:0", False
+        for comp_id in self.order:
+            comp_type, count = self.specs[comp_id]
+            if comp_type != "voltage_source":
+                continue
+            for idx in range(count):
+                key = f"{comp_id}:{idx}"
+                if key in self.node_of:
+                    return key, True
+        for comp_id in self.order:
+            for idx in range(self.specs[comp_id][1]):
+                key = f"{comp_id}:{idx}"
+                if key in self.node_of:
+                    return key, True
+        return None, False
+
+    def _place_ground(self):
+        key, virtual = self._ground_terminal()
+        self.virtual_ground = virtual
+        if key is None:
+            return
+        index = self.node_of[key]
+        if index == 0:
+            return
+        self.nets[0], self.nets[index] = self.nets[index], self.nets[0]
+        for node in (0, index):
+            for terminal in self.nets[node]:
+                self.node_of[terminal] = node
+            self.changed.add(node)
+
+    def sync(self, components, wires):
+        specs = {}
+        order = []
+        for comp in components:
+            specs[comp["id"]] = (comp.get("type"), get_terminal_count(comp))
+            order.append(comp["id"])
+        wire_counts = Counter(_wire_key(wire) for wire in wires)
+
+        removed = self.wires - wire_counts
+        added = wire_counts - self.wires
+        changed_comps = [
+            comp_id for comp_id in set(specs) | set(self.specs) if specs.get(comp_id) != self.specs.get(comp_id)
+        ]
+        edits = sum(removed.values()) + sum(added.values()) + len(changed_comps)
+        budget = max(8, REBUILD_FRACTION * (len(wire_counts) + len(specs)))
+        self.changed = set()
+        rebuilt = False
+        if not self.initialized or edits > budget:
+            self._reset()
+            self.initialized = True
+            rebuilt = True
+            removed = Counter()
+            added = wire_counts
+            changed_comps = order
+
+        for wire_key, count in removed.items():
+            for _ in range(count):
+                self._remove_wire(wire_key)
+            self._index_wire(wire_key, -count)
+        self.wires -= removed
+
+        for comp_id in changed_comps:
+            self._replace_component(comp_id, specs.get(comp_id))
+        self.order = order
+
+        for wire_key, count in added.items():
+            for _ in range(count):
+                self._add_wire(wire_key)
+            self._index_wire(wire_key, count)
+        self.wires += added
+
+        self._place_ground()
+        node_count = max(1, len(self.nets))
+        if rebuilt:
+            changed_nodes = list(range(node_count))
+        else:
+            changed_nodes = sorted(node for node in self.changed if node < node_count)
+        if changed_nodes:
+            self.warm_start = {}
+        return {
+            "terminal_nodes": dict(self.node_of),
+            "node_count": node_count,
+            "virtual_ground": self.virtual_ground,
+            "changed_nodes": changed_nodes,
+            "rebuilt": rebuilt,
+        }
+
+
+_topologies = OrderedDict()
+_topologies_lock = threading.Lock()
+
+
+# Callers without a session get a topology of their own; a shared one would be
+# invalidated by every unrelated circuit solved through it.
+def get_topology(session_id):
+    if session_id is None:
+        return IncrementalTopology()
+    with _topologies_lock:
+        topology = _topologies.get(session_id)
+        if topology is None:
+            topology = IncrementalTopology()
+            _topologies[session_id] = topology
+            while len(_topologies) > MAX_TOPOLOGIES:
+                _topologies.popitem(last=False)
+        else:
+            _topologies.move_to_end(session_id)
+        return topology
+
+
+def sync_terminal_nodes(session_id, components, wires):
+    topology = get_topology(session_id)
+    with topology.lock:
+        return topology.sync(components, wires)
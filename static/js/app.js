@@ -14,6 +14,8 @@ const meterReadout = document.getElementById("meterReadout");
 const saveNameInput = document.getElementById("saveName");
 const saveBtn = document.getElementById("saveBtn");
 const saveList = document.getElementById("saveList");
+const saveSearch = document.getElementById("saveSearch");
+const saveMore = document.getElementById("saveMore");
 const canvasResizer = document.getElementById("canvasResizer");
 const debugLog = document.getElementById("debugLog");
 const debugClear = document.getElementById("debugClear");
@@ -35,7 +37,11 @@ const CONTACTOR_W = 120;
 const CONTACTOR_MIN_H = 70;
 const WIRE_LIVE_THRESHOLD = 0.5;
 const SIM_POLL_MS = 300;
+const SAVES_PAGE_SIZE = 50;
+const SAVE_SEARCH_DELAY_MS = 250;
 const DEFAULT_LANG = "sv";
+// ?profile=1 adds phase timings to the debug log, ?profile=cprofile also a pstats download.
+const PROFILE_LEVEL = new URLSearchParams(window.location.search).get("profile");
 
 const i18nCache = {};
 let translations = {};
@@ -86,6 +92,7 @@ const state = {
   language: DEFAULT_LANG,
   symbolDefs: null,
   symbolImages: {},
+  sessionId: crypto.randomUUID(),
 };
 
 const libraryGroups = [
@@ -108,7 +115,7 @@ const libraryGroups = [
         id: "lamp",
         type: "lamp",
         labelKey: "component.lamp",
-        defaults: { value: 80, threshold: 6, ratedVoltage: 12, litColor: "#f6c453" },
+        defaults: { value: 80, threshold: 6, ratedVoltage: 12, coldResistance: 8, litColor: "#f6c453" },
       },
       { id: "motor", type: "motor", labelKey: "component.motor", defaults: { value: 20, startVoltage: 6 } },
       {
@@ -120,6 +127,8 @@ const libraryGroups = [
       { id: "resistor", type: "resistor", labelKey: "component.resistor", defaults: { value: 100 } },
       { id: "capacitor", type: "capacitor", labelKey: "component.capacitor", defaults: { value: 1e-6 } },
       { id: "inductor", type: "inductor", labelKey: "component.inductor", defaults: { value: 0.1 } },
+      { id: "diode", type: "diode", labelKey: "component.diode", defaults: { forwardVoltage: 0.7 } },
+      { id: "varistor", type: "varistor", labelKey: "component.varistor", defaults: { clampVoltage: 30, alpha: 25 } },
     ],
   },
   {
@@ -202,6 +211,8 @@ const componentLabels = {
   resistor: "R",
   capacitor: "C",
   inductor: "L",
+  diode: "D",
+  varistor: "VDR",
   switch: "S",
   push_button: "PB",
   switch_spdt: "S",
@@ -583,7 +594,7 @@ function scheduleNextSimulation() {
   const delay = Math.max(150, Math.min(baseDelay, SIM_POLL_MS));
   state.simTimerId = setTimeout(() => {
     if (state.simRunning) {
-      requestSimulation();
+      requestSimulation("background");
     }
   }, delay);
 }
@@ -783,41 +794,64 @@ async function fetchJSON(url, options = {}) {
   return payload;
 }
 
-async function renderSaveList() {
+// The list is fetched a page at a time; "more" follows nextCursor and a new
+// search starts over. Responses from an older search are dropped.
+let saveListCursor = null;
+let saveListRequest = 0;
+let saveSearchTimer = null;
+
+function saveListUrl(cursor) {
+  const params = new URLSearchParams({ limit: String(SAVES_PAGE_SIZE) });
+  const query = saveSearch ? saveSearch.value.trim() : "";
+  if (query) params.set("q", query);
+  if (cursor) params.set("cursor", cursor);
+  return `/api/saves?${params}`;
+}
+
+function appendSaveItem(save) {
+  const row = document.createElement("div");
+  row.className = "save-item";
+  const name = document.createElement("div");
+  name.textContent = save.name;
+  const load = document.createElement("button");
+  load.textContent = t("save.load", "Load");
+  load.addEventListener("click", async () => {
+    const data = await fetchJSON(`/api/saves/${save.id}`);
+    loadFromSnapshot(data.snapshot || {});
+    if (state.simRunning) markDirty();
+  });
+  const remove = document.createElement("button");
+  remove.textContent = t("save.remove", "Delete");
+  remove.addEventListener("click", async () => {
+    await fetchJSON(`/api/saves/${save.id}`, { method: "DELETE" });
+    renderSaveList();
+  });
+  row.appendChild(name);
+  row.appendChild(load);
+  row.appendChild(remove);
+  saveList.appendChild(row);
+}
+
+async function renderSaveList(append = false) {
   if (!saveList) return;
-  saveList.innerHTML = "";
+  const request = ++saveListRequest;
+  const cursor = append ? saveListCursor : null;
   try {
-    const payload = await fetchJSON("/api/saves");
+    const payload = await fetchJSON(saveListUrl(cursor));
+    if (request !== saveListRequest) return;
     const saves = payload.saves || [];
-    if (!saves.length) {
+    if (!append) saveList.innerHTML = "";
+    saveListCursor = payload.nextCursor || null;
+    if (saveMore) saveMore.hidden = !saveListCursor;
+    if (!saves.length && !append) {
       saveList.innerHTML = `<div class="muted">${t("save.empty", "No saved labs yet.")}</div>`;
       return;
     }
-    saves.forEach((save) => {
-      const row = document.createElement("div");
-      row.className = "save-item";
-      const name = document.createElement("div");
-      name.textContent = save.name;
-      const load = document.createElement("button");
-      load.textContent = t("save.load", "Load");
-      load.addEventListener("click", async () => {
-        const data = await fetchJSON(`/api/saves/${save.id}`);
-        loadFromSnapshot(data.snapshot || {});
-        if (state.simRunning) markDirty();
-      });
-      const remove = document.createElement("button");
-      remove.textContent = t("save.remove", "Delete");
-      remove.addEventListener("click", async () => {
-        await fetchJSON(`/api/saves/${save.id}`, { method: "DELETE" });
-        renderSaveList();
-      });
-      row.appendChild(name);
-      row.appendChild(load);
-      row.appendChild(remove);
-      saveList.appendChild(row);
-    });
+    saves.forEach(appendSaveItem);
   } catch (error) {
+    if (request !== saveListRequest) return;
     saveList.innerHTML = `<div class="muted">${error.message}</div>`;
+    if (saveMore) saveMore.hidden = true;
   }
 }
 
@@ -841,13 +875,83 @@ async function postJSON(url, data) {
   return payload;
 }
 
-async function requestSimulation() {
+const SIM_BINARY_TYPE = "application/vnd.ellabb.sim+binary";
+const BINARY_BOOL_MAPS = ["lampLit", "motorRunning", "contactorStates"];
+
+// Layout is described in api/binary.py: magic, header length, JSON header,
+// padding to 8 bytes, then 8-byte aligned sections that become typed-array
+// views over the response buffer without copying.
+function decodeSimulationBuffer(buffer, componentIds) {
+  const view = new DataView(buffer);
+  const headerLength = view.getUint32(4, true);
+  const payload = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, headerLength)));
+  const base = Math.ceil((8 + headerLength) / 8) * 8;
+  const layout = payload.binary;
+  delete payload.binary;
+  const floats = (section) =>
+    section.type === "f32"
+      ? new Float32Array(buffer, base + section.offset, section.length)
+      : new Float64Array(buffer, base + section.offset, section.length);
+  const bytes = new Uint8Array(buffer, base);
+  const bit = (offset, index) => (bytes[offset + (index >> 3)] >> (index & 7)) & 1;
+  payload.solution.nodeVoltages = floats(layout.nodeVoltages);
+  payload.solution.acNodeVoltages = {
+    re: floats(layout.acNodeVoltages.re),
+    im: floats(layout.acNodeVoltages.im),
+  };
+  BINARY_BOOL_MAPS.forEach((name) => {
+    const map = {};
+    const { present, values } = layout[name];
+    componentIds.forEach((id, index) => {
+      if (bit(present, index)) map[id] = Boolean(bit(values, index));
+    });
+    payload[name] = map;
+  });
+  const plcStates = {};
+  let position = 0;
+  layout.plcStates.components.forEach((index, i) => {
+    const outputs = [];
+    for (let k = 0; k < layout.plcStates.counts[i]; k += 1) {
+      outputs.push(Boolean(bit(layout.plcStates.offset, position + k)));
+    }
+    position += layout.plcStates.counts[i];
+    plcStates[componentIds[index]] = outputs;
+  });
+  payload.plcStates = plcStates;
+  return payload;
+}
+
+async function postSimulation(data) {
+  // Bitsets are indexed by the order of the components sent, so fix it now.
+  const componentIds = data.components.map((comp) => comp.id);
+  const response = await fetch("/api/simulate", {
+    method: "POST",
+    headers: { "Content-Type": "application/json", Accept: `${SIM_BINARY_TYPE}, application/json;q=0.9` },
+    body: JSON.stringify(data),
+  });
+  if (response.ok && (response.headers.get("Content-Type") || "").startsWith(SIM_BINARY_TYPE)) {
+    return decodeSimulationBuffer(await response.arrayBuffer(), componentIds);
+  }
+  const payload = await response.json().catch(() => ({}));
+  if (!response.ok) {
+    throw new Error(payload.error || "Serverfel");
+  }
+  return payload;
+}
+
+async function requestSimulation(priority = "interactive") {
   if (!state.simRunning || state.simPending) return;
   state.simPending = true;
   state.simDirty = false;
   simStatus.textContent = t("sim.running", "Simulating...");
   try {
-    const payload = await postJSON("/api/simulate", { ...serializeCircuit(), simTime: Date.now() });
+    const payload = await postSimulation({
+      ...serializeCircuit(),
+      simTime: Date.now(),
+      sessionId: state.sessionId,
+      priority,
+      ...(PROFILE_LEVEL ? { profile: PROFILE_LEVEL === "cprofile" ? "cprofile" : true } : {}),
+    });
     state.lastSolution = payload.solution || null;
     state.contactorStates = payload.contactorStates || {};
     state.timerStates = payload.timerStates || {};
@@ -906,6 +1010,9 @@ async function requestSimulation() {
     }
     simStatus.textContent = summary;
     const details = [];
+    if (payload.partial) {
+      details.push(t("sim.deadline", "Time limit reached; contactor and timer states may not have settled."));
+    }
     if (solveMessages.length) {
       details.push(`${t("sim.partial_errors", "Partial errors")}: ${solveMessages.join("; ")}`);
     }
@@ -925,6 +1032,20 @@ async function requestSimulation() {
         `AC: ${t("debug.nodes", "nodes")}=${debugInfo.ac.nodes}, ${t("debug.sources", "sources")}=${debugInfo.ac.sources}, ${t("debug.floating", "floating")}=${debugInfo.ac.floating}, ${t("debug.inactive", "inactive")}=${debugInfo.ac.inactive || 0}, ${t("debug.virtual_ground", "virtual ground")}=${debugInfo.ac.virtualGround ? t("common.yes", "yes") : t("common.no", "no")}`
       );
     }
+    if (debugInfo.timings) {
+      const formatPhases = (phases) =>
+        Object.entries(phases)
+          .filter(([, value]) => typeof value === "number")
+          .map(([phase, value]) => `${phase}=${value.toFixed(2)}`)
+          .join(", ");
+      details.push(`${t("debug.timings", "Timings (ms)")}: ${formatPhases(debugInfo.timings)}`);
+      debugInfo.timings.iterations.forEach((phases, index) => {
+        details.push(`${t("debug.iteration", "Iteration")} ${index + 1}: ${formatPhases(phases)}`);
+      });
+    }
+    if (debugInfo.profile && debugInfo.profile.url) {
+      details.push(`${t("debug.profile", "Profile")}: ${new URL(debugInfo.profile.url, window.location.href)}`);
+    }
     if (!details.length) {
       details.push(
         `${t("debug.components", "Components")}: ${state.components.length}, ${t("debug.wires", "wires")}: ${state.wires.length}`
@@ -944,7 +1065,7 @@ async function requestSimulation() {
     state.simPending = false;
     updatePropsPanel();
     render();
-    await refreshMeters();
+    await refreshMeters(priority);
     scheduleNextSimulation();
     if (state.simDirty) {
       requestSimulation();
@@ -954,7 +1075,11 @@ async function requestSimulation() {
 
 async function requestMeasure(payload) {
   try {
-    const result = await postJSON("/api/measure", { ...serializeCircuit(), ...payload });
+    const result = await postJSON("/api/measure", {
+      ...serializeCircuit(),
+      sessionId: state.sessionId,
+      ...payload,
+    });
     return result;
   } catch (error) {
     return { error: error.message || t("meter.failed", "Measurement failed.") };
@@ -1001,11 +1126,28 @@ async function updateMeterValue(meter) {
   meter.value = result.value;
 }
 
-async function refreshMeters() {
+async function refreshMeters(priority = "interactive") {
   if (!state.meters.length) return;
-  for (const meter of state.meters) {
-    await updateMeterValue(meter);
+  let readings = {};
+  try {
+    const payload = await postJSON("/api/measure/batch", {
+      ...serializeCircuit(),
+      sessionId: state.sessionId,
+      priority,
+    });
+    readings = payload.readings || {};
+  } catch (error) {
+    meterReadout.textContent = error.message || t("meter.failed", "Measurement failed.");
   }
+  state.meters.forEach((meter) => {
+    const result = readings[meter.id];
+    if (!result || result.error) {
+      meter.value = null;
+      if (result) meterReadout.textContent = result.error;
+      return;
+    }
+    meter.value = result.value;
+  });
   render();
 }
 
@@ -1633,6 +1775,34 @@ function drawComponent(component) {
     }
     ctx.lineTo(right, 0);
     ctx.stroke();
+  } else if (!symbolDrawn && component.type === "diode") {
+    const left = -COMPONENT_W / 2;
+    const right = COMPONENT_W / 2;
+    ctx.beginPath();
+    ctx.moveTo(left, 0);
+    ctx.lineTo(right, 0);
+    ctx.moveTo(-8, -10);
+    ctx.lineTo(-8, 10);
+    ctx.lineTo(8, 0);
+    ctx.closePath();
+    ctx.moveTo(8, -10);
+    ctx.lineTo(8, 10);
+    ctx.stroke();
+  } else if (!symbolDrawn && component.type === "varistor") {
+    const left = -COMPONENT_W / 2;
+    const right = COMPONENT_W / 2;
+    ctx.beginPath();
+    ctx.moveTo(left, 0);
+    ctx.lineTo(-18, 0);
+    ctx.moveTo(18, 0);
+    ctx.lineTo(right, 0);
+    ctx.stroke();
+    ctx.beginPath();
+    ctx.rect(-18, -8, 36, 16);
+    ctx.moveTo(-24, 12);
+    ctx.lineTo(-14, 12);
+    ctx.lineTo(14, -12);
+    ctx.stroke();
   } else if (!symbolDrawn && component.type === "switch") {
     const left = -COMPONENT_W / 2;
     const right = COMPONENT_W / 2;
@@ -2169,10 +2339,9 @@ function lightenColor(hex, amount) {
   return `rgb(${toChannel(rgb.r)}, ${toChannel(rgb.g)}, ${toChannel(rgb.b)})`;
 }
 
-function getComplexDiffMagnitude(a, b) {
-  if (!a || !b) return 0;
-  const re = (a.re || 0) - (b.re || 0);
-  const im = (a.im || 0) - (b.im || 0);
+function getComplexDiffMagnitude(ac, nodeA, nodeB) {
+  const re = (ac.re[nodeA] || 0) - (ac.re[nodeB] || 0);
+  const im = (ac.im[nodeA] || 0) - (ac.im[nodeB] || 0);
   return Math.hypot(re, im);
 }
 
@@ -2186,16 +2355,16 @@ function isWireEnergized(wire) {
   if (nodeA === undefined || nodeB === undefined) return false;
   let dv = 0;
   const dc = state.lastSolution.nodeVoltages;
-  if (Array.isArray(dc) && dc[nodeA] !== undefined && dc[nodeB] !== undefined) {
+  if (dc && dc[nodeA] !== undefined && dc[nodeB] !== undefined) {
     const vA = Math.abs(dc[nodeA]);
     const vB = Math.abs(dc[nodeB]);
     dv = Math.max(dv, vA, vB, Math.abs(dc[nodeA] - dc[nodeB]));
   }
   const ac = state.lastSolution.acNodeVoltages;
-  if (Array.isArray(ac) && ac[nodeA] !== undefined && ac[nodeB] !== undefined) {
-    const vA = Math.hypot(ac[nodeA].re || 0, ac[nodeA].im || 0);
-    const vB = Math.hypot(ac[nodeB].re || 0, ac[nodeB].im || 0);
-    dv = Math.max(dv, vA, vB, getComplexDiffMagnitude(ac[nodeA], ac[nodeB]));
+  if (ac && ac.re && ac.re[nodeA] !== undefined && ac.re[nodeB] !== undefined) {
+    const vA = Math.hypot(ac.re[nodeA], ac.im[nodeA]);
+    const vB = Math.hypot(ac.re[nodeB], ac.im[nodeB]);
+    dv = Math.max(dv, vA, vB, getComplexDiffMagnitude(ac, nodeA, nodeB));
   }
   return dv > WIRE_LIVE_THRESHOLD;
 }
@@ -2456,6 +2625,30 @@ function updatePropsPanel() {
         <input type="number" step="any" name="ratedVoltage" value="${comp.props.ratedVoltage}" />
       </label>`;
   }
+  if ("coldResistance" in comp.props) {
+    html += `
+      <label>${t("props.cold_resistance", "Cold resistance (Ω)")}
+        <input type="number" step="any" name="coldResistance" value="${comp.props.coldResistance}" />
+      </label>`;
+  }
+  if ("forwardVoltage" in comp.props) {
+    html += `
+      <label>${t("props.forward_voltage", "Forward voltage (V)")}
+        <input type="number" step="any" name="forwardVoltage" value="${comp.props.forwardVoltage}" />
+      </label>`;
+  }
+  if ("clampVoltage" in comp.props) {
+    html += `
+      <label>${t("props.clamp_voltage", "Clamp voltage (V)")}
+        <input type="number" step="any" name="clampVoltage" value="${comp.props.clampVoltage}" />
+      </label>`;
+  }
+  if ("alpha" in comp.props) {
+    html += `
+      <label>${t("props.alpha", "Nonlinearity (α)")}
+        <input type="number" step="any" name="alpha" value="${comp.props.alpha}" />
+      </label>`;
+  }
   if (comp.type === "lamp") {
     html += `
       <label>${t("props.light_color", "Light color")}
@@ -2616,6 +2809,10 @@ function updatePropsPanel() {
       if (key === "threshold") comp.props.threshold = Number(event.target.value);
       if (key === "ratedVoltage") comp.props.ratedVoltage = Number(event.target.value);
       if (key === "litColor") comp.props.litColor = event.target.value;
+      if (key === "coldResistance") comp.props.coldResistance = Number(event.target.value);
+      if (key === "forwardVoltage") comp.props.forwardVoltage = Number(event.target.value);
+      if (key === "clampVoltage") comp.props.clampVoltage = Number(event.target.value);
+      if (key === "alpha") comp.props.alpha = Number(event.target.value);
       if (key === "startVoltage") comp.props.startVoltage = Number(event.target.value);
       if (key === "motor3phConnection") comp.props.connection = event.target.value;
       if (key === "coilResistance") comp.props.coilResistance = Number(event.target.value);
@@ -3157,6 +3354,17 @@ saveBtn.addEventListener("click", async () => {
   }
 });
 
+if (saveSearch) {
+  saveSearch.addEventListener("input", () => {
+    clearTimeout(saveSearchTimer);
+    saveSearchTimer = setTimeout(() => renderSaveList(), SAVE_SEARCH_DELAY_MS);
+  });
+}
+
+if (saveMore) {
+  saveMore.addEventListener("click", () => renderSaveList(true));
+}
+
 if (saveNameInput) {
   saveNameInput.addEventListener("keydown", async (event) => {
     if (event.key === "Enter") {